@@ -0,0 +1,327 @@
+# Benchmarks of Grid.run across network size, horizon length, control mode and
+# heat exchanger interpolation, with stored baselines and a regression report.
+# To avoid import errors, run it one folder above the root folder (grid-penguin):
+# python -m grid-penguin.benchmarks.grid_benchmarks --compare
+# python -m grid-penguin.benchmarks.grid_benchmarks --long --save-baseline
+# python -m grid-penguin.benchmarks.grid_benchmarks --backend numpy --compare
+"""
+Benchmarks of Grid.run, compared with stored baselines to report regressions
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np  # type: ignore
+
+from ..cases import one_consumer, parallel_consumers, synthetic_network
+from ..models.grid_object import GridObject
+from util import config
+
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# (case, number of consumers)
+networks = [
+    ("one_consumer", 1),
+    ("parallel_consumers", 3),
+    ("synthetic_network", 10),
+    ("synthetic_network", 100),
+    ("synthetic_network", 1000),
+]
+horizons = [24, 96, 672]
+long_horizons = [35040]  # a year in 15 min blocks, only run with --long
+# the largest networks are only run on the shorter horizons
+max_consumer_steps = 1000 * 24
+min_time = 1.0  # in sec
+max_runs = 20
+
+
+def benchmarks(long: bool = False, backend: str = "python") -> List[Dict]:
+    """
+    All benchmark settings. Interpolation tables and heat control are only varied on the
+    small networks, where their share of the run time is largest.
+    """
+    settings = []
+    for case, consumers in networks:
+        for horizon in horizons + (long_horizons if long else []):
+            if consumers * horizon > max_consumer_steps and consumers > 1:
+                continue
+            for control_with_temp in [True, False]:
+                for interpolation in [False, True]:
+                    if consumers > 10 and (interpolation or not control_with_temp):
+                        continue
+                    settings.append(
+                        {
+                            "case": case,
+                            "consumers": consumers,
+                            "horizon": horizon,
+                            "control_with_temp": control_with_temp,
+                            "interpolation": interpolation,
+                            "backend": backend,
+                        }
+                    )
+
+    return settings
+
+
+def benchmark_name(setting: Dict) -> str:
+    return "{}-{}c-{}steps-{}{}".format(
+        setting["case"],
+        setting["consumers"],
+        setting["horizon"],
+        "temp" if setting["control_with_temp"] else "heat",
+        "-interpolation" if setting["interpolation"] else "",
+    ) + ("" if setting.get("backend", "python") == "python" else "-" + setting["backend"])
+
+
+def _demands(case: str, consumers: int, horizon: int) -> List[np.ndarray]:
+    if case == "synthetic_network":
+        return synthetic_network.synthetic_demands(consumers, horizon, config, seed=0)
+
+    demand = np.ones(horizon) * 30
+    if consumers == 1:
+        return [demand]
+
+    return [demand / (3 + 0.1 * i) for i in range(consumers)]
+
+
+def _build(setting: Dict):
+    """
+    Builds and resets the grid of a benchmark. Returns the grid and the controls of run().
+    """
+    horizon = setting["horizon"]
+    demands = _demands(setting["case"], setting["consumers"], horizon)
+    e_price = [np.ones(horizon) * 25]
+
+    # the presets are shared, so the control mode is set on a copy of the config
+    bench_config = SimpleNamespace(**vars(config))
+    bench_config.ProducerPreset1 = dict(
+        config.ProducerPreset1, ControlWithTemp=setting["control_with_temp"]
+    )
+
+    builder = {
+        "one_consumer": one_consumer,
+        "parallel_consumers": parallel_consumers,
+        "synthetic_network": synthetic_network,
+    }[setting["case"]]
+    grid = builder.build_grid(demands, e_price, bench_config)
+    grid.set_backend(setting.get("backend", "python"))
+    grid.reset(demands)
+
+    if setting["control_with_temp"]:
+        controls = {"temp": [np.ones(horizon) * 90]}
+    else:
+        # the demand plus an estimate of the heat loss of the pipes
+        controls = {"heat": [np.sum(demands, axis=0) * 1.05]}
+    controls["electricity"] = [np.ones(horizon) * 20]
+
+    return grid, controls
+
+
+class _TableRecorder:
+    """
+    Stands in for the interpolation table of a heat exchanger and records all cells that
+    are looked up, while reporting them as missing.
+    """
+
+    def __init__(self) -> None:
+        self.cells = set()
+
+    def __contains__(self, t_supply_p) -> bool:
+        return True
+
+    def __getitem__(self, t_supply_p):
+        recorder = self
+
+        class Row:
+            def __contains__(self, mass_flow_s) -> bool:
+                recorder.cells.add((t_supply_p, mass_flow_s))
+                return False
+
+        return Row()
+
+
+def _interpolation_tables(setting: Dict) -> List[dict]:
+    """
+    Runs the benchmark once without tables, and computes a table for each consumer that
+    covers every cell that was looked up, as a precomputed table of the operating range would.
+    """
+    grid, controls = _build(setting)
+    recorders = [_TableRecorder() for _ in grid.consumers]
+    for consumer, recorder in zip(grid.consumers, recorders):
+        consumer.heat_exchanger.interpolation = recorder
+    grid.run(**controls)
+
+    step = 0.015625  # resolution of the tables, see HeatExchanger.solve
+    tables = []
+    for consumer, recorder in zip(grid.consumers, recorders):
+        heat_exchanger = consumer.heat_exchanger
+        table: Dict[float, Dict[float, float]] = {}
+        for t_cell, mass_cell in recorder.cells:
+            for t in (t_cell, t_cell + step):
+                for mass_flow_s in (mass_cell, mass_cell + step):
+                    if mass_flow_s in table.get(t, {}):
+                        continue
+                    t_supply_s = min(consumer.setpoint_t_supply_s, t - 0.1)
+                    q = (
+                        mass_flow_s
+                        * heat_exchanger.heat_capacity
+                        * (t_supply_s - consumer.t_return_s)
+                    )
+                    table.setdefault(t, {})[mass_flow_s] = heat_exchanger._thermal_regime(
+                        t_in_1=t,
+                        t_in_2=consumer.t_return_s,
+                        t_out_2=t_supply_s,
+                        q=q,
+                        k=heat_exchanger.get_k(),
+                    )
+        tables.append(table)
+
+    return tables
+
+
+def run_benchmark(setting: Dict, repeat: int = 3, memory: bool = True) -> Dict[str, float]:
+    """
+    Steps per second and wall time of Grid.run are the best of at least repeat runs, each on
+    a newly built grid. Peak memory is measured with tracemalloc in a separate run of building,
+    resetting and running the grid, as tracing slows the run down.
+    """
+    tables = _interpolation_tables(setting) if setting["interpolation"] else None
+
+    def prepare():
+        GridObject.reset_step()
+        grid, controls = _build(setting)
+        if tables is not None:
+            for consumer, table in zip(grid.consumers, tables):
+                consumer.heat_exchanger.add_interpolation_values(table)
+        return grid, controls
+
+    # short runs are repeated until min_time is spent, to lower their noise
+    wall, spent, runs = math.inf, 0.0, 0
+    while runs < repeat or (spent < min_time and runs < max_runs):
+        grid, controls = prepare()
+        start = time.perf_counter()
+        grid.run(**controls)
+        wall = min(wall, time.perf_counter() - start)
+        spent += time.perf_counter() - start
+        runs += 1
+
+    result = {
+        "wall_sec": wall,
+        "steps_per_sec": setting["horizon"] / wall,
+    }
+
+    if memory:
+        tracemalloc.start()
+        grid, controls = prepare()
+        grid.run(**controls)
+        result["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    return result
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baselines: Dict[str, Dict[str, float]],
+    threshold: float = 0.25,
+) -> List[str]:
+    """
+    Prints the results next to the baselines. A benchmark regresses if its steps per second
+    drop, or its peak memory grows, by more than threshold. Returns the regressed benchmarks.
+    """
+    regressions = []
+    print(
+        "{:<60} {:>12} {:>12} {:>8} {:>10} {:>10}".format(
+            "Benchmark", "Steps/sec", "Baseline", "Ratio", "Peak MB", "Baseline"
+        )
+    )
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print("{:<60} {:>12.1f} {:>12}".format(name, result["steps_per_sec"], "-"))
+            continue
+
+        ratio = result["steps_per_sec"] / baseline["steps_per_sec"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "SLOWER"
+        if (
+            "peak_memory_mb" in result
+            and "peak_memory_mb" in baseline
+            and result["peak_memory_mb"] > baseline["peak_memory_mb"] * (1 + threshold)
+        ):
+            flag += " MEMORY"
+        if flag:
+            regressions.append(name)
+
+        print(
+            "{:<60} {:>12.1f} {:>12.1f} {:>8.2f} {:>10.1f} {:>10.1f} {}".format(
+                name,
+                result["steps_per_sec"],
+                baseline["steps_per_sec"],
+                ratio,
+                result.get("peak_memory_mb", math.nan),
+                baseline.get("peak_memory_mb", math.nan),
+                flag,
+            )
+        )
+
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--long", action="store_true", help="include 35040 step horizons")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default="python", help="python, numpy or numba")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory runs")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="report against the baselines")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--baseline-file", default=baseline_file)
+    options = parser.parse_args(args)
+
+    results = {}
+    for setting in benchmarks(options.long, options.backend):
+        name = benchmark_name(setting)
+        if options.filter not in name:
+            continue
+        # long horizons are only run once
+        repeat = options.repeat if setting["horizon"] <= 672 else 1
+        results[name] = run_benchmark(setting, repeat, not options.no_memory)
+        print(
+            "{}: {:.1f} steps/sec, {:.2f} sec".format(
+                name, results[name]["steps_per_sec"], results[name]["wall_sec"]
+            ),
+            flush=True,
+        )
+
+    if options.save_baseline:
+        baselines = {}
+        if os.path.exists(options.baseline_file):
+            with open(options.baseline_file) as f:
+                baselines = json.load(f)
+        baselines.update(results)
+        with open(options.baseline_file, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.baseline_file) as f:
+            baselines = json.load(f)
+        regressions = compare(results, baselines, options.threshold)
+        if regressions:
+            print("{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+# Benchmark of the time to import the models in a fresh interpreter, as paid by every
+# process pool worker and short command line run, and check that the optional heavy
+# dependencies are only imported on first use.
+# To avoid import errors, run it one folder above the root folder (grid-penguin):
+# python -m grid-penguin.benchmarks.import_time
+"""
+Time to import the models in a fresh interpreter, and the lazy dependencies imported anyway
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np  # type: ignore
+
+# imported by the models on first use only (debug tables, Newton method of the heat
+# exchangers, hydraulic network, linearization, vectorized environments, file formats,
+# compiled kernels)
+lazy_modules = [
+    "beautifultable",
+    "scipy",
+    "cvxpy",
+    "multiprocessing",
+    "yaml",
+    "h5py",
+    "numba",
+]
+max_import_ms = 150  # numpy alone takes about 50 ms
+runs = 10
+
+_probe = """
+import importlib, sys, time, json
+start = time.perf_counter()
+importlib.import_module({package!r} + ".models")
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {lazy} if m in sys.modules]}}))
+"""
+
+
+def measure_import(runs: int = runs) -> Dict:
+    """
+    Imports the models in runs fresh interpreters. Returns the median and the minimum of the
+    import time in ms and the lazy modules that were imported anyway.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    package = __package__.split(".")[0] if __package__ else os.path.basename(root)
+    env = dict(os.environ)
+    # util is imported absolutely from the root folder
+    env["PYTHONPATH"] = os.pathsep.join([root] + env.get("PYTHONPATH", "").split(os.pathsep))
+
+    times, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _probe.format(package=package, lazy=lazy_modules)],
+            cwd=os.path.dirname(root),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["ms"])
+        loaded.update(result["loaded"])
+
+    return {
+        "median_ms": float(np.median(times)),
+        "min_ms": float(np.min(times)),
+        "loaded": sorted(loaded),
+    }
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=runs)
+    parser.add_argument("--max-ms", type=float, default=max_import_ms)
+    options = parser.parse_args(args)
+
+    result = measure_import(options.runs)
+    print(
+        "import models: {:.1f} ms median, {:.1f} ms min".format(
+            result["median_ms"], result["min_ms"]
+        )
+    )
+
+    failed = False
+    if result["loaded"]:
+        print("imported eagerly: {}".format(", ".join(result["loaded"])))
+        failed = True
+    if result["median_ms"] > options.max_ms:
+        print("slower than {:.0f} ms".format(options.max_ms))
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
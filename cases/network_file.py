@@ -0,0 +1,241 @@
+# grid described by a JSON or YAML file of nodes, edges and presets, instead of code.
+# Built grids are cached by the hash of the file and their inputs, see build_grid.
+#
+# nodes:            # in the order they are added to the grid
+#   - {name: chp, type: CHP, preset: ProducerPreset1}    # or type: CHPFleet, preset: FleetPreset1
+#   - {name: split, type: Branch, slots: 2}     # slots: number of out slots
+#   - {name: join, type: Junction, slots: 2}    # slots: number of in slots
+#   - {name: house1, type: Consumer, preset: ConsumerPreset1, params: {SurfaceArea: 200}}
+# edges:            # from (node, slot) to (node, slot), in the direction of the flow
+#   - {from: [chp, 1], to: [split, 0], preset: PipePreset1}
+#   - {from: [split, 1], to: [house1, 0], preset: PipePreset3, params: {Length: 250}}
+# presets:          # optional, presets not defined here are taken from the config
+#   MyPipe: {Diameter: 0.3, ...}
+# physical_properties: {...}   # optional, overrides config.PhysicalProperties
+# interval_length: 3600        # optional, in sec, config.TimeParameters by default
+#
+# Consumers take the demands in the order they appear in nodes. The keys of presets and
+# params are the ones of util.config. The Parameters of a CHP preset, and the Generators of a
+# CHPFleet preset, may name presets too.
+
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, Optional
+import numpy as np  # type: ignore
+
+from ..models import Grid, Producer, Consumer, Edge, CHP, CHPFleet
+from ..models import Branch, Junction
+from ..models.grid_object import GridObject
+
+# part of the cache key, to be increased when the built objects change
+cache_version = 4
+
+
+def load_description(network_file: str) -> dict:
+    with open(network_file) as f:
+        if network_file.endswith((".yaml", ".yml")):
+            try:
+                import yaml  # type: ignore
+            except ImportError:
+                raise Exception("Reading YAML network files needs PyYAML to be installed")
+            return yaml.safe_load(f)
+
+        return json.load(f)
+
+
+def _preset(description: dict, config, name: str) -> dict:
+    if name in description.get("presets", {}):
+        return description["presets"][name]
+    if not hasattr(config, name):
+        raise Exception("Preset {} is neither in the network file nor in the config".format(name))
+
+    return getattr(config, name)
+
+
+def _params(description: dict, config, item: dict) -> dict:
+    """
+    The preset of a node or edge, overridden by its own params
+    """
+    params = {}
+    if "preset" in item:
+        params.update(_preset(description, config, item["preset"]))
+    params.update(item.get("params", {}))
+
+    return params
+
+
+def _cache_key(network_file: str, consumer_demands, config) -> str:
+    """
+    Hash of everything the built grid depends on: the file, the config (presets, physical
+    properties and the interval) and the demands, which determine the minimal supply
+    temperatures of the consumers.
+    """
+    key = hashlib.sha256()
+    key.update(str(cache_version).encode())
+    with open(network_file, "rb") as f:
+        key.update(f.read())
+
+    settings = {
+        name: value
+        for name, value in vars(config).items()
+        if not name.startswith("_") and isinstance(value, (dict, list, int, float, str))
+    }
+    key.update(json.dumps(settings, sort_keys=True, default=str).encode())
+
+    for demand in consumer_demands:
+        key.update(np.ascontiguousarray(demand, dtype=float).tobytes())
+        key.update(b"|")
+
+    return key.hexdigest()
+
+
+def compile_grid(description: dict, consumer_demands, config) -> Grid:
+    """
+    Builds and links the grid of a network description
+    """
+    physical_properties = dict(config.PhysicalProperties)
+    physical_properties.update(description.get("physical_properties", {}))
+    interval_length = description.get(
+        "interval_length", config.TimeParameters["TimeInterval"]
+    )
+    blocks = consumer_demands[0].shape[0]
+
+    grid = Grid(interval_length=interval_length)
+
+    nodes: Dict[str, object] = {}
+    demands = iter(consumer_demands)
+    for item in description["nodes"]:
+        name, node_type = item["name"], item["type"]
+        if name in nodes:
+            raise Exception("Node {} is described twice".format(name))
+        params = _params(description, config, item)
+
+        if node_type in ("CHP", "CHPFleet", "Producer"):
+            producer_args = dict(
+                blocks=blocks,
+                heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+                temp_upper_bound=physical_properties["MaxTemp"],
+                pump_efficiency=params["PumpEfficiency"],
+                density=physical_properties["Density"],
+                control_with_temp=params["ControlWithTemp"],
+                energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+            )
+            if node_type == "CHP":
+                chp_params = params["Parameters"]
+                if isinstance(chp_params, str):
+                    chp_params = _preset(description, config, chp_params)
+                node = CHP(CHPPreset=chp_params, **producer_args)
+            elif node_type == "CHPFleet":
+                generators = [
+                    _preset(description, config, generator) if isinstance(generator, str)
+                    else generator
+                    for generator in params["Generators"]
+                ]
+                fleet_params = dict(params, Generators=generators)
+                node = CHPFleet(FleetPreset=fleet_params, **producer_args)
+            else:
+                node = Producer(**producer_args)
+        elif node_type == "Consumer":
+            demand = next(demands, None)
+            if demand is None:
+                raise Exception("There are fewer demands than consumers")
+            node = Consumer(
+                demand=demand.copy(),
+                heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+                max_mass_flow_p=params["MaxMassFlowPrimary"],
+                surface_area=params["SurfaceArea"],  # in m^2
+                heat_transfer_q=params["q"],  # See Palsson 1999 p45
+                heat_transfer_k=params["k"],  # See Palsson 1999 p51
+                min_supply_temp=params["MinTempSupplyPrimary"],
+                pressure_load=params["FixPressureLoad"],
+                setpoint_t_supply_s=params["SetPointTempSupplySecondary"],
+                t_return_s=params["TempReturnSeconary"],
+                energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+            )
+        elif node_type == "Branch":
+            node = Branch(blocks, out_slots_number=item["slots"])
+        elif node_type == "Junction":
+            node = Junction(blocks, in_slots_number=item["slots"])
+        else:
+            raise Exception("Unknown node type {} of node {}".format(node_type, name))
+
+        grid.add_node(node)
+        nodes[name] = node
+
+    for item in description["edges"]:
+        params = _params(description, config, item)
+        edge = Edge(
+            blocks=blocks,
+            diameter=params["Diameter"],  # in meters
+            length=params["Length"],  # in meters
+            thermal_resistance=params["ThermalResistance"],  # in k*m/W
+            historical_t_in=params["InitialTemperature"],  # in ºC
+            heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+            density=physical_properties["Density"],  # in kg/m^3
+            t_ground=params["EnvironmentTemperature"],  # °C
+            max_flow_speed=params["MaxFlowSpeed"],  # m/s
+            min_flow_speed=params["MinFlowSpeed"],
+            friction_coefficient=params["FrictionCoefficient"],  # (kg*m)^-1
+            energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+        )
+        grid.add_edge(edge)
+
+        ends = []
+        for name, slot in (item["from"], item["to"]):
+            if name not in nodes:
+                raise Exception("Edge from {} to {}: unknown node {}".format(
+                    item["from"], item["to"], name
+                ))
+            ends.append((nodes[name], slot))
+        edge.link(nodes=tuple(ends))
+
+    grid.link_nodes(False)
+
+    return grid
+
+
+def build_grid(
+    network_file: str,
+    consumer_demands,
+    electricity_prices,
+    config,
+    cache: bool = True,
+    cache_dir: Optional[str] = None,  # __gridcache__ next to the network file by default
+):
+    """
+    Building the grid object described by network_file (.json, .yaml or .yml).
+    As in the other cases, electricity prices are set by Grid.reset.
+
+    If cache is true, the built grid is pickled into cache_dir, keyed by the hash of the file,
+    the config and the demands, so that building the same grid again only loads it.
+    Objects of a loaded grid keep the ids of the build that was cached.
+    """
+    if not cache:
+        return compile_grid(load_description(network_file), consumer_demands, config)
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(network_file)), "__gridcache__")
+    cache_file = os.path.join(
+        cache_dir, _cache_key(network_file, consumer_demands, config) + ".pickle"
+    )
+
+    if os.path.exists(cache_file):
+        with open(cache_file, "rb") as f:
+            grid = pickle.load(f)
+        # objects created later must not reuse the ids of the loaded ones
+        ids = [obj.id for obj in grid.nodes + grid.edges]
+        GridObject._object_counter = max([GridObject._object_counter] + [i + 1 for i in ids])
+        return grid
+
+    # the file is only parsed when the grid is not cached
+    grid = compile_grid(load_description(network_file), consumer_demands, config)
+    os.makedirs(cache_dir, exist_ok=True)
+    # written to a temporary file first, so that concurrent builds never read half a file
+    temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    with open(temp_file, "wb") as f:
+        pickle.dump(grid, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+
+    return grid
@@ -1,4 +1,4 @@
-from ..models import Grid, Producer, Consumer, Edge, CHP
+from ..models import Grid, Producer, Consumer, Edge, CHP, CHPFleet
 
 
 def build_grid(
@@ -20,8 +20,13 @@ def build_grid(
         interval_length=time_params["TimeInterval"],  # 60 min
     )
     
-    producer = CHP(
-        CHPPreset=producer_params["Generators"][0],
+    # a fleet preset dispatches several generators as one producer
+    if producer_params["Type"] == "CHPFleet":
+        producer_type, producer_preset = CHPFleet, producer_params
+    else:
+        producer_type, producer_preset = CHP, producer_params["Parameters"]
+    producer = producer_type(
+        producer_preset,
         blocks=blocks,  # time steps (24 hours -> 24 blocks)
         heat_capacity=physical_properties[
             "HeatCapacity"
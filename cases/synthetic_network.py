@@ -0,0 +1,276 @@
+# grid for one producer and a large tree of consumers, generated from a seed,
+# to measure how the simulation scales with the size of the network
+from typing import List, Tuple
+import numpy as np  # type: ignore
+
+from ..models import Grid, Consumer, Edge, CHP, CHPFleet
+from ..models import Branch, Junction
+
+min_diameter = 0.025  # in meters, the smallest house connection
+
+
+def build_tree(
+    consumer_numbers: int,
+    topology: str = "random",  # "random" or "fractal"
+    fan_out: int = 4,
+    seed: int = 0,
+) -> Tuple[List[int], List[int]]:
+    """
+    Builds the tree of the supply network, with the consumers as leaves.
+    Every internal node splits its consumers into up to fan_out parts, equally for a
+    fractal tree, at random for a random tree.
+    Returns the parent of each internal node (-1 for the root, which is connected to the
+    producer) and the parent of each consumer. Parents always come before their children.
+    """
+    assert topology in ("random", "fractal")
+    assert fan_out >= 2
+    rng = np.random.default_rng(seed)
+
+    node_parents: List[int] = []
+    consumer_parents: List[int] = [-1] * consumer_numbers
+
+    stack = [(-1, np.arange(consumer_numbers))]
+    while len(stack) > 0:
+        parent, consumers = stack.pop(0)
+        node = len(node_parents)
+        node_parents.append(parent)
+
+        if topology == "fractal":
+            parts = np.array_split(consumers, min(fan_out, len(consumers)))
+        else:
+            part_number = min(rng.integers(2, fan_out + 1), len(consumers))
+            cuts = np.sort(
+                rng.choice(np.arange(1, len(consumers)), part_number - 1, replace=False)
+            )
+            parts = np.split(consumers, cuts)
+
+        for part in parts:
+            if len(part) == 1:
+                consumer_parents[part[0]] = node
+            else:
+                stack.append((node, part))
+
+    return node_parents, consumer_parents
+
+
+def synthetic_demands(
+    consumer_numbers: int,
+    blocks: int,
+    config,
+    total_demand: float = 30,  # in MW, mean of the sum of all consumers
+    seed: int = 0,
+) -> List[np.ndarray]:
+    """
+    Daily profiles with a morning and an evening peak. Every consumer gets a random size,
+    a random shift of its peaks of up to one hour and some noise.
+    """
+    rng = np.random.default_rng(seed)
+    interval_length = config.TimeParameters["TimeInterval"]
+    hours = np.arange(blocks) * interval_length / 3600
+
+    sizes = rng.lognormal(0, 0.5, consumer_numbers)
+    sizes *= total_demand / np.sum(sizes)
+    shifts = rng.uniform(-1, 1, consumer_numbers)
+
+    demands = []
+    for size, shift in zip(sizes, shifts):
+        hour = hours - shift
+        profile = (
+            1
+            + 0.2 * np.cos(2 * np.pi * (hour - 8) / 24)
+            + 0.1 * np.cos(4 * np.pi * (hour - 7) / 24)
+        )
+        noise = rng.normal(1, 0.05, blocks)
+        demands.append(np.maximum(size * profile * noise, 0))
+
+    return demands
+
+
+def build_grid(
+    consumer_demands,
+    electricity_prices,
+    config,
+    topology: str = "random",  # "random" or "fractal"
+    fan_out: int = 4,
+    seed: int = 0,
+):
+    """
+    Building the grid object with a tree of consumers, see build_tree.
+    Pipes are derived from the presets: the pipe to the root has the size of PipePreset1,
+    each level down is shorter by the length ratio of PipePreset3 to PipePreset1, and the
+    diameter follows the peak demand downstream (for the same flow speed).
+    Friction follows Darcy-Weisbach, with the friction factor of PipePreset1.
+    Thermal resistance is interpolated between PipePreset3 and PipePreset1 by diameter, and
+    grows inversely with the diameter below PipePreset3.
+    Lengths of a random tree are spread by a lognormal factor.
+    """
+    consumer_numbers = len(consumer_demands)
+    producer_params = config.ProducerPreset1
+    consumer_params = config.ConsumerPreset1
+    main_pipe_params = config.PipePreset1
+    side_pipe_params = config.PipePreset3
+    sup_temp = config.PipePreset1["InitialTemperature"]
+    ret_temp = config.PipePreset2["InitialTemperature"]
+    physical_properties = config.PhysicalProperties
+    time_params = config.TimeParameters
+    density = physical_properties["Density"]
+
+    blocks = consumer_demands[0].shape[0]
+    rng = np.random.default_rng(seed)
+    node_parents, consumer_parents = build_tree(consumer_numbers, topology, fan_out, seed)
+
+    grid = Grid(  # empty grid
+        interval_length=time_params["TimeInterval"],  # 60 min
+    )
+
+    # a fleet preset dispatches several generators as one producer
+    if producer_params["Type"] == "CHPFleet":
+        producer_type, producer_preset = CHPFleet, producer_params
+    else:
+        producer_type, producer_preset = CHP, producer_params["Parameters"]
+    producer = producer_type(
+        producer_preset,
+        blocks=blocks,
+        heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+        temp_upper_bound=physical_properties["MaxTemp"],
+        pump_efficiency=producer_params["PumpEfficiency"],
+        density=density,
+        control_with_temp=producer_params["ControlWithTemp"],
+        energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+    )
+    grid.add_node(producer)
+
+    # share of each consumer in the sum of the peak demands
+    peak_shares = np.array([np.max(demand) for demand in consumer_demands])
+    peak_shares /= np.sum(peak_shares)
+
+    # children, levels and share of the peak demands downstream of each internal node
+    children: List[List[Tuple[str, int]]] = [[] for _ in node_parents]
+    levels = np.zeros(len(node_parents), dtype=int)
+    downstream = np.zeros(len(node_parents))
+    for node, parent in enumerate(node_parents):
+        if parent >= 0:
+            children[parent].append(("node", node))
+            levels[node] = levels[parent] + 1
+    for consumer, parent in enumerate(consumer_parents):
+        children[parent].append(("consumer", consumer))
+    for consumer, parent in enumerate(consumer_parents):
+        node = parent
+        while node >= 0:
+            downstream[node] += peak_shares[consumer]
+            node = node_parents[node]
+
+    branches, junctions = [], []
+    for node_children in children:
+        branches.append(Branch(blocks, out_slots_number=len(node_children)))
+        grid.add_node(branches[-1])
+        junctions.append(Junction(blocks, in_slots_number=len(node_children)))
+        grid.add_node(junctions[-1])
+
+    """
+    ConsumerPreset1 is sized for the demand of the whole grid. The heat exchanger of each
+    consumer is scaled down by its share s of the peak demand: the maximal mass flow by s,
+    the surface area by s^(1 - q), which scales the heat transfer UA by s at the same
+    temperatures.
+    """
+    peak_demand = np.max(np.sum(consumer_demands, axis=0))
+    consumers = []
+    for demand in consumer_demands:
+        share = np.max(demand) / peak_demand
+        consumer = Consumer(
+            demand=demand.copy(),
+            heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+            max_mass_flow_p=consumer_params["MaxMassFlowPrimary"] * share,
+            surface_area=consumer_params["SurfaceArea"]
+            * share ** (1 - consumer_params["q"]),  # in m^2
+            heat_transfer_q=consumer_params["q"],  # See Palsson 1999 p45
+            heat_transfer_k=consumer_params["k"],  # See Palsson 1999 p51
+            min_supply_temp=consumer_params["MinTempSupplyPrimary"],
+            pressure_load=consumer_params["FixPressureLoad"],
+            setpoint_t_supply_s=consumer_params["SetPointTempSupplySecondary"],
+            t_return_s=consumer_params["TempReturnSeconary"],
+            energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+        )
+        grid.add_node(consumer)
+        consumers.append(consumer)
+
+    main_diameter = main_pipe_params["Diameter"]
+    main_length = main_pipe_params["Length"]
+    length_ratio = side_pipe_params["Length"] / main_length
+    main_surface = Edge.diameter_to_surface(main_diameter)
+    darcy_friction = (
+        main_pipe_params["FrictionCoefficient"]
+        * 2
+        * density
+        * main_surface ** 2
+        * main_diameter
+        / main_length
+    )
+
+    def add_pipe_pair(level, demand_share, supply_nodes, return_nodes):
+        diameter = np.clip(main_diameter * np.sqrt(demand_share), min_diameter, main_diameter)
+        length = main_length * length_ratio ** level
+        if topology == "random":
+            length *= rng.lognormal(0, 0.3)
+        surface = Edge.diameter_to_surface(diameter)
+        side_diameter = side_pipe_params["Diameter"]
+        if diameter < side_diameter:
+            # the heat loss per meter shrinks with the surface of the pipe
+            thermal_resistance = side_pipe_params["ThermalResistance"] * side_diameter / diameter
+        else:
+            thermal_resistance = np.interp(
+                np.log(diameter),
+                [np.log(side_diameter), np.log(main_diameter)],
+                [side_pipe_params["ThermalResistance"], main_pipe_params["ThermalResistance"]],
+            )
+
+        for temp, nodes in [(sup_temp, supply_nodes), (ret_temp, return_nodes)]:
+            edge = Edge(
+                blocks=blocks,
+                diameter=diameter,  # in meters
+                length=length,  # in meters
+                thermal_resistance=thermal_resistance,  # in k*m/W
+                historical_t_in=temp,  # in ºC
+                heat_capacity=physical_properties["HeatCapacity"],  # in J/kg/K
+                density=density,  # in kg/m^3
+                t_ground=main_pipe_params["EnvironmentTemperature"],  # °C
+                max_flow_speed=main_pipe_params["MaxFlowSpeed"],  # m/s
+                min_flow_speed=main_pipe_params["MinFlowSpeed"],
+                friction_coefficient=darcy_friction
+                * length
+                / (2 * density * surface ** 2 * diameter),  # (kg*m)^-1
+                energy_unit_conversion=physical_properties["EnergyUnitConversion"],
+            )
+            grid.add_edge(edge)
+            edge.link(nodes=nodes)
+
+    """
+    The root of the tree is connected to the producer, every other node and every consumer
+    to the next free out slot of the branch (in slot of the junction) of its parent.
+    """
+    add_pipe_pair(
+        0,
+        1,
+        ((producer, 1), (branches[0], 0)),
+        ((junctions[0], 0), (producer, 0)),
+    )
+    for parent, node_children in enumerate(children):
+        for slot, (kind, child) in enumerate(node_children, start=1):
+            if kind == "node":
+                add_pipe_pair(
+                    levels[parent] + 1,
+                    downstream[child],
+                    ((branches[parent], slot), (branches[child], 0)),
+                    ((junctions[child], 0), (junctions[parent], slot)),
+                )
+            else:
+                add_pipe_pair(
+                    levels[parent] + 1,
+                    peak_shares[child],
+                    ((branches[parent], slot), (consumers[child], 0)),
+                    ((consumers[child], 1), (junctions[parent], slot)),
+                )
+
+    grid.link_nodes(False)
+
+    return grid
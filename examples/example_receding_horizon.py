@@ -0,0 +1,63 @@
+# An example of a receding horizon loop: in every hour, the planning grid is used to choose
+# the lowest producer temperature that still satisfies the consumer for the next 24 hours.
+# to avoid import error, the script has to be run one folder above the root folder (grid-penguin)
+# python -m grid-penguin.examples.example_receding_horizon
+
+import numpy as np
+
+from ..cases.one_consumer import build_grid
+from ..models import RecedingHorizon
+from util import config
+
+if __name__ == "__main__":
+    days = 2
+    planning_horizon = config.TimeParameters["PlanningHorizon"]
+    action_horizon = config.TimeParameters["ActionHorizon"]
+
+    heat_demand = 30 + 5 * np.sin(np.arange(days * 24) / 24 * 2 * np.pi)
+    electricity_price = np.ones(days * 24) * 25
+
+    # the real grid covers the whole simulation, the planning grid only one planning horizon
+    grid = build_grid([heat_demand], [electricity_price], config)
+    grid.reset([heat_demand], [electricity_price])
+    planning_grid = build_grid(
+        [heat_demand[:planning_horizon]],
+        [electricity_price[:planning_horizon]],
+        config,
+    )
+
+    candidate_temps = [80, 85, 90, 95, 100]
+
+    def policy(planning_grid, step):
+        for temp in candidate_temps:
+            # the planning grid has to be reloaded for every candidate
+            planning_grid.load_window(grid, step)
+            planning_grid.run(
+                temp=[np.ones(planning_horizon) * temp],
+                electricity=[np.zeros(planning_horizon)],
+            )
+            violation = np.nansum(
+                [
+                    np.nansum(consumer.violations["supply temp"])
+                    for consumer in planning_grid.consumers
+                ]
+            )
+            if violation == 0:
+                break
+
+        return {
+            "temp": [np.ones(planning_horizon) * temp],
+            "electricity": [np.zeros(planning_horizon)],
+        }
+
+    mpc = RecedingHorizon(grid, planning_grid, policy, action_horizon)
+    mpc.run()
+
+    producer = list(grid.producers)[0]
+    print("producer supply temp: ", producer.temp[1])
+    print(
+        "mean window latency: {:.4f} sec, of which simulation: {:.4f} sec".format(
+            np.mean(mpc.window_latency),
+            np.mean([latency["simulation"] for latency in mpc.latency]),
+        )
+    )
@@ -10,4 +10,29 @@ from .consumer import Consumer  # noqa F401
 from .producer import Producer  # noqa F401
 from .edge import Edge  # noqa F401
 from .timing import Timing  # noqa F401
+from .profiling import Profiler  # noqa F401
+from .result_sink import ResultSink  # noqa F401
+from .fast_forward import FastForward  # noqa F401
+from .grid_state import GridState  # noqa F401
+from .receding_horizon import RecedingHorizon  # noqa F401
 from .producers import *
+
+# imported on first access, as they pull in scipy, cvxpy, multiprocessing and asyncio
+_lazy = {
+    "HydraulicNetwork": ".hydraulics",
+    "VectorGridEnv": ".vector_env",
+    "LinearSurrogate": ".surrogate",
+    "Adjoint": ".adjoint",
+    "LinearProblem": ".linear_problem",
+    "SimulationService": ".service",
+    "SimulationClient": ".service",
+}
+
+
+def __getattr__(name):
+    if name in _lazy:
+        import importlib
+
+        return getattr(importlib.import_module(_lazy[name], __name__), name)
+
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
@@ -0,0 +1,272 @@
+# Adjoint sensitivities of the margin and the violations with respect to producer temperatures
+
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+from scipy import sparse  # type: ignore
+
+from .branch import Branch
+from .consumer import Consumer
+from .edge import Edge
+from .grid_object import GridObject
+from .junction import Junction
+from .producer import Producer
+from .surrogate import LinearSurrogate
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# a temperature of the grid: an edge (its outlet), or a node and "supply" or "return"
+Key = Tuple[GridObject, str]
+
+
+class Adjoint:
+    """
+    Gradients of the margin of a producer (its profit minus its cost) and of the supply
+    temperature violations of the consumers, with respect to the supply temperature
+    trajectory (temp[1]) of the producer, around the completed steps of a run.
+
+    The temperatures of the grid depend linearly on each other at the mass flows of the run:
+    pipes by their delay matrices (see LinearSurrogate.edge_map), branches pass them on,
+    junctions mix them by valve positions (supply) or mass flows (return), and consumers map
+    their supply to their return temperature by the slope of the heat exchanger at its
+    operating point. Instead of one run per perturbed step, backward() propagates the weights
+    of the outputs once through the transposed maps, from the producer inlet over the return
+    and supply side back to the producer outlet.
+
+    The gradients are sensitivities at the mass flows of the run: the delays of the pipes
+    do not move with the mass flows, see margin_gradient().
+    """
+
+    def __init__(
+        self,
+        grid: "Grid",
+        producer_id: Optional[int] = None,  # the first producer by default
+        heat_step: float = 0.5,  # temperature step of the heat exchanger slopes, in °C
+    ) -> None:
+        self.steps = GridObject._current_step
+        if producer_id is None:
+            self.producer = next(iter(grid.producers))
+        else:
+            self.producer = grid.get_object(producer_id)
+        if not self.producer.control_with_temp:
+            raise Exception("Gradients need a producer controlled with its temperature")
+        self.consumers: List[Consumer] = list(grid.consumers)
+
+        self.return_slopes, self.flow_slopes = {}, {}
+        for consumer in self.consumers:
+            _, return_slope, flow_slope = LinearSurrogate.operating_point_slopes(
+                consumer, self.steps, heat_step
+            )
+            self.return_slopes[consumer.id] = return_slope
+            self.flow_slopes[consumer.id] = flow_slope
+        self._inputs: Dict[Key, List[Tuple[Key, sparse.spmatrix]]] = {}
+
+    def inputs(self, key: Key) -> List[Tuple[Key, sparse.spmatrix]]:
+        """
+        The temperatures that the temperature key depends on directly, each with the
+        derivative of key by it, one (steps, steps) matrix
+        """
+        if key in self._inputs:
+            return self._inputs[key]
+
+        obj, side = key
+        steps = self.steps
+        identity = sparse.identity(steps, format="csr")
+        if isinstance(obj, Edge):
+            inlet_node = obj.nodes[0][0]
+            inputs = [((inlet_node, side), LinearSurrogate.edge_map(obj, steps))]
+        elif isinstance(obj, Producer):
+            # the supply temperature of the producer is the control, see backward()
+            inputs = [] if side == "supply" else [((obj.edges[0], side), identity)]
+        elif isinstance(obj, Consumer):
+            if side == "supply":
+                inputs = [((obj.edges[0], side), identity)]
+            else:
+                slope = sparse.diags(self.return_slopes[obj.id])
+                inputs = [((obj, "supply"), slope)]
+        elif isinstance(obj, Branch):
+            inputs = [((obj.edges[0], side), identity)]
+        elif isinstance(obj, Junction):
+            if side == "supply":
+                weights = obj.valve_position[:, :steps]
+            else:
+                mass_flow = obj.mass_flow[0, :steps]
+                weights = np.array([edge.mass_flow[0, :steps] for edge in obj.edges[1:]])
+                weights = weights / np.where(mass_flow == 0, np.inf, mass_flow)
+            inputs = [
+                ((edge, side), sparse.diags(slot_weights))
+                for slot_weights, edge in zip(weights, obj.edges[1:])
+            ]
+        else:
+            raise Exception("{} is not supported by the adjoint".format(type(obj).__name__))
+
+        self._inputs[key] = inputs
+        return inputs
+
+    def _order(self, keys: List[Key]) -> List[Key]:
+        """
+        All temperatures that keys depend on, each after the temperatures it depends on
+        """
+        order: List[Key] = []
+        visited = set()
+        stack = [(key, False) for key in keys]
+        while stack:
+            key, expanded = stack.pop()
+            if expanded:
+                order.append(key)
+                continue
+            if key in visited:
+                continue
+            visited.add(key)
+            stack.append((key, True))
+            stack += [(input_key, False) for input_key, _ in self.inputs(key)]
+
+        return order
+
+    def backward(self, weights: Dict[Key, np.ndarray]) -> np.ndarray:
+        """
+        Gradient of the sum of weights[key] * temperature key (over all steps and keys) with
+        respect to the supply temperature of the producer in every step
+        """
+        adjoints = {key: np.asarray(weight, dtype=float) for key, weight in weights.items()}
+        for key in reversed(self._order(list(weights))):
+            if key not in adjoints:
+                continue
+            for input_key, derivative in self.inputs(key):
+                contribution = derivative.T @ adjoints[key]
+                if input_key in adjoints:
+                    adjoints[input_key] = adjoints[input_key] + contribution
+                else:
+                    adjoints[input_key] = contribution
+
+        return adjoints.get((self.producer, "supply"), np.zeros(self.steps))
+
+    def margin_gradient(self) -> np.ndarray:
+        """
+        Gradient of the margin (profit minus cost) of the producer, over the steps of the run.
+        The heat q = mass flow * heat capacity * (supply - inlet temperature) is charged with
+        the marginal heat cost of the producer, and the pump power with the electricity
+        price. The mass flow of the producer is the sum of the ones of the consumers in the
+        same step, which follow their supply temperatures.
+
+        This is a sensitivity at the mass flows of the run: the changed mass flows of the
+        consumers change the heat and the pump power of their step, but not the delays of the
+        pipes or the mass flows with which the edges estimate their outlet temperatures. Where
+        a change of the supply temperature reaches the consumers within the run, the gradient
+        is therefore only approximate, see tests/test_adjoint.py.
+        """
+        producer, steps = self.producer, self.steps
+        mass_flow = producer.mass_flow[1, :steps]
+        flowing = np.where(mass_flow == 0, np.inf, mass_flow)
+        cost_slope = producer.heat_cost_slope(0, steps) * producer.heat_capacity / 10 ** 6
+        e_price = np.asarray(producer.e_price, dtype=float)[:steps]
+        # derivatives of the margin by the supply and inlet temperature and the mass flow
+        temp_slope = -cost_slope * mass_flow
+        flow_slope = -cost_slope * (producer.temp[1, :steps] - producer.temp[0, :steps])
+        flow_slope -= producer.pump_power[:steps] * e_price / flowing
+        pump_scale = mass_flow / (
+            producer.density * producer.pump_efficiency * producer.energy_unit_conversion
+        )
+        pressure_slopes = self.pressure_slopes()
+
+        weights = {(producer, "return"): -temp_slope}
+        for consumer in self.consumers:
+            consumer_slope = flow_slope - pump_scale * pressure_slopes[consumer.id] * e_price
+            weights[(consumer, "supply")] = consumer_slope * self.flow_slopes[consumer.id]
+
+        return temp_slope + self.backward(weights)
+
+    def pressure_slopes(self) -> Dict[int, np.ndarray]:
+        """
+        Derivative of the pressure difference of the producer by the mass flow of every
+        consumer, per step. The difference is the pressure load of the consumer on the
+        critical path plus the friction of the pipes on it (friction coefficient * mass
+        flow ** 2), the critical path follows the extreme pressures that the branches and
+        junctions passed on in the run.
+        """
+        critical = {}
+        for side in ("supply", "return"):
+            critical.update(self._critical_edges(side))
+
+        slopes = {}
+        for consumer in self.consumers:
+            slope = np.zeros(self.steps)
+            for edge, share in self._consumer_shares(consumer).items():
+                if edge in critical:
+                    friction = 2 * edge.friction_coefficient * edge.mass_flow[0, : self.steps]
+                    slope += critical[edge] * share * friction
+            slopes[consumer.id] = slope
+
+        return slopes
+
+    def _critical_edges(self, side: str) -> Dict[Edge, np.ndarray]:
+        """
+        Edges of the critical path from the producer to the consumers on one side, with 1 in
+        the steps in which they are on it. Branches pass on the highest pressure of their
+        side slots, junctions the lowest.
+        """
+        steps, supply = self.steps, side == "supply"
+        edge = self.producer.edges[1] if supply else self.producer.edges[0]
+        critical: Dict[Edge, np.ndarray] = {}
+        stack = [(edge, np.ones(steps))]
+        while stack:
+            edge, on = stack.pop()
+            critical[edge] = critical.get(edge, 0) + on
+            node, slot = edge.nodes[1] if supply else edge.nodes[0]
+            if not isinstance(node, (Branch, Junction)):
+                continue
+            if slot != 0:
+                stack.append((node.edges[0], on))
+                continue
+            pressure = node.pressure[1:, :steps]
+            if isinstance(node, Branch):
+                pick = np.argmax(pressure, axis=0)
+            else:
+                pick = np.argmin(pressure, axis=0)
+            stack += [(side_edge, on * (pick == i)) for i, side_edge in enumerate(node.edges[1:])]
+
+        return critical
+
+    def _consumer_shares(self, consumer: Consumer) -> Dict[Edge, np.ndarray]:
+        """
+        Edges that carry the mass flow of the consumer on both sides, with the derivative of
+        their mass flow by the one of the consumer, per step. Where the water of several
+        side slots is joined, the consumer is on each of them by its share of the mass flow.
+        """
+        steps = self.steps
+        shares: Dict[Edge, np.ndarray] = {}
+        stack = [
+            (consumer.edges[0], True, np.ones(steps)),
+            (consumer.edges[1], False, np.ones(steps)),
+        ]
+        while stack:
+            edge, supply, share = stack.pop()
+            shares[edge] = shares.get(edge, 0) + share
+            node, slot = edge.nodes[0] if supply else edge.nodes[1]
+            if not isinstance(node, (Branch, Junction)):
+                continue
+            if slot != 0:
+                stack.append((node.edges[0], supply, share))
+                continue
+            mass_flow = node.mass_flow[0, :steps]
+            side_shares = node.mass_flow[1:, :steps] / np.where(mass_flow == 0, np.inf, mass_flow)
+            stack += [
+                (side_edge, supply, share * side_share)
+                for side_share, side_edge in zip(side_shares, node.edges[1:])
+            ]
+
+        return shares
+
+    def violation_gradient(self, consumer_ids: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Gradient of the sum of the supply temperature violations of the consumers (all by
+        default), which are negative where the supply temperature is below the minimum
+        """
+        weights = {}
+        for consumer in self.consumers:
+            if consumer_ids is not None and consumer.id not in consumer_ids:
+                continue
+            violated = consumer.violations["supply temp"][: self.steps] < 0
+            weights[(consumer, "supply")] = violated.astype(float)
+
+        return self.backward(weights)
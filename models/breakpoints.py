@@ -0,0 +1,245 @@
+# Piecewise linear breakpoints of the heat exchangers and pipes, for linearization.py
+
+import warnings
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+from .consumer import Consumer
+from .edge import Edge
+from .grid_object import GridObject
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# fitted breakpoints by the parameters they were sampled with, see _cached()
+_cache: Dict[tuple, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def fit(
+    x: np.ndarray,  # (samples,), increasing
+    y: np.ndarray,  # (blocks, samples)
+    points: int,
+    tolerance: float,  # largest absolute error of the interpolation between breakpoints
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chooses at most points of the samples of every block as breakpoints, so that the linear
+    interpolation between them deviates at most tolerance from the samples. Starting from the
+    first and last sample, the sample with the largest error is added in every block at once,
+    until all blocks are within tolerance. Samples that are nan are left out. Blocks that need fewer breakpoints repeat their
+    last one, so that the result has shape (blocks, points), as piecewise() and nf4r() expect.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    blocks, samples = y.shape
+    assert 2 <= points <= samples
+
+    # failed samples (nan) are left out: never chosen, and not checked against the tolerance
+    valid = np.isfinite(y)
+    if not np.all(np.any(valid, axis=1)):
+        raise Exception("No sample of a block could be computed, it cannot be fitted")
+    if not np.all(valid):
+        warnings.warn("{} failed samples are left out of the fit".format(np.sum(~valid)))
+    first = np.argmax(valid, axis=1)
+    last = samples - 1 - np.argmax(valid[:, ::-1], axis=1)
+
+    chosen = np.zeros((blocks, samples), dtype=bool)
+    chosen[np.arange(blocks), first] = True
+    chosen[np.arange(blocks), last] = True
+    while True:
+        deviation = np.where(valid, _deviation(x, y, chosen), 0)
+        worst = np.argmax(deviation, axis=1)
+        error = deviation[np.arange(blocks), worst]
+        refine = (error > tolerance) & (np.sum(chosen, axis=1) < points)
+        if not np.any(refine):
+            break
+        chosen[refine, worst[refine]] = True
+
+    if np.any(error > tolerance):
+        warnings.warn(
+            "{} breakpoints exceed the tolerance {} by up to {}".format(
+                points, tolerance, np.max(error)
+            )
+        )
+
+    # the chosen samples in order, then the last one repeated
+    order = np.argsort(~chosen, axis=1, kind="stable")[:, :points]
+    order = np.where(np.arange(points) < np.sum(chosen, axis=1)[:, None], order, last[:, None])
+    return x[order], np.take_along_axis(y, order, axis=1)
+
+
+def _deviation(x: np.ndarray, y: np.ndarray, chosen: np.ndarray) -> np.ndarray:
+    """
+    Absolute difference between the samples y and the linear interpolation between the
+    chosen samples of every block
+    """
+    samples = len(x)
+    index = np.broadcast_to(np.arange(samples), chosen.shape)
+    # the closest chosen samples to the left and right of every sample
+    left = np.maximum.accumulate(np.where(chosen, index, 0), axis=1)
+    right = np.minimum.accumulate(np.where(chosen, index, samples - 1)[:, ::-1], axis=1)
+    right = right[:, ::-1]
+    y_left = np.take_along_axis(y, left, axis=1)
+    y_right = np.take_along_axis(y, right, axis=1)
+    width = np.where(right > left, x[right] - x[left], 1)
+    return np.abs(y_left + (y_right - y_left) * (x - x[left]) / width - y)
+
+
+def _cached(key: tuple, x: np.ndarray, sample, points: int, tolerance: float):
+    """
+    Fits the samples (blocks, samples) = sample() at x, unless the same key, x, points and
+    tolerance were fitted before
+    """
+    key = key + (x.tobytes(), points, tolerance)
+    if key not in _cache:
+        _cache[key] = fit(x, sample(), points, tolerance)
+
+    return _cache[key]
+
+
+def pipe_heat_loss(
+    edge: Edge,
+    temps: np.ndarray,  # inlet temperatures, (samples,) in °C
+    mass_flows: np.ndarray,  # (blocks,) in kg/s
+) -> np.ndarray:
+    """
+    Heat loss of the edge in steady state, (blocks, samples) in MW: water entering with temp
+    cools down towards the ground temperature for the time it takes to pass the pipe, see
+    Edge.get_plug_temp. No flow loses no heat.
+    """
+    temps = np.asarray(temps, dtype=float)[None, :]
+    mass_flows = np.abs(np.asarray(mass_flows, dtype=float))[:, None]
+    with np.errstate(divide="ignore"):
+        passing_time = edge._mass_in_pipe / mass_flows  # in sec
+    decay = 1 - np.exp(-passing_time / edge._thermal_time_constant)
+    return (
+        mass_flows * edge.heat_capacity * (temps - edge.t_ground) * decay
+        / edge.energy_unit_conversion
+    )
+
+
+def heat_exchanger_mass_flow(
+    consumer: Consumer,
+    temps: np.ndarray,  # primary supply temperatures, (samples,) in °C
+    start_step: int,
+    blocks: int,
+) -> np.ndarray:
+    """
+    Primary mass flow of the heat exchanger of the consumer, (blocks, samples) in kg/s, to
+    supply the demand of the steps [start_step, start_step + blocks) at supply temperatures
+    temps, see HeatExchanger.solve_mass_flow_p. Blocks with the same demand are solved once,
+    all samples at once. Samples that cannot be solved are nan, see fit().
+    """
+    hx = consumer.heat_exchanger
+    demand = GridObject.window(consumer.demand, start_step, blocks)
+    demand_in_w = demand * consumer.energy_unit_conversion
+    mass_flow_s = demand_in_w / (
+        hx.heat_capacity * (consumer.setpoint_t_supply_s - consumer.t_return_s)
+    )
+    _, first, inverse = np.unique(demand, return_index=True, return_inverse=True)
+    mass_flow_p = hx.solve_mass_flow_p(
+        t_supply_p=np.asarray(temps, dtype=float)[None, :],
+        setpoint_t_supply_s=consumer.setpoint_t_supply_s,
+        t_return_s=consumer.t_return_s,
+        mass_flow_s=mass_flow_s[first][:, None],
+        demand=demand[first][:, None],
+    )
+
+    return mass_flow_p[inverse]
+
+
+def loss_breakpoints(
+    grid: "Grid",
+    temps: np.ndarray,  # supply temperatures to sample, (samples,) in °C
+    start_step: int,
+    blocks: int,
+    points: int = 5,
+    tolerance: float = 0.01,  # in MW
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Breakpoints (temps, losses), each (blocks, points), of the total heat loss of the supply
+    edges (in MW) over the supply temperature, at the mass flows of the edges in the steps
+    [start_step, start_step + blocks) of the last run, see pipe_heat_loss. The result is the
+    loss_breakpoints of LinearProblem.update, or the intervals of piecewise().
+    """
+    temps = np.asarray(temps, dtype=float)
+    edges: List[Edge] = [edge for edge in grid.edges if edge.is_supply]
+    mass_flows = np.array(
+        [GridObject.window(edge.mass_flow[0], start_step, blocks) for edge in edges]
+    )
+    key = (
+        "loss",
+        tuple(
+            (
+                edge.diameter,
+                edge.length,
+                edge.thermal_resistance,
+                edge.t_ground,
+                edge.heat_capacity,
+                edge.density,
+            )
+            for edge in edges
+        ),
+        mass_flows.tobytes(),
+    )
+
+    def sample():
+        return sum(
+            pipe_heat_loss(edge, temps, edge_flows) for edge, edge_flows in zip(edges, mass_flows)
+        )
+
+    return _cached(key, temps, sample, points, tolerance)
+
+
+def flow_breakpoints(
+    grid: "Grid",
+    temps: np.ndarray,  # supply temperatures to sample, (samples,) in °C
+    start_step: int,
+    blocks: int,
+    points: int = 5,
+    tolerance: float = 1,  # in kg/s
+    consumer_ids: Optional[List[int]] = None,  # all consumers by default
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Breakpoints (temps, mass flows), each (blocks, points), of the total primary mass flow of
+    the consumers over their supply temperature, for their demands in the steps
+    [start_step, start_step + blocks), see heat_exchanger_mass_flow. The mass flows sorted
+    per block, np.sort(mass_flows, axis=1), partition the mass flow for nf4r(), as the
+    flow_breakpoints of LinearProblem.update with points = segments + 1.
+    """
+    temps = np.asarray(temps, dtype=float)
+    consumers: List[Consumer] = [
+        consumer
+        for consumer in grid.consumers
+        if consumer_ids is None or consumer.id in consumer_ids
+    ]
+    hxs = [consumer.heat_exchanger for consumer in consumers]
+    demands = np.array(
+        [GridObject.window(consumer.demand, start_step, blocks) for consumer in consumers]
+    )
+    key = (
+        "flow",
+        tuple(
+            (
+                consumer.setpoint_t_supply_s,
+                consumer.t_return_s,
+                consumer.energy_unit_conversion,
+                hx.heat_capacity,
+                hx.max_mass_flow_p,
+                hx.surface_area,
+                hx.heat_transfer_q,
+                hx.heat_transfer_k,
+                hx.heat_transfer_k_max,
+                hx.demand_capacity,
+            )
+            for consumer, hx in zip(consumers, hxs)
+        ),
+        demands.tobytes(),
+    )
+
+    def sample():
+        return sum(
+            heat_exchanger_mass_flow(consumer, temps, start_step, blocks)
+            for consumer in consumers
+        )
+
+    return _cached(key, temps, sample, points, tolerance)
@@ -1,6 +1,6 @@
 # A node that combines multiple edges from one side and a single from the other
 
-from typing import Optional
+from typing import List, Optional
 from .node import Node
 
 import numpy as np  # type: ignore
@@ -29,8 +29,39 @@ class Connector(Node):
         if default_valve_position is not None:
             def_valve = default_valve_position
 
-        self.valve_position = np.full(self.blocks, def_valve, dtype=float)
+        # share of the mass flow of slot 0 per side slot (rows) and step
+        self.valve_position = np.full((len(slots) - 1, self.blocks), def_valve, dtype=float)
         self.entry_step_global = None
+        self._clear_joint()
+
+    def clear(self, in_place: bool = False) -> None:
+        super().clear(in_place)
+        self._clear_joint()
+
+    def _clear_joint(self) -> None:
+        """
+        The side slots are counted as their mass flows arrive, so that joining them
+        does not scan all side slots on every arrival. The count belongs to the step of
+        the first arrival, arrivals left from an aborted step are not counted.
+        """
+        self._arrived = 0
+        self._arrival_step: Optional[int] = None  # step the arrivals are counted in
+        self._pressure_extreme = np.nan
+        self._joined_step: Optional[int] = None  # step in which all side slots arrived
+
+    def load_window(self, source: "Connector", start_step: int) -> None:
+        self.valve_position = self.window(source.valve_position, start_step, self.blocks)
+
+    def steady_inputs(self) -> List[np.ndarray]:
+        return [self.valve_position]
+
+    def roll(self, shift: int) -> None:
+        """
+        The valve keeps its last position in the freed steps
+        """
+        super().roll(shift)
+        self.shift(self.valve_position, shift)
+        self._clear_joint()
 
     def set_mass_flow_in_direction(self, slot: int, mass_flow: float, direction: bool) -> None:
         """
@@ -53,8 +84,8 @@ class Connector(Node):
         Secondary mass flow is calculated and all secondary edges are added
         to the list of solvable_objects
         """
-        pos = self.valve_position[self.current_step]
-        assert not np.isnan(pos)
+        pos = self.valve_position[:, self.current_step]
+        assert not np.isnan(pos).any()
         self.mass_flow[1:, self.current_step] = pos * mass_flow
 
         for i in range(1, len(self.slots)):
@@ -69,20 +100,28 @@ class Connector(Node):
     def set_mass_flow_joint(self, slot: int, direction: bool):
         """
         Main mass flow is calculated as the sum of mass flows corresponding to the
-        side edges.
+        side edges, once all of them arrived. Every side slot arrives once per step.
         """
-        self.pressure[slot, self.current_step] = self.edges[slot].pressure[
-            int(direction), self.current_step
-        ]
+        pressure = self.edges[slot].pressure[int(direction), self.current_step]
+        self.pressure[slot, self.current_step] = pressure
+
+        if self._arrival_step != self.current_step:
+            self._arrived = 0
+            self._arrival_step = self.current_step
+            self._pressure_extreme = pressure
+        elif direction == 0:
+            self._pressure_extreme = max(self._pressure_extreme, pressure)
+        else:
+            self._pressure_extreme = min(self._pressure_extreme, pressure)
+        self._arrived += 1
 
-        if not any(np.isnan(self.mass_flow[1:, self.current_step])):
+        if self._arrived == len(self.slots) - 1:
+            self._arrival_step = None
+            self._joined_step = self.current_step
             propelled_mass_flow = np.sum(self.mass_flow[1:, self.current_step])
 
             self.mass_flow[0, self.current_step] = propelled_mass_flow
-            self.pressure[:, self.current_step] = max(
-                self.pressure[1:, self.current_step]
-            ) if direction == 0 else min(
-                self.pressure[1:, self.current_step])
+            self.pressure[:, self.current_step] = self._pressure_extreme
 
             # the main edge is added to the list _solvable_objects of the object grid.
             self.solvable_callback(self.edges[0], 1 - direction, propelled_mass_flow)
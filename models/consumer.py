@@ -1,6 +1,6 @@
 # A node that consumes a preset amount of energy (through a heat exchanger)
 
-from typing import Optional
+from typing import List, Optional
 import numpy as np  # type: ignore
 from .heat_exchanger import HeatExchanger
 from .node import Node
@@ -12,6 +12,8 @@ class Consumer(Node):
     two slots. The secondary side supply and return temperatures are predefined
     """
 
+    violation_kinds = ("supply temp", "heat delivered")
+
     def __init__(
         self,
         demand: np.ndarray,  # in W
@@ -87,19 +89,19 @@ class Consumer(Node):
             self.blocks, np.nan, dtype=float
         )  # secondary supply network inlet temperature
 
-        self.alpha, self.pressure = None, None
+        self.alpha, self.real_time_delay = None, None
 
-    def clear(self) -> None:
+    def clear(self, in_place: bool = False) -> None:
         blocks = self.blocks
-        self.q = np.full(blocks, np.nan, dtype=float)  # heat demand in MW
-        self._q_in_W = np.full(blocks, np.nan, dtype=float)  # heat demand in W
-        self.alpha = np.full(blocks, np.nan, dtype=float)
-        self._clear()
-        self.pressure = np.full(
-            (self.blocks, 2), (self.pressure_load, 0), dtype=float
-        ).T
-        self.entry_step_global = np.full(blocks, np.nan, dtype=float)
-        self.real_time_delay = np.full(blocks, np.nan, dtype=float) # delay from producer to consumer
+        self.q = self._refill("q", (blocks,), in_place=in_place)  # heat demand in MW
+        self._q_in_W = self._refill("_q_in_W", (blocks,), in_place=in_place)  # heat demand in W
+        self.alpha = self._refill("alpha", (blocks,), in_place=in_place)
+        self._clear(in_place=in_place)
+        self.pressure[0] = self.pressure_load
+        self.pressure[1] = 0
+        self.entry_step_global = self._refill("entry_step_global", (blocks,), in_place=in_place)
+        # delay from producer to consumer
+        self.real_time_delay = self._refill("real_time_delay", (blocks,), in_place=in_place)
 
     def update_demand(
         self,
@@ -107,29 +109,90 @@ class Consumer(Node):
     ) -> None:
         self.demand = demand
         self._demand_in_W = demand * self.energy_unit_conversion
-        self.minimum_t_supply_p = np.array(
+        self.minimum_t_supply_p = self._minimum_t_supply_p(demand)
+
+    def set_demand(self, start_step: int, demand: np.ndarray) -> None:
+        """
+        Replaces the demand from start_step on, e.g. for the steps freed by roll().
+        """
+        end_step = start_step + len(demand)
+        self.demand = np.array(self.demand, dtype=float)
+        self.demand[start_step:end_step] = demand
+        self._demand_in_W[start_step:end_step] = self.demand[start_step:end_step] * (
+            self.energy_unit_conversion
+        )
+        self.minimum_t_supply_p[start_step:end_step] = self._minimum_t_supply_p(
+            self.demand[start_step:end_step]
+        )
+
+    def _minimum_t_supply_p(self, demand: np.ndarray) -> np.ndarray:
+        demand_in_W = demand * self.energy_unit_conversion
+        minimum_t_supply_p = np.array(
             list(
                 map(
                     lambda block: self.heat_exchanger.minimum_t_supply_p(  # bound
-                        q=self._demand_in_W[block],
+                        q=demand_in_W[block],
                         t_supply_s=self.setpoint_t_supply_s,
                         mass_flow_p=self.heat_exchanger.max_mass_flow_p,
-                        mass_flow_s=self._demand_in_W[block]
+                        mass_flow_s=demand_in_W[block]
                         / (
                             self.heat_exchanger.heat_capacity
                             * (self.setpoint_t_supply_s - self.t_return_s)
                         ),
                         demand = demand[block],
                     ),
-                    range(self.blocks),
+                    range(len(demand)),
                 )
-            )
+            ),
+            dtype=float,
         )
 
-        self.minimum_t_supply_p[
-            self.minimum_t_supply_p < self.min_supply_temp_artificial_bound
+        minimum_t_supply_p[
+            minimum_t_supply_p < self.min_supply_temp_artificial_bound
         ] = self.min_supply_temp_artificial_bound
 
+        return minimum_t_supply_p
+
+    def roll(self, shift: int) -> None:
+        """
+        The demand of the freed steps is unknown (nan) until it is set with set_demand().
+        """
+        super().roll(shift)
+        self.pressure[0, -shift:] = self.pressure_load
+        self.pressure[1, -shift:] = 0
+        # entry steps are counted from the start of the window
+        self.entry_step_global -= shift
+        # the demand may be the array passed in by the caller, which is not shifted
+        self.demand = np.array(self.demand, dtype=float)
+        for values in (
+            self.demand,
+            self._demand_in_W,
+            self.minimum_t_supply_p,
+            self.s_supply_temp,
+        ):
+            self.shift(values, shift, np.nan)
+
+    def steady_inputs(self) -> List[np.ndarray]:
+        return [self.demand]
+
+    def fast_forward(self, steps: int) -> None:
+        step = self.current_step
+        super().fast_forward(steps)
+        self.s_supply_temp[step: step + steps] = self.s_supply_temp[step - 1]
+        # the water left the producer one step later in every step
+        self.entry_step_global[step: step + steps] += np.arange(1, steps + 1)
+
+    def load_window(self, source: "Consumer", start_step: int) -> None:
+        """
+        Takes over the demand of the source consumer, including its already computed
+        minimum_t_supply_p, so that it does not have to be recomputed for every window.
+        """
+        self.demand = self.window(source.demand, start_step, self.blocks)
+        self._demand_in_W = self.demand * self.energy_unit_conversion
+        self.minimum_t_supply_p = self.window(
+            source.minimum_t_supply_p, start_step, self.blocks
+        )
+
     def get_outlet_temp(self, slot: int) -> float:
         """
         Is called from downstream to get the average outlet temperature in the
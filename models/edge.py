@@ -1,28 +1,25 @@
 # An edge connects two nodes
 
-import copy
-
 from typing import Optional, List, Tuple, TYPE_CHECKING
 import math
 import numpy as np  # type: ignore
-from beautifultable import BeautifulTable  # type: ignore
 import os
 from functools import cached_property
-from collections import defaultdict
 
 from .producer import Producer
 from .grid_object import GridObject
 from .plug import Plug
-from .timing import Timing
+from .kernels import Kernels, PlugArray, ENTRY_STEP, ENTRY_STEP_GLOBAL, ENTRY_TEMP, MASS
+from . import profiling
 
 if TYPE_CHECKING:
     from .node import Node
 
 
-timing = Timing(start=False)
-
-
 class Edge(GridObject):
+    violation_kinds = ("flow speed",)
+    summed_quantities = ("heat_in_pipe", "heat_loss")
+
     def __init__(
         self,
         blocks: int,
@@ -101,24 +98,40 @@ class Edge(GridObject):
         self.temp, self.actual_outlet_temp, self.mass_flow, self.flow_speed = None, None, None, None
         self.plug_cache, self.plug_cache_saver, self.pressure = None, None, None
         self.delay_matrix, self.heat_loss, self.heat_in_pipe, self.violations, self.nodes = None, None, None, None, None
+        self.hist_blocks = None
+        # mass flow in the step before step 0 (in kg/s), nan if unknown, see previous_mass_flow
+        self.initial_mass_flow = np.nan
+        # kernels of the grid's backend, None for the reference implementation on Plug lists
+        self.kernels: Optional[Kernels] = None
 
-    def clear(self) -> None:
-        super().clear()
-        self.temp = np.full((2, self.blocks), np.nan, dtype=float)
+    def clear(self, in_place: bool = False) -> None:
+        super().clear(in_place)
+        self.temp = self._refill("temp", (2, self.blocks), in_place=in_place)
         """
         The purpose of actual outlet temperature is that, if the outlet temperature is
         initially calculated in get_outlet_temp() with a inaccurate mass flow, it will deviate
         from the actual outlet temperature. And we want to keep that info for debugging
         """
-        self.actual_outlet_temp = np.full(self.blocks, np.nan, dtype=float)
-        self.mass_flow = np.full((2, self.blocks), np.nan, dtype=float)
-        self.flow_speed = np.full(self.blocks, np.nan, dtype=float)
+        self.actual_outlet_temp = self._refill(
+            "actual_outlet_temp", (self.blocks,), in_place=in_place
+        )
+        self.mass_flow = self._refill("mass_flow", (2, self.blocks), in_place=in_place)
+        self.flow_speed = self._refill("flow_speed", (self.blocks,), in_place=in_place)
         # plug_cache: the actual plugs in the pipe at the current time step
-        self.plug_cache = copy.deepcopy(self.initial_plug_cache)
+        if isinstance(self.initial_plug_cache, PlugArray):
+            self.plug_cache = self._plug_store(self.initial_plug_cache.copy())
+        else:
+            self.plug_cache = self._plug_store([plug.copy() for plug in self.initial_plug_cache])
         # plug_cache_saver: saving all plugs in the pipe in past time steps
-        self.plug_cache_saver = [copy.deepcopy(self.initial_plug_cache)]
-        self.pressure = np.full((2, self.blocks), np.nan, dtype=float)
-        extended_blocks = len(self.initial_plug_cache) + self.blocks
+        self.plug_cache_saver = [self._saved_plugs()]
+        self.pressure = self._refill("pressure", (2, self.blocks), in_place=in_place)
+        # initial plugs carried over from another run may not have consecutive entry steps
+        if isinstance(self.initial_plug_cache, PlugArray):
+            first_entry_step = int(np.min(self.initial_plug_cache.plugs[ENTRY_STEP]))
+        else:
+            first_entry_step = min(plug.entry_step for plug in self.initial_plug_cache)
+        self.hist_blocks = max(len(self.initial_plug_cache), -first_entry_step)
+        extended_blocks = self.hist_blocks + self.blocks
         """
         delay_matrix: recording the water goes out at a time step, at which previous
         time steps it goes into the pipe and the composition. The size of the matrix [m.n]:
@@ -128,15 +141,19 @@ class Edge(GridObject):
         it means that for water goes out at time step5, 60% comes from the initial plug,
         and 40% goes in at time step 0.
         """
-        self.delay_matrix = np.full((self.blocks, extended_blocks), np.nan, dtype=float)
-        self.heat_loss = np.full(self.blocks, 0, dtype=float)
-        self.heat_in_pipe = np.full(self.blocks, 0, dtype=float)
-
-        self.violations = defaultdict(
-            lambda: np.full(self.blocks, np.nan, dtype=np.float)
+        self.delay_matrix = self._refill(
+            "delay_matrix", (self.blocks, extended_blocks), in_place=in_place, rolling=False
         )
+        self.heat_loss = self._refill("heat_loss", (self.blocks,), 0, in_place=in_place)
+        self.heat_in_pipe = self._refill("heat_in_pipe", (self.blocks,), 0, in_place=in_place)
+        self._clear_prefix_sums()
+
+        self._clear_violations(in_place)
         self.entry_step_global = None
-        # edge violation only contains one key: 'flow speed'
+
+    @property
+    def state_rows(self) -> int:
+        return 2
 
     def link(
         self,
@@ -144,18 +161,41 @@ class Edge(GridObject):
     ) -> None:
         self.nodes = nodes
 
+    def set_kernels(self, kernels: Optional[Kernels]) -> None:
+        """
+        Switches to the kernels of a backend (see kernels.py), the plugs of the pipe and the
+        saved plugs are converted to PlugArrays, or back to Plug lists for None.
+        """
+        self.kernels = kernels
+        if self.plug_cache is not None:
+            self.plug_cache = self._plug_store(self.plug_cache)
+            self.plug_cache_saver = [self._plug_store(plugs) for plugs in self.plug_cache_saver]
+
+    def _plug_store(self, plugs):
+        if self.kernels is None:
+            return plugs.to_plugs() if isinstance(plugs, PlugArray) else plugs
+
+        return plugs if isinstance(plugs, PlugArray) else PlugArray.from_plugs(plugs)
+
+    def _saved_plugs(self):
+        if self.kernels is None:
+            return [plug.copy() for plug in self.plug_cache]
+
+        return self.plug_cache.copy()
+
     def reset_initial_plugs(self, plugs_in_pipe):
         self.initial_plug_cache = plugs_in_pipe  # first one is newest!
+        self.initial_mass_flow = np.nan
         mass_in_pipe: float = 0
         for plug in plugs_in_pipe:
             mass_in_pipe += plug.mass
 
         assert mass_in_pipe == self._mass_in_pipe
 
-    def get_outlet_temp(self) -> float:
+    def get_outlet_temp(self) -> Tuple[float, float]:
         """
-        Called from down-stream to get the average outlet temperature in the
-        coming step. On the primary side, we do not yet know the mass_flow, so
+        Called from down-stream to get the average outlet temperature and global
+        entry step in the coming step. On the primary side, we do not yet know the mass_flow, so
         have to estimate it. Right now, we use the mass flow of the previous
         step.
         """
@@ -166,16 +206,27 @@ class Edge(GridObject):
         outlet_temp: float = 0
         entry_step_global: float = 0
 
-        if self.current_step == 0:
+        if self.current_step == 0 and np.isnan(self.initial_mass_flow):
             expected_mass = 0
         else:
-            expected_mass = (
-                self.interval_length * self.mass_flow[0, self.current_step - 1]
-            )
+            expected_mass = self.interval_length * self.previous_mass_flow()
 
         fulfilled: float = 0
 
-        for plug in reversed(self.plug_cache):
+        if self.kernels is not None:
+            outlet_temp, entry_step_global, fulfilled = self.kernels.outlet_temp(
+                self.plug_cache.plugs,
+                expected_mass,
+                self.current_step,
+                self.interval_length,
+                self._thermal_time_constant,
+                self.t_ground,
+            )
+            plugs = []
+        else:
+            plugs = reversed(self.plug_cache)
+
+        for plug in plugs:
 
             if expected_mass - fulfilled >= plug.mass:
                 fulfilled += plug.mass
@@ -206,7 +257,7 @@ class Edge(GridObject):
                 entry_temp, e_s_g = inlet_node.get_outlet_temp(inlet_slot)
             else:
                 entry_temp, e_s_g = inlet_node.get_outlet_temp(
-                    inlet_slot, self.mass_flow[0, self.current_step - 1]
+                    inlet_slot, self.previous_mass_flow()
                 )
 
             # no decay, as inlet time step equals outlet step
@@ -217,13 +268,35 @@ class Edge(GridObject):
 
         return outlet_temp, entry_step_global
 
+    def previous_mass_flow(self) -> float:
+        """
+        Mass flow in the step before the current step, which estimates the mass flow of the
+        current step. In step 0, the mass flow a carried over state ended with.
+        """
+        if self.current_step == 0:
+            return self.initial_mass_flow
+
+        return self.mass_flow[0, self.current_step - 1]
+
     def get_outlet_temp_mass_bundle(self):
         """
         Applies heat loss equation according to the Newton's cooling law on  reversed plugs from the pipe.
         """
 
-        bundle = []
-        for plug in reversed(self.plug_cache):
+        if self.kernels is not None:
+            bundle = self.kernels.outlet_bundle(
+                self.plug_cache.plugs,
+                self.current_step,
+                self.interval_length,
+                self._thermal_time_constant,
+                self.t_ground,
+            ).tolist()
+            plugs = []
+        else:
+            bundle = []
+            plugs = reversed(self.plug_cache)
+
+        for plug in plugs:
             tau_c = (self.current_step - plug.entry_step) * self.interval_length
             exp_tau = math.exp(-tau_c / self._thermal_time_constant)
 
@@ -235,7 +308,7 @@ class Edge(GridObject):
             entry_temp, e_s_g = inlet_node.get_outlet_temp(inlet_slot)
         else:
             entry_temp, e_s_g = inlet_node.get_outlet_temp(
-                inlet_slot, self.mass_flow[0, self.current_step - 1]
+                inlet_slot, self.previous_mass_flow()
             )
 
         bundle.append([entry_temp, np.inf, e_s_g])
@@ -275,15 +348,18 @@ class Edge(GridObject):
         Therefore, the sum of plug's mass exceeds 
         the total possible amount of water in the pipe.
         """
-        self.plug_cache.insert(
-            0,
-            Plug(
-                mass=consumed_mass,
-                entry_step=self.current_step,
-                entry_temp=entry_temp,
-                entry_step_global= entry_step_global,
-            ),
-        )
+        if self.kernels is not None:
+            self.plug_cache.append(consumed_mass, self.current_step, entry_temp, entry_step_global)
+        else:
+            self.plug_cache.insert(
+                0,
+                Plug(
+                    mass=consumed_mass,
+                    entry_step=self.current_step,
+                    entry_temp=entry_temp,
+                    entry_step_global= entry_step_global,
+                ),
+            )
         self.heat_in_pipe[self.current_step] += (
             consumed_mass
             * entry_temp
@@ -323,7 +399,8 @@ class Edge(GridObject):
         # temperature at the inlet of the edge
         self.temp[0, self.current_step] = entry_temp
         self.entry_step_global = entry_step_global
-        self.plug_cache_saver.append(copy.deepcopy(self.plug_cache))
+        self.plug_cache_saver.append(self._saved_plugs())
+        self.prefix_sums.record(self.current_step)
 
         inlet_pressure = inlet_node.pressure[inlet_slot, self.current_step]
         outlet_pressure = outlet_node.pressure[outlet_slot, self.current_step]
@@ -367,7 +444,20 @@ class Edge(GridObject):
         heat_loss = 0
         heat_in_pipe = 0
 
-        for plug in self.plug_cache:
+        if self.kernels is not None:
+            heat_loss, heat_in_pipe = self.kernels.heat_loss(
+                self.plug_cache.plugs,
+                self.current_step,
+                self.interval_length,
+                self._thermal_time_constant,
+                self.t_ground,
+                self.heat_capacity,
+            )
+            plugs = []
+        else:
+            plugs = self.plug_cache
+
+        for plug in plugs:
             tau_c_p = (
                     max(self.current_step - plug.entry_step - 1, 0) * self.interval_length
             )
@@ -395,14 +485,19 @@ class Edge(GridObject):
         actual_outlet_temp: float = 0
         entry_step_global:float = 0
         fulfilled: float = 0
-        hist_blocks = len(self.initial_plug_cache)
+        hist_blocks = self.hist_blocks
         delay_arr = np.zeros(hist_blocks + self.blocks)
         """
          Push the plugs of water outside of the pipe, so that the total mass of plugs in the pipe
          matches total possible amount mass of water [kg] in the pipe.
         """
+        if self.kernels is not None:
+            return self._push_plugs_with_kernels(consumed_mass, delay_arr)
+
+        processed = 0
         for i in reversed(range(len(self.plug_cache))):
             plug = self.plug_cache[i]
+            processed += 1
 
             if consumed_mass - fulfilled >= plug.mass:
                 self.plug_cache.pop()
@@ -415,7 +510,8 @@ class Edge(GridObject):
                 fulfilled = consumed_mass
 
             if consuming > 0:
-                delay_arr[hist_blocks + plug.entry_step] = consuming / consumed_mass
+                # after roll(), plugs may have entered before the first column
+                delay_arr[max(hist_blocks + plug.entry_step, 0)] += consuming / consumed_mass
                 plug_outlet_temp = self.get_plug_temp(self.current_step - plug.entry_step, plug.entry_temp)
                 actual_outlet_temp += plug_outlet_temp * (consuming / consumed_mass)
                 entry_step_global += plug.entry_step_global * (consuming / consumed_mass)
@@ -430,9 +526,142 @@ class Edge(GridObject):
                 break
 
         assert fulfilled >= consumed_mass
+        if profiling.active is not None:
+            profiling.active.count_object(self, "plugs processed", processed)
+
+        return actual_outlet_temp, delay_arr, entry_step_global
+
+    def _push_plugs_with_kernels(self, consumed_mass: float, delay_arr: np.ndarray):
+        pushed, processed, actual_outlet_temp, entry_step_global, heat_out = self.kernels.push_plugs(
+            self.plug_cache.plugs,
+            consumed_mass,
+            self.current_step,
+            self.hist_blocks,
+            delay_arr,
+            self.interval_length,
+            self._thermal_time_constant,
+            self.t_ground,
+            self.heat_capacity,
+        )
+        self.plug_cache.pop(pushed)
+        self.heat_in_pipe[self.current_step] -= heat_out / self.energy_unit_conversion
+        if profiling.active is not None:
+            profiling.active.count_object(self, "plugs processed", processed)
 
         return actual_outlet_temp, delay_arr, entry_step_global
 
+    def roll(self, shift: int) -> None:
+        """
+        Entry steps of the plugs are counted from the start of the window, and only the plug
+        lists of the kept steps are saved. Columns of the delay matrix move with the entry
+        steps, the first column collects all water that entered before the window.
+        """
+        super().roll(shift)
+        for plugs in [self.plug_cache] + self.plug_cache_saver[shift:]:
+            if self.kernels is not None:
+                plugs.plugs[[ENTRY_STEP, ENTRY_STEP_GLOBAL]] -= shift
+                continue
+            for plug in plugs:
+                plug.entry_step -= shift
+                plug.entry_step_global -= shift
+        self.plug_cache_saver = self.plug_cache_saver[shift:]
+        if self.entry_step_global is not None:
+            self.entry_step_global -= shift
+
+        delay_matrix = self.delay_matrix
+        self.shift(delay_matrix.T, shift, np.nan)
+        delay_matrix[:, 0] += np.sum(delay_matrix[:, 1: shift + 1], axis=1)
+        delay_matrix[:, 1:] = self.shift(delay_matrix[:, 1:], shift, 0)
+        delay_matrix[-shift:] = np.nan
+
+    def plug_spread(self) -> Tuple[float, float]:
+        """
+        Largest difference of the entry temperatures of the plugs in the pipe, and of the mass
+        of the plugs relative to the newest one (except the oldest, partly pushed out plug).
+        Both are zero, once a constant flow has filled the pipe.
+        """
+        if self.kernels is not None:
+            plugs = self.plug_cache.plugs
+            temps, masses = plugs[ENTRY_TEMP], plugs[MASS]
+            mass_spread = np.max(np.abs(masses[1:-1] - masses[-1]), initial=0)
+            return float(np.ptp(temps)), float(mass_spread / max(masses[-1], 1e-12))
+
+        newest = self.plug_cache[0]
+        temps = [plug.entry_temp for plug in self.plug_cache]
+        mass_spread = max(
+            [abs(plug.mass - newest.mass) for plug in self.plug_cache[1:-1]], default=0
+        )
+        return max(temps) - min(temps), mass_spread / max(newest.mass, 1e-12)
+
+    def fast_forward(self, steps: int) -> None:
+        """
+        Every skipped step inserts a copy of the newest plug and pushes the same mass out
+        of the pipe, so the water in the pipe and the delays stay the same relative to the
+        current step.
+        """
+        step = self.current_step
+        super().fast_forward(steps)
+        newest = self.plug_cache[0]
+        consumed_mass = self.interval_length * self.mass_flow[0, step - 1]
+        delay_arr = self.delay_matrix[step - 1]
+        for i in range(1, steps + 1):
+            if self.kernels is not None:
+                self.plug_cache.append(
+                    consumed_mass,
+                    newest.entry_step + i,
+                    newest.entry_temp,
+                    newest.entry_step_global + i,
+                )
+                # only the plugs are pushed, the delays of the pushed water are set below
+                pushed = self.kernels.push_plugs(
+                    self.plug_cache.plugs,
+                    consumed_mass,
+                    self.current_step,
+                    self.hist_blocks,
+                    np.zeros_like(delay_arr),
+                    self.interval_length,
+                    self._thermal_time_constant,
+                    self.t_ground,
+                    self.heat_capacity,
+                )[0]
+                self.plug_cache.pop(pushed)
+                self.plug_cache_saver.append(self._saved_plugs())
+            else:
+                self._fast_forward_plugs(consumed_mass, newest, i)
+
+            # the water leaving the pipe entered it i steps later
+            self.delay_matrix[step - 1 + i, :i] = 0
+            self.delay_matrix[step - 1 + i, i:] = delay_arr[:-i]
+
+        self.entry_step_global += steps
+
+    def _fast_forward_plugs(self, consumed_mass: float, newest: Plug, i: int) -> None:
+        self.plug_cache.insert(
+            0,
+            Plug(
+                mass=consumed_mass,
+                entry_step=newest.entry_step + i,
+                entry_temp=newest.entry_temp,
+                entry_step_global=newest.entry_step_global + i,
+            ),
+        )
+        pushed = consumed_mass
+        while pushed > 0:
+            oldest = self.plug_cache[-1]
+            if oldest.mass <= pushed:
+                self.plug_cache.pop()
+                pushed -= oldest.mass
+            else:
+                oldest.mass -= pushed
+                pushed = 0
+        self.plug_cache_saver.append([plug.copy() for plug in self.plug_cache])
+
+    def transport_delay(self) -> int:
+        """
+        Number of steps since the oldest plug in the pipe entered it
+        """
+        return self.current_step - min(plug.entry_step for plug in self.plug_cache)
+
     def get_plugs_condition(self, time):
         conditions = []
         for plug in self.plug_cache_saver[time]:
@@ -459,6 +688,8 @@ class Edge(GridObject):
 
     def set_initial_plugs(self, plug_state):
         self.initial_plug_cache = []
+        # the pipe states do not include the mass flow
+        self.initial_mass_flow = np.nan
         max_entry_step = plug_state[0][-2]
 
         for mass, _, temp, entry_step, entry_step_global in plug_state:
@@ -471,9 +702,64 @@ class Edge(GridObject):
                 )
             )
 
+    def load_window(self, source: "Edge", start_step: int) -> None:
+        """
+        Takes over the plugs of the source edge at start_step as initial plugs.
+        Entry steps are shifted, so that start_step of the source becomes step 0.
+        Plugs are copied without rounding, in contrast to get_plugs_condition().
+        The mass flow of the step before start_step estimates the one of step 0.
+        """
+        if start_step == 0:
+            self.initial_mass_flow = source.initial_mass_flow
+        else:
+            self.initial_mass_flow = source.mass_flow[0, start_step - 1]
+        self.initial_plug_cache = [
+            Plug(
+                mass=plug.mass,
+                entry_step=plug.entry_step - start_step,
+                entry_temp=plug.entry_temp,
+                entry_step_global=plug.entry_step_global - start_step,
+            )
+            for plug in source.plug_cache_saver[start_step]
+        ]
+
+    def export_state(self, step: int) -> dict:
+        """
+        The plugs in the pipe at the start of step, (4, plugs) oldest first as in
+        PlugArray.plugs, with entry steps counted from step, and the mass flow of the step
+        before, see previous_mass_flow
+        """
+        plugs = self.plug_cache_saver[step]
+        if isinstance(plugs, PlugArray):
+            plugs = plugs.plugs.copy()
+        else:
+            plugs = np.array(
+                [
+                    (plug.mass, plug.entry_step, plug.entry_temp, plug.entry_step_global)
+                    for plug in reversed(plugs)
+                ],
+                dtype=float,
+            ).reshape(-1, 4).T
+        plugs[[ENTRY_STEP, ENTRY_STEP_GLOBAL]] -= step
+        mass_flow = self.initial_mass_flow if step == 0 else self.mass_flow[0, step - 1]
+
+        return {"plugs": plugs, "mass_flow": np.array(mass_flow, dtype=float)}
+
+    def import_state(self, state: dict) -> None:
+        """
+        Takes over the plugs as initial plugs, as one PlugArray without Plug objects, and the
+        mass flow that estimates the one of step 0
+        """
+        plugs = np.array(state["plugs"], dtype=float)
+        assert np.isclose(np.sum(plugs[MASS]), self._mass_in_pipe)
+        self.initial_plug_cache = PlugArray(plugs)
+        self.initial_mass_flow = float(state.get("mass_flow", np.nan))
+
     def debug(self, csv: bool = False) -> None:
         print("{} {}".format(type(self).__name__, self.id))
 
+        from beautifultable import BeautifulTable  # type: ignore
+
         ts = os.get_terminal_size()
         table = BeautifulTable(
             maxwidth=ts.columns - 1,
@@ -519,7 +805,7 @@ class Edge(GridObject):
 
     @property
     def delay_loss_matrix(self) -> np.ndarray:
-        hist_len = len(self.initial_plug_cache)
+        hist_len = self.hist_blocks
         delay_loss_matrix = np.full(
             (self.blocks, self.blocks),
             0.0,
@@ -0,0 +1,158 @@
+# Skips the steps of quasi-steady periods, in which the grid would repeat its last step
+
+from typing import List, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+from .grid_object import GridObject
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# inputs are compared in chunks of steps, so that finding the end of a steady period
+# does not scan the rest of the horizon in every step
+chunk_size = 64
+
+
+class FastForward:
+    """
+    Passed to Grid.run, advances several steps at once while the grid is in a steady state:
+    the inputs of all objects (demands, controls, prices, valve positions) stay within
+    relative_tolerance of the last solved step, temperatures and mass flows did not change
+    in the last step, and every pipe is filled with plugs of the same entry temperature
+    (within temp_tolerance) and mass. The skipped steps repeat the last step, and the plugs
+    move on in closed form (see Edge.fast_forward), as the aging of a plug only depends on
+    its entry step. Once an input changes, the grid is solved step by step again.
+
+    The error of a skipped step is bounded by the spreads that were tolerated: a deviation of
+    the entry temperatures in a pipe reaches its outlet at most undamped, and is passed on
+    through every pipe downstream, so temp_error_bound (in °C) adds up the spreads of all
+    pipes (plus the change of the last step). mass_flow_error_bound is relative.
+    """
+
+    def __init__(
+        self,
+        temp_tolerance: float = 1e-3,  # in °C
+        relative_tolerance: float = 1e-6,
+    ) -> None:
+        self.temp_tolerance = temp_tolerance
+        self.relative_tolerance = relative_tolerance
+
+        self.skipped_steps = 0
+        self.stretches: List[Tuple[int, int]] = []  # (first skipped step, skipped steps)
+        self.temp_error_bound = 0.0
+        self.mass_flow_error_bound = 0.0
+        # the pipe that was not steady in the last check is checked first
+        self._unsteady_edge = 0
+        self._inputs: List[np.ndarray] = []
+        self._changes = np.zeros(0, dtype=int)  # steps in which an input changes
+
+    def _constant(self, values: np.ndarray, reference: np.ndarray) -> np.ndarray:
+        """
+        True for every step in values (last axis), that equals the reference step
+        """
+        return np.isclose(
+            values,
+            reference,
+            rtol=self.relative_tolerance,
+            atol=self.relative_tolerance,
+            equal_nan=True,
+        ).reshape(-1, values.shape[-1]).all(axis=0)
+
+    def prepare(self, grid: "Grid", start_step: int, end_step: int) -> None:
+        """
+        Finds the steps of a run, in which any input changes from the step before.
+        Called by Grid.run, once the inputs of the run are set.
+        """
+        self._inputs = [values for node in grid.nodes for values in node.steady_inputs()]
+        # changes from the step before start_step count as well
+        first = max(start_step - 1, 0)
+        changed = np.zeros(max(end_step - first, 1), dtype=bool)
+        changed[0] = first == 0
+        for values in self._inputs if len(changed) > 1 else []:
+            changed[1:] |= ~self._constant(
+                values[..., first + 1: end_step], values[..., first: end_step - 1]
+            )
+        self._changes = np.flatnonzero(changed) + first
+
+    def _constant_steps(self, step: int, end_step: int) -> int:
+        """
+        Number of steps from step on, in which all inputs equal the step before step. Inputs
+        that drift slowly are compared to that step in chunks, up to the next change.
+        """
+        next_change = np.searchsorted(self._changes, step, side="right")
+        if next_change < len(self._changes):
+            end_step = min(end_step, int(self._changes[next_change]))
+
+        start = step
+        while start < end_step:
+            end = min(start + chunk_size, end_step)
+            constant = np.ones(end - start, dtype=bool)
+            for values in self._inputs:
+                constant &= self._constant(values[..., start:end], values[..., step - 1: step])
+            if not constant.all():
+                return start - step + int(np.argmin(constant))
+            start = end
+
+        return int(end_step - step)
+
+    def steady_steps(self, grid: "Grid", end_step: int) -> int:
+        """
+        Number of steps from the current step on, that can be skipped
+        """
+        step = GridObject._current_step
+        if step < 2 or step >= end_step:
+            return 0
+
+        # most steps are not steady, so the cheapest checks come first
+        changes = self._changes
+        next_change = np.searchsorted(changes, step)
+        if next_change < len(changes) and changes[next_change] == step:
+            return 0
+
+        # temperatures and mass flows of the last two steps
+        state = grid.state.data[:2, :, step - 2: step]
+        temp_change = np.nanmax(np.abs(state[0, :, 1] - state[0, :, 0]), initial=0)
+        if temp_change > self.temp_tolerance:
+            return 0
+        mass_flow = state[1, :, 1]
+        mass_flow_change = np.nanmax(
+            np.abs(state[1, :, 1] - state[1, :, 0])
+            / np.maximum(np.abs(mass_flow), self.relative_tolerance),
+            initial=0,
+        )
+        if mass_flow_change > self.relative_tolerance:
+            return 0
+
+        temp_spread, mass_spread = 0.0, 0.0
+        edges = grid.edges
+        first = min(self._unsteady_edge, len(edges) - 1)
+        for i in [first] + list(range(first)) + list(range(first + 1, len(edges))):
+            edge_temp_spread, edge_mass_spread = edges[i].plug_spread()
+            if (
+                edge_temp_spread > self.temp_tolerance
+                or edge_mass_spread > self.relative_tolerance
+            ):
+                self._unsteady_edge = i
+                return 0
+            temp_spread += edge_temp_spread
+            mass_spread = max(mass_spread, edge_mass_spread)
+
+        steps = self._constant_steps(step, end_step)
+        self.temp_error_bound = max(self.temp_error_bound, temp_spread + temp_change)
+        self.mass_flow_error_bound = max(
+            self.mass_flow_error_bound, mass_spread + mass_flow_change
+        )
+
+        return steps
+
+    def advance(self, grid: "Grid", steps: int) -> None:
+        """
+        Repeats the last step in the next steps of all objects
+        """
+        self.stretches.append((grid.step_offset + GridObject._current_step, steps))
+        self.skipped_steps += steps
+
+        for obj in grid.nodes + grid.edges:
+            obj.fast_forward(steps)
+
+        GridObject._current_step += steps
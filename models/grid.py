@@ -3,17 +3,24 @@
 
 import numpy as np  # type: ignore
 
-from typing import List, Iterator, Tuple, Dict, Optional, Union
+from typing import Callable, List, Iterator, Tuple, Dict, Optional, Union, TYPE_CHECKING
 from functools import cached_property
 
 from .node import Node
 from .edge import Edge
 from .grid_object import GridObject
+from .state_store import StateStore
 from .timing import Timing
-from .heat_exchanger import timing as heat_exchanger_timing
-from .edge import timing as edge_timing
+from .profiling import Profiler
+from .result_sink import ResultSink
+from .fast_forward import FastForward
+from .grid_state import GridState
+from . import kernels
 from ..interfaces.grid_interface import GridInterface
 
+if TYPE_CHECKING:
+    from .hydraulics import HydraulicNetwork
+
 import sys
 import traceback
 
@@ -30,6 +37,18 @@ class Grid(GridInterface):
         self._solvable_objects: List[Tuple[GridObject, int, float]] = []
 
         self._interval_length = interval_length
+        # temp, mass flow and pressure of all objects, filled in clear()
+        self.state = StateStore()
+        # incidence matrix of the network, see hydraulics
+        self._hydraulics: Optional["HydraulicNetwork"] = None
+        # number of independent loops, whose flows are split by the hydraulics, see _count_loops
+        self.loops = 0
+        # set while the grid is profiled, see profile()
+        self.profiler: Optional[Profiler] = None
+        # steps dropped by roll(), step 0 of the arrays is this step of the whole run
+        self.step_offset = 0
+        # implementation of the plug propagation and heat exchangers, see set_backend()
+        self.backend = "python"
 
     def solvable(self, object: GridObject, slot: int, mass_flow: float) -> None:
         """
@@ -48,6 +67,8 @@ class Grid(GridInterface):
             self.solvable,
             self._interval_length,
         )
+        if self.backend != "python":
+            self._set_kernels(node, kernels.get(self.backend))
 
     def add_edge(self, edge: Edge) -> None:
         self.edges.append(edge)
@@ -55,6 +76,26 @@ class Grid(GridInterface):
             self.solvable,
             self._interval_length,
         )
+        if self.backend != "python":
+            self._set_kernels(edge, kernels.get(self.backend))
+
+    def set_backend(self, backend: str) -> None:
+        """
+        Selects the implementation of the plug propagation in the pipes and of the Newton
+        method of the heat exchangers: "python" (reference), "numpy" or "numba" (numpy if
+        numba is not installed), see kernels.py. Can be changed between runs.
+        """
+        selected = kernels.get(backend)
+        self.backend = backend
+        for obj in self.nodes + self.edges:
+            self._set_kernels(obj, selected)
+
+    @staticmethod
+    def _set_kernels(obj: GridObject, selected: Optional[kernels.Kernels]) -> None:
+        if isinstance(obj, Edge):
+            obj.set_kernels(selected)
+        elif hasattr(obj, "heat_exchanger"):
+            obj.heat_exchanger.kernels = selected
 
     def link_nodes(self, print_debug: bool = False) -> None:
         """pressure_load
@@ -80,15 +121,95 @@ class Grid(GridInterface):
             node = self.nodes[i]
             node.link(tuple(edges))
 
+        self._hydraulics = None
+        self.loops = self._count_loops()
+
         if print_debug:
             print("Linking: {:.1f} sec".format(timing.get()))
 
+    def _count_loops(self) -> int:
+        """
+        Edges minus hydraulic nodes plus connected parts of the network, see HydraulicNetwork,
+        without assembling it: branches and junctions join their slots into one node.
+        """
+        parent: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        def root(key: Tuple[int, int]) -> Tuple[int, int]:
+            while parent.setdefault(key, key) != key:
+                key = parent[key]
+            return key
+
+        def hydraulic_node(node: Node, slot: int) -> Tuple[int, int]:
+            return (node.id, 0 if type(node).__name__ in ("Branch", "Junction") else slot)
+
+        for node in self.nodes:
+            for slot in range(len(node.slots)):
+                root(hydraulic_node(node, slot))
+        for edge in self.edges:
+            (from_node, from_slot), (to_node, to_slot) = edge.nodes
+            parent[root(hydraulic_node(from_node, from_slot))] = root(
+                hydraulic_node(to_node, to_slot)
+            )
+
+        parts = len({root(key) for key in list(parent)})
+        return len(self.edges) - len(parent) + parts
+
+    @property
+    def hydraulics(self) -> "HydraulicNetwork":
+        """
+        The hydraulic network of the linked grid, assembled on first use, as it needs scipy
+        """
+        if self._hydraulics is None:
+            from .hydraulics import HydraulicNetwork
+
+            self._hydraulics = HydraulicNetwork(self)
+
+        return self._hydraulics
+
+    def solve_hydraulics(self, step: Optional[int] = None, warm_start: bool = True):
+        """
+        Solves the mass flows and pressures of the whole network with the mass flows the
+        consumers demanded in step (by default the last solved step), see HydraulicNetwork.
+        Unlike the callback model, this also holds for networks with loops.
+        Returns the mass flow of each edge, the inlet and outlet pressure of each edge
+        (shape (2, edges)) and the pump head of each producer and transfer.
+        """
+        if step is None:
+            step = GridObject._current_step - 1
+
+        demand_flows = self.hydraulics.demand_flows_at(step)
+        if np.any(np.isnan(demand_flows)):
+            raise Exception("The mass flows of the demands in step {} are not solved".format(step))
+
+        mass_flow, pressure, pump_head = self.hydraulics.solve(
+            demand_flows, warm_start=warm_start
+        )
+        return mass_flow, self.hydraulics.edge_pressures(pressure), pump_head
+
+    def split_flows(self) -> None:
+        """
+        The callback model cannot split the mass flow among the edges of a loop, as it is
+        not determined by the consumers. In grids with loops, the hydraulic network is solved
+        at the start of every step, with the mass flows of the demands of the step before
+        (warm started from its pressures), and sets the valve positions of all branches and
+        junctions to its split, see HydraulicNetwork.split.
+        """
+        step = GridObject._current_step
+        mass_flow, _, _ = self.hydraulics.solve(self.hydraulics.estimated_demand_flows(step))
+        self.hydraulics.split(mass_flow, step)
+
     def reset(
         self,
         demands: Optional[list] = None,
         e_price: Optional[list] = None,
         pipe_states: Optional[list] = None,
+        in_place: bool = False,
     ) -> None:
+        """
+        If in_place is true, the arrays of the previous run are refilled instead of
+        reallocated (as long as blocks did not change), which saves the allocation churn
+        of many short runs. Arrays obtained from the previous run are overwritten then.
+        """
         if demands is not None:
             for demand, consumer in zip(demands, self.consumers):
                 consumer.update_demand(demand)
@@ -101,7 +222,30 @@ class Grid(GridInterface):
             for price, producer in zip(e_price, self.producers):
                 producer.e_price = np.array(price)
 
-        self.clear()
+        self.clear(in_place=in_place)
+
+    def load_window(self, source: "Grid", start_step: int) -> None:
+        """
+        Carries the state of the source grid at start_step over into this grid, which has to
+        be built with the same topology (same order of nodes and edges), but may have fewer
+        blocks. The plugs in the pipes are taken over without rounding, together with the mass
+        flows of the step before, consumer demands and prices are cut out of the source
+        instead of being recomputed.
+
+        Edges take over their initial plugs before clearing, nodes take over their inputs
+        after clearing, as clearing a CHP drops its ramp history.
+        """
+        assert len(self.nodes) == len(source.nodes)
+        assert len(self.edges) == len(source.edges)
+
+        for edge, source_edge in zip(self.edges, source.edges):
+            edge.load_window(source_edge, start_step)
+
+        # the planning grid is reloaded for every window, so its arrays are reused
+        self.clear(in_place=True)
+
+        for node, source_node in zip(self.nodes, source.nodes):
+            node.load_window(source_node, start_step)
 
     def run(
         self,
@@ -111,8 +255,13 @@ class Grid(GridInterface):
         producer_ids: Optional[list] = None,
         valve_pos: Optional[dict] = None,
         end_step: Optional[int] = None,
+        sink: Optional[ResultSink] = None,
+        fast_forward: Optional[FastForward] = None,
     ) -> None:
-
+        """
+        sink: writes the results of each completed chunk of steps to disk, see ResultSink
+        fast_forward: skips the steps of steady periods and counts them, see FastForward
+        """
         opt_time = GridObject._current_step
         if producer_ids is None:
             producer_ids = [p.id for p in self.producers]
@@ -150,29 +299,147 @@ class Grid(GridInterface):
                         assert run_step == 1
                         producer.E[opt_time] = e
                     else:
-                        assert run_step > 1
+                        assert len(e) == run_step
                         producer.E[opt_time: (opt_time + run_step)] = e
 
         if valve_pos is not None:
+            # per step (the same for all side slots), or per side slot (rows) and step
             for n_id, v_pos in valve_pos.items():
                 split = self.get_object(n_id)
-                if not isinstance(e, (list, np.ndarray)):
+                if not isinstance(v_pos, (list, np.ndarray)):
                     assert run_step == 1
-                    split.valve_position[:,opt_time] = v_pos
+                    split.valve_position[:, opt_time] = v_pos
                 else:
-                    assert run_step > 1
+                    assert np.shape(v_pos)[-1] == run_step
                     split.valve_position[:, opt_time : (opt_time + run_step)] = v_pos
 
         start_step = opt_time
         if end_step is None:
             end_step = min(start_step + run_step, self.blocks)
 
+        if fast_forward is not None:
+            fast_forward.prepare(self, start_step, end_step)
+
         while opt_time < end_step:
-            self._solve()
-            opt_time += 1
+            steps = 0
+            if fast_forward is not None:
+                steps = fast_forward.steady_steps(self, end_step)
+
+            if steps > 0:
+                fast_forward.advance(self, steps)
+                opt_time += steps
+            else:
+                self._solve()
+                opt_time += 1
+            if sink is not None:
+                sink.step_completed(self)
+
+        if sink is not None:
+            sink.flush(self)
 
         return None
 
+    def transport_delay(self) -> int:
+        """
+        Longest time in steps, that water which is still in a pipe has spent in it
+        """
+        return max([edge.transport_delay() for edge in self.edges], default=0)
+
+    def roll(
+        self,
+        keep: Optional[int] = None,
+        sink: Optional[ResultSink] = None,
+        source: Optional[Callable[[int, int], dict]] = None,
+    ) -> int:
+        """
+        Drops all but the last keep completed steps from the arrays of all objects, so that
+        the grid can run on in a window of blocks steps. keep defaults to the longest transport
+        delay in the pipes, so that the delay matrices still resolve every plug, and at least
+        one step for the ramp checks of the producers. The results of the dropped steps are
+        written to the sink first. The inputs of the freed steps are loaded from the source,
+        see run_rolling(). Returns the number of dropped steps.
+        """
+        if keep is None:
+            keep = max(self.transport_delay(), 1)
+
+        shift = GridObject._current_step - keep
+        if shift < 1:
+            raise Exception(
+                "A window of {} steps is too short to keep {} steps".format(self.blocks, keep)
+            )
+
+        if sink is not None:
+            sink.flush(self)
+
+        for obj in self.nodes + self.edges:
+            obj.roll(shift)
+
+        GridObject._current_step -= shift
+        self.step_offset += shift
+
+        if source is not None:
+            self.set_inputs(self.blocks - shift, source)
+
+        return shift
+
+    def set_inputs(self, start_step: int, source: Callable[[int, int], dict]) -> dict:
+        """
+        Loads the demands and electricity prices from start_step to the end of the window
+        (or less, if the source ends earlier) from the source, see run_rolling().
+        Returns the inputs.
+        """
+        inputs = source(self.step_offset + start_step, self.step_offset + self.blocks)
+        if inputs.get("demands") is not None:
+            for demand, consumer in zip(inputs["demands"], self.consumers):
+                consumer.set_demand(start_step, demand)
+
+        if inputs.get("e_price") is not None:
+            for price, producer in zip(inputs["e_price"], self.producers):
+                producer.e_price = np.array(producer.e_price, dtype=float)
+                producer.e_price[start_step: start_step + len(price)] = price
+
+        return inputs
+
+    def run_rolling(
+        self,
+        steps: int,
+        source: Callable[[int, int], dict],
+        sink: Optional[ResultSink] = None,
+        keep: Optional[int] = None,
+        fast_forward: Optional[FastForward] = None,
+    ) -> None:
+        """
+        Runs the grid for steps steps, that may be many more than blocks. Whenever the window
+        of blocks steps is completed, it rolls on (see roll()), so memory and time per step do
+        not depend on steps. Results of the whole run are only kept by the sink.
+
+        source(start, end) is called with the steps [start, end) of the whole run that enter
+        the window, and returns a dict of the inputs of these steps, each a list over the
+        consumers or producers: "demands", "e_price", and the controls of run(): "heat" or
+        "temp", and "electricity". It starts with the window of a newly cleared grid.
+        """
+        assert GridObject._current_step == 0 and self.step_offset == 0
+
+        def bounded_source(start: int, end: int) -> dict:
+            return source(start, min(end, steps))
+
+        inputs = self.set_inputs(0, bounded_source)
+        while True:
+            end_step = min(steps - self.step_offset, self.blocks)
+            self.run(
+                heat=inputs.get("heat"),
+                temp=inputs.get("temp"),
+                electricity=inputs.get("electricity"),
+                end_step=end_step,
+                sink=sink,
+                fast_forward=fast_forward,
+            )
+            if self.step_offset + GridObject._current_step >= steps:
+                break
+
+            shift = self.roll(keep, sink)
+            inputs = self.set_inputs(self.blocks - shift, bounded_source)
+
     def get_object_status(
         self,
         object_ids: Optional[List[int]] = None,
@@ -197,6 +464,7 @@ class Grid(GridInterface):
             pressure = obj.pressure[:, start_step:end_step] if get_pressure else []
             violation = {}
             if get_violation:
+                obj.evaluate(end_step)
                 for key, arr in obj.violations.items():
                     violation.update({key: arr[start_step:end_step]})
 
@@ -210,6 +478,46 @@ class Grid(GridInterface):
 
         return objects_status
 
+    def get_state_arrays(
+        self,
+        object_ids: Optional[List[int]] = None,
+        start_step: int = 0,
+        end_step: Optional[int] = None,
+        quantities: Tuple[str, ...] = StateStore.quantities,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[int, slice]]:
+        """
+        Stacked alternative to get_object_status: returns one (rows, steps) array per quantity,
+        and the rows of each object within these arrays. If object_ids is None, all nodes
+        and edges are returned. The arrays are views into the state store of the grid,
+        unless the objects are not stored next to each other (e.g. [consumer, producer]).
+        """
+        end_step = GridObject._current_step if end_step is None else end_step
+        arrays = {
+            quantity: self.state.get(quantity, object_ids, start_step, end_step)
+            for quantity in quantities
+        }
+
+        return arrays, self.state.row_offsets(object_ids)
+
+    def get_violations(
+        self,
+        start_step: int = 0,
+        end_step: Optional[int] = None,
+    ) -> Tuple[np.ndarray, List[int], Tuple[str, ...]]:
+        """
+        Returns the violations of all objects as one (objects, kinds, steps) array (a view
+        into the state store), the object ids of its rows and the kinds of violations.
+        Kinds that an object does not record are nan.
+        """
+        end_step = GridObject._current_step if end_step is None else end_step
+        for producer in self.producers:
+            producer.evaluate(end_step)
+        return (
+            self.state.violations[:, :, start_step:end_step],
+            self.state.object_ids,
+            self.state.violation_kinds,
+        )
+
     def get_pipe_states(self, time_step=0):
         pipe_conditions = []
         for edge in self.edges:
@@ -217,33 +525,54 @@ class Grid(GridInterface):
 
         return pipe_conditions
 
+    def export_state(self, time_step: Optional[int] = None) -> GridState:
+        """
+        Lossless, binary alternative to get_pipe_states: the plugs in the pipes, the mass
+        flows of the step before and the state of the nodes at the start of time_step (the
+        current step by default, i.e. the end of the run), to warm start another run with
+        load_state()
+        """
+        return GridState.of(self, GridObject._current_step if time_step is None else time_step)
+
+    def load_state(self, state: GridState, in_place: bool = False) -> None:
+        """
+        Continues from a state of a grid with the same topology (see export_state) in step 0,
+        and clears the grid like reset(), so demands and prices are set by reset() before.
+        Edges take over their initial plugs before clearing, nodes take over their state
+        after clearing, as in load_window().
+        """
+        assert len(state.plugs) == len(self.edges)
+        assert len(state.nodes) == len(self.nodes)
+
+        for plugs, mass_flow, edge in zip(state.plugs, state.mass_flows, self.edges):
+            edge.import_state({"plugs": plugs, "mass_flow": mass_flow})
+
+        self.clear(in_place=in_place)
+
+        for node_state, node in zip(state.nodes, self.nodes):
+            node.import_state(node_state)
+
     def get_edge_heat_and_loss(
         self,
         edge_ids: Optional[List[int]] = None,
         level: Optional[int] = 0,
         level_time: Optional[int] = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
     ) -> Union[list, Dict[Union[int, str], list]]:
+        """
+        Heat in the pipes and heat loss of the edges in the steps [start_step, end_step).
+        Sums (level_time 0) are taken from the running sums of the edges, see PrefixSums.
+        """
         heat_dict = {}
         for edge in self.edges:
             if edge_ids is not None:
                 if edge.id not in edge_ids:
                     continue
-            if level_time == 0:
-                heat_dict[edge.id] = [
-                    np.sum(edge.heat_in_pipe[: GridObject.current_step]),
-                    np.sum(edge.heat_loss[: GridObject.current_step]),
-                ]
-            elif level_time == 1:
-                heat_dict[edge.id] = [
-                    edge.heat_in_pipe[: GridObject._current_step],
-                    edge.heat_loss[: GridObject._current_step],
-                ]
-            else:
-                assert level_time == 2
-                heat_dict[edge.id] = [
-                    edge.heat_in_pipe[GridObject._current_step - 1],
-                    edge.heat_loss[GridObject._current_step - 1],
-                ]
+            heat_dict[edge.id] = [
+                edge.window_values(name, level_time, start_step, end_step)
+                for name in ("heat_in_pipe", "heat_loss")
+            ]
 
         if level == 2:
             return heat_dict
@@ -282,7 +611,13 @@ class Grid(GridInterface):
         producer_ids: Optional[List[int]] = None,
         level: Optional[int] = 0,
         level_time: Optional[int] = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
     ) -> Union[float, Dict]:
+        """
+        Costs and profit of the producers in the steps [start_step, end_step), see
+        Producer.get_margin
+        """
         margin3 = {}
         if producer_ids is None:
             producer_queue = [producer for producer in self.producers]
@@ -290,7 +625,7 @@ class Grid(GridInterface):
             producer_queue = [self.get_object(id) for id in producer_ids]
 
         for p in producer_queue:
-            margin3[p.id] = p.get_margin(level_time)
+            margin3[p.id] = p.get_margin(level_time, start_step, end_step)
 
         if level == 3:
             return margin3
@@ -343,46 +678,39 @@ class Grid(GridInterface):
         return s_supply_temp
 
 
-    def clear(self, print_debug: bool = False) -> None:
+    def clear(self, print_debug: bool = False, in_place: bool = False) -> None:
         timing = Timing()
-        heat_exchanger_timing.restart()
-        edge_timing.restart()
 
         GridObject.reset_step()
+        self.step_offset = 0
+
+        self.state.bind(self.nodes + self.edges, self.blocks, in_place)
 
         for node in self.nodes:
-            node.clear()
+            node.clear(in_place)
 
         for edge in self.edges:
-            edge.clear()
+            edge.clear(in_place)
 
         if print_debug:
             print("Clearing: {:.1f} sec".format(timing.get()))
 
-    def solve_one_step(self, heat=None, temp=None):
-        if heat is not None:
-            for h, producer in zip(heat, self.producers):
-                producer.q[GridObject._current_step] = h
-        else:
-            assert temp is not None
-            for t, producer in zip(temp, self.producers):
-                producer.temp[0, GridObject._current_step] = t
+    def solve_one_step(
+        self, heat=None, temp=None, get_pipe_states: bool = True, electricity=None
+    ):
+        self.set_one_step_controls(heat, temp, electricity)
         condition_flag = self._solve()  # step is increased here
 
-        inlet_temp, outlet_temp, mass_flow = [], [], []
-        pipe_conditions = []
-        for edge in self.edges:
-            inlet_temp.append(edge.temp[0, GridObject._current_step - 1])
-            outlet_temp.append(edge.temp[1, GridObject._current_step - 1])
-            mass_flow.append(edge.mass_flow[GridObject._current_step - 1])
-            pipe_conditions.append(edge.get_plugs_condition())
+        step = GridObject._current_step - 1
+        inlet_temp = np.array([edge.temp[0, step] for edge in self.edges])
+        outlet_temp = np.array([edge.temp[1, step] for edge in self.edges])
+        mass_flow = np.array([edge.mass_flow[:, step] for edge in self.edges])
+        heat_delivered = np.array([c.q[step] for c in self.consumers])
 
-        heat_delivered = [c.q[GridObject._current_step - 1] for c in self.consumers]
-
-        inlet_temp = np.array(inlet_temp)
-        outlet_temp = np.array(outlet_temp)
-        mass_flow = np.array(mass_flow)
-        heat_delivered = np.array(heat_delivered)
+        # building the plug lists is expensive, so it can be skipped
+        pipe_conditions = None
+        if get_pipe_states:
+            pipe_conditions = self.get_pipe_states(GridObject._current_step)
 
         return (
             inlet_temp,
@@ -393,6 +721,45 @@ class Grid(GridInterface):
             condition_flag,
         )
 
+    def set_one_step_controls(self, heat=None, temp=None, electricity=None) -> None:
+        """
+        Sets the heat or the supply temperature, and optionally the electricity production,
+        of each producer for the current step.
+        """
+        if electricity is not None:
+            for e, producer in zip(electricity, self.producers):
+                producer.E[GridObject._current_step] = e
+
+        if heat is not None:
+            for h, producer in zip(heat, self.producers):
+                producer.q[GridObject._current_step] = h
+        else:
+            assert temp is not None
+            for t, producer in zip(temp, self.producers):
+                producer.temp[1, GridObject._current_step] = t
+
+    @property
+    def observation_size(self) -> int:
+        return 3 * len(self.edges) + len(list(self.consumers))
+
+    def write_observation(self, out: np.ndarray) -> np.ndarray:
+        """
+        Writes the state of the last solved step into the preallocated array out:
+        inlet temperature, outlet temperature and mass flow of each edge,
+        followed by the delivered heat of each consumer.
+        """
+        step = GridObject._current_step - 1
+        edge_number = len(self.edges)
+        for i, edge in enumerate(self.edges):
+            out[i] = edge.temp[0, step]
+            out[edge_number + i] = edge.temp[1, step]
+            out[2 * edge_number + i] = edge.mass_flow[0, step]
+
+        for i, consumer in enumerate(self.consumers):
+            out[3 * edge_number + i] = consumer.q[step]
+
+        return out
+
     # the function should only be called after solve_one_step
     def get_temp_at_nodes(self):
         inlet_temp, outlet_temp = [], []
@@ -429,6 +796,9 @@ class Grid(GridInterface):
         return np.array(condition_flags)
 
     def _solve(self) -> None:
+        if self.loops:
+            self.split_flows()
+
         # to avoid high recursion depth, collect every solvable node/ edge here
         for consumer in self.consumers:
             consumer.solve()
@@ -478,15 +848,17 @@ class Grid(GridInterface):
         for edge in self.edges:
             edge.debug(csv=csv)
 
-    @staticmethod
-    def debug_solve(timing: Timing):
+    def debug_solve(self, timing: Timing):
         print("Solving: {:.1f} sec".format(timing.get()))
-        print(
-            "..of which heat exchanger: {:.1f} sec".format(
-                heat_exchanger_timing.get()
-            )
-        )
-        print("..of which long edge solving: {:.1f} sec".format(edge_timing.get()))
+        if self.profiler is not None:
+            print(self.profiler.table())
+
+    def profile(self, trace: bool = False) -> Profiler:
+        """
+        Returns a profiler that records the hot paths of this grid while it is solved within
+        a with block. See Profiler, trace keeps every call for a Chrome trace.
+        """
+        return Profiler(self, trace)
 
     def unfulfilled_demand(self, up_to_step: Optional[int]) -> float:
         unfulfilled_demand: float = 0
@@ -508,10 +880,7 @@ class Grid(GridInterface):
     @property
     def producers(self) -> Iterator[Node]:
         return filter(
-            lambda n: (
-                type(n).__name__ == "Producer"
-                or "Producer" in [base.__name__ for base in type(n).__bases__]
-            ),
+            lambda n: "Producer" in [base.__name__ for base in type(n).__mro__],
             self.nodes,
         )
 
@@ -531,7 +900,7 @@ class Grid(GridInterface):
     def producers_id(self):
         ids = self.get_id_name_all_obj()
         return [
-            id for id, name in ids.items() if (name == "CHP") | (name == "producer")
+            id for id, name in ids.items() if name in ("CHP", "CHPFleet", "producer")
         ]
 
     @property
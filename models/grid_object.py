@@ -1,12 +1,19 @@
 # Nodes and edges are child classes of this GridObject
 
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, List, Tuple
+import numpy as np  # type: ignore
+
+from .prefix_sums import PrefixSums
 
 
 class GridObject:
     _object_counter: int = 0
     _current_step: int = 0
     _safety_check = True
+    # the kinds of violations the object type records, one row each in violation_array
+    violation_kinds: Tuple[str, ...] = ()
+    # per-step arrays, whose sums over windows of steps are kept in prefix_sums
+    summed_quantities: Tuple[str, ...] = ()
 
     def __init__(
         self,
@@ -19,6 +26,13 @@ class GridObject:
             self.id = id
 
         self.solvable_callback, self.interval_length = None, None
+        self.violation_array: Optional[np.ndarray] = None
+        self.violations: Optional[dict] = None
+        # views into the state store of the grid, see StateStore.bind
+        self._columns: Optional[dict] = None
+        # per-step arrays allocated by _refill and their fill value, shifted by roll()
+        self._rolling: Dict[str, float] = {}
+        self.prefix_sums: Optional[PrefixSums] = None
 
     def add_to_grid(
         self,
@@ -39,16 +53,193 @@ class GridObject:
     def current_step(self) -> int:
         return GridObject._current_step
 
-    def clear(self) -> None:
+    def clear(self, in_place: bool = False) -> None:
         """
-        To be overridden by child class
+        To be overridden by child class.
+        If in_place is true, arrays of a previous run are refilled instead of reallocated,
+        as long as their shape did not change.
+        """
+
+    def _refill(
+        self,
+        name: str,
+        shape: tuple,
+        fill_value: float = np.nan,
+        in_place: bool = False,
+        rolling: bool = True,
+    ) -> np.ndarray:
+        """
+        Returns the array stored in attribute name, filled with fill_value, if it
+        already has the given shape and in_place is true. Otherwise, a new array is allocated.
+        Quantities kept in the state store of the grid are always the views into the store.
+        Arrays with one column per step are shifted by roll(), unless rolling is false.
         """
+        if rolling and shape[-1] == self.blocks:
+            self._rolling[name] = fill_value
+
+        if self._columns is not None and name in self._columns:
+            array = self._columns[name]
+            assert array.shape == shape
+            array.fill(fill_value)
+            return array
+
+        array = getattr(self, name, None)
+        if in_place and isinstance(array, np.ndarray) and array.shape == shape:
+            array.fill(fill_value)
+            return array
+
+        return np.full(shape, fill_value, dtype=float)
 
     def debug(self, csv: bool = False) -> None:
         """
         To be overridden by child class
         """
 
+    def _clear_violations(self, in_place: bool = False) -> None:
+        """
+        Preallocates one row of violation_array per kind of violation. violations maps each
+        kind to its row. In a grid, violation_array is a view into the violations of the
+        state store, which has one row per kind of violation occurring in the grid.
+        """
+        if self._columns is not None and "violations" in self._columns:
+            self.violation_array = self._columns["violations"]
+            self.violation_array.fill(np.nan)
+            self._rolling["violation_array"] = np.nan
+            kinds = self._columns["violation_kinds"]
+        else:
+            self.violation_array = self._refill(
+                "violation_array",
+                (len(self.violation_kinds), self.blocks),
+                in_place=in_place,
+            )
+            kinds = self.violation_kinds
+
+        self.violations = {
+            kind: self.violation_array[kinds.index(kind)] for kind in self.violation_kinds
+        }
+
+    def _clear_prefix_sums(self) -> None:
+        """
+        Starts the running sums of summed_quantities over, see PrefixSums
+        """
+        if self.prefix_sums is None:
+            self.prefix_sums = PrefixSums(self, self.summed_quantities)
+        else:
+            self.prefix_sums.clear()
+
+    def evaluate(self, end_step: Optional[int] = None) -> None:
+        """
+        To be overridden by child class.
+        Computes the results that the object derives lazily from its solved steps, up to
+        end_step (the current step by default), before they are read.
+        """
+
+    def window_values(
+        self,
+        name: str,
+        level_time: int = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
+    ):
+        """
+        Values of one of the summed_quantities in the completed steps [start_step, end_step):
+        their sum for level_time 0, the values of every step for 1, of the last step for 2
+        """
+        if end_step is None:
+            end_step = self.current_step
+        self.evaluate(end_step)
+        if level_time == 0:
+            return self.prefix_sums.sum(name, start_step, end_step)
+        elif level_time == 1:
+            return getattr(self, name)[start_step:end_step]
+
+        assert level_time == 2
+        return getattr(self, name)[end_step - 1]
+
+    def roll(self, shift: int) -> None:
+        """
+        Drops the first shift steps of all per-step arrays, moving the later steps to the
+        front and refilling the freed steps at the end, so that the object can keep running
+        within a window of blocks steps. Child classes roll their inputs and other state.
+        """
+        for name, fill_value in self._rolling.items():
+            self.shift(getattr(self, name), shift, fill_value)
+        if self.prefix_sums is not None:
+            self.prefix_sums.roll(shift)
+
+    def fast_forward(self, steps: int) -> None:
+        """
+        Repeats the last solved step in the next steps, for a grid in steady state, see
+        FastForward. Child classes advance the state that does not stay constant.
+        """
+        step = self.current_step
+        for name in self._rolling:
+            values = getattr(self, name)
+            values[..., step: step + steps] = values[..., step - 1: step]
+
+    def steady_inputs(self) -> List[np.ndarray]:
+        """
+        To be overridden by child class.
+        The per-step inputs of the object, that have to stay constant for a steady state.
+        """
+        return []
+
+    @staticmethod
+    def shift(values: np.ndarray, shift: int, fill_value: Optional[float] = None) -> np.ndarray:
+        """
+        Shifts values (last axis) in place by shift steps to the front. The freed steps at the
+        end are filled with fill_value, or with the last value if fill_value is None.
+        """
+        if shift >= values.shape[-1]:
+            values[...] = values[..., -1:] if fill_value is None else fill_value
+            return values
+
+        values[..., :-shift] = values[..., shift:]
+        values[..., -shift:] = values[..., -shift - 1: -shift] if fill_value is None else fill_value
+        return values
+
+    @property
+    def state_rows(self) -> int:
+        """
+        Number of rows in the state store of the grid, one per slot
+        """
+        raise Exception("Should be implemented by child class")
+
+    def load_window(self, source: "GridObject", start_step: int) -> None:
+        """
+        To be overridden by child class.
+        Takes over inputs and state of the same object in another grid, so that
+        step 0 of this object corresponds to start_step of the source.
+        """
+
+    def export_state(self, step: int) -> Dict[str, np.ndarray]:
+        """
+        To be overridden by child class.
+        The state of the object at the start of step, that a later run can continue from,
+        see GridState.
+        """
+        return {}
+
+    def import_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        To be overridden by child class.
+        Continues from a state exported by export_state, as step 0.
+        """
+
+    @staticmethod
+    def window(values: np.ndarray, start_step: int, blocks: int) -> np.ndarray:
+        """
+        Cuts blocks time steps (last axis) out of values, starting at start_step.
+        If values end earlier, the last value is repeated.
+        """
+        values = np.asarray(values)[..., start_step: start_step + blocks]
+        missing = blocks - values.shape[-1]
+        if missing > 0:
+            pad_width = [(0, 0)] * (values.ndim - 1) + [(0, missing)]
+            values = np.pad(values, pad_width, mode="edge")
+
+        return values.copy()
+
     @staticmethod
     def increase_step() -> None:
         GridObject._current_step += 1
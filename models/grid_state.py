@@ -0,0 +1,87 @@
+# The state a grid ends a run in, to warm start the next run from
+
+import io
+from typing import Dict, List, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+
+class GridState:
+    """
+    State of a grid at the start of a step, in the order of the nodes and edges of the grid:
+
+    - plugs: per edge, the plugs in the pipe as an array (4, plugs), oldest first, with rows
+      mass, entry step, entry temperature and global entry step (see PlugArray), entry steps
+      counted from the start of the step
+    - mass_flows: per edge, the mass flow in the step before, which estimates the outlet
+      temperature in the first step, see Edge.previous_mass_flow
+    - nodes: per node, the arrays of its state, e.g. the ramp history of a CHP, see
+      GridObject.export_state
+
+    Values are kept as they are, without rounding. save() writes all plugs as one array into
+    a .npz file, load() reads them back as views into that array.
+    """
+
+    def __init__(
+        self,
+        plugs: List[np.ndarray],
+        mass_flows: np.ndarray,  # (edges,) in kg/s
+        nodes: List[Dict[str, np.ndarray]],
+    ) -> None:
+        self.plugs = plugs
+        self.mass_flows = mass_flows
+        self.nodes = nodes
+
+    @staticmethod
+    def of(grid: "Grid", step: int) -> "GridState":
+        edges = [edge.export_state(step) for edge in grid.edges]
+        return GridState(
+            [edge["plugs"] for edge in edges],
+            np.array([edge["mass_flow"] for edge in edges], dtype=float),
+            [node.export_state(step) for node in grid.nodes],
+        )
+
+    def save(self, file) -> None:
+        """
+        file is a path or a file-like object, see np.savez
+        """
+        arrays = {
+            "plugs": np.concatenate(self.plugs, axis=1),
+            "plug_counts": np.array([plugs.shape[1] for plugs in self.plugs], dtype=int),
+            "mass_flows": self.mass_flows,
+            "node_count": np.array(len(self.nodes)),
+        }
+        for i, state in enumerate(self.nodes):
+            for name, values in state.items():
+                arrays["nodes.{}.{}".format(i, name)] = values
+        np.savez(file, **arrays)
+
+    @staticmethod
+    def load(file) -> "GridState":
+        with np.load(file) as data:
+            plugs = data["plugs"]
+            mass_flows = data["mass_flows"]
+            nodes: Dict[int, Dict[str, np.ndarray]] = {}
+            for key in data.files:
+                if key.startswith("nodes."):
+                    _, node, name = key.split(".", 2)
+                    nodes.setdefault(int(node), {})[name] = data[key]
+            bounds = np.cumsum(data["plug_counts"])[:-1]
+            node_count = int(data["node_count"])
+
+        return GridState(
+            np.split(plugs, bounds, axis=1),
+            mass_flows,
+            [nodes.get(i, {}) for i in range(node_count)],
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        self.save(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "GridState":
+        return GridState.load(io.BytesIO(data))
@@ -2,11 +2,10 @@
 
 import math
 import warnings
-from scipy import optimize  # type: ignore
+import numpy as np  # type: ignore
 from typing import Tuple
-from .timing import Timing
+from . import profiling
 
-timing = Timing(start=False)
 tolerance = 0.001
 
 
@@ -30,6 +29,8 @@ class HeatExchanger:
         self.heat_transfer_k_max = heat_transfer_k_max
         self.demand_capacity = demand_capacity
         self.interpolation = None
+        # kernels of the grid's backend, see kernels.py, None for scipy's Newton method
+        self.kernels = None
 
     def minimum_t_supply_p(
         self,
@@ -74,14 +75,11 @@ class HeatExchanger:
 
         See also https://en.wikipedia.org/wiki/NTU_method
         """
-        timing.start()
-
         k = self.get_k(demand)
         t_supply_s = min(setpoint_t_supply_s, t_supply_p - 0.1)
         demanded_q = mass_flow_s * self.heat_capacity * (t_supply_s - t_return_s)
 
         if demanded_q < 1:
-            timing.stop()
             return 0, t_supply_p, t_return_s, 0
 
         c_min = min(self.max_mass_flow_p, mass_flow_s) * self.heat_capacity
@@ -120,6 +118,9 @@ class HeatExchanger:
                 closest_t not in self.interpolation or \
                 closest_mass not in self.interpolation[closest_t]:
 
+            if self.interpolation is not None and profiling.active is not None:
+                profiling.active.count("HeatExchanger", "interpolation fallbacks")
+
             t_return_p = self._thermal_regime(
                 t_in_1=t_supply_p,  # in degrees C
                 t_in_2=t_return_s,  # in degrees C
@@ -128,6 +129,9 @@ class HeatExchanger:
                 k=k,
             )
         else:
+            if profiling.active is not None:
+                profiling.active.count("HeatExchanger", "interpolation hits")
+
             # perform Bilinear Interpolation
             x2 = closest_t + 0.015625
             y2 = closest_mass + 0.015625
@@ -187,9 +191,69 @@ class HeatExchanger:
             print("{} > {}".format(mass_flow_p, self.max_mass_flow_p))
             raise Exception("Heat exchanger caused mass_flow_p to exceed limit")
 
-        timing.stop()
         return mass_flow_p, t_return_p, t_supply_s, q
 
+    def solve_mass_flow_p(
+        self,
+        t_supply_p: np.ndarray,  # in degrees C
+        setpoint_t_supply_s: float,  # in degrees C
+        t_return_s: float,  # in degrees C
+        mass_flow_s: np.ndarray,  # in kg/s
+        demand: np.ndarray,  # in MW
+    ) -> np.ndarray:
+        """
+        Primary mass flow of solve() for arrays of the inputs (broadcast), with the Newton
+        methods of all elements stepped at once and without the interpolation table. Where
+        solve() would fail, as the Newton method leaves its domain or the mass flow exceeds
+        its limit, the mass flow is nan.
+        """
+        from .kernels import thermal_regime_vectorized
+
+        t_supply_p = np.asarray(t_supply_p, dtype=float)
+        mass_flow_s = np.asarray(mass_flow_s, dtype=float)
+        k = self.get_k(demand)
+        t_supply_s = np.minimum(setpoint_t_supply_s, t_supply_p - 0.1)
+        demanded_q = mass_flow_s * self.heat_capacity * (t_supply_s - t_return_s)
+
+        with np.errstate(all="ignore"):
+            # hydraulic regime, see solve()
+            c_min = np.minimum(self.max_mass_flow_p, mass_flow_s) * self.heat_capacity
+            q_max = c_min * (t_supply_p - t_return_s)
+            c_max = np.maximum(self.max_mass_flow_p, mass_flow_s) * self.heat_capacity
+            c_r = c_min / c_max
+            u = k / (
+                self.max_mass_flow_p ** (-self.heat_transfer_q)
+                + mass_flow_s ** (-self.heat_transfer_q)
+            )
+            ntu = u * self.surface_area / c_min
+            e = np.where(
+                c_r == 1,
+                ntu / (1 + ntu),
+                (1 - np.exp(-ntu * (1 - c_r))) / (1 - c_r * np.exp(-ntu * (1 - c_r))),
+            )
+            thermal_max_q = e * q_max
+
+            # thermal regime, see _thermal_regime()
+            c_1 = (k * self.surface_area * np.abs(t_supply_p - t_supply_s)) / (
+                self.heat_capacity * np.abs(t_supply_s - t_return_s)
+            ) ** self.heat_transfer_q
+            c_2 = np.abs(t_supply_p - t_supply_s) / np.abs(t_supply_s - t_return_s)
+            alpha = thermal_regime_vectorized(
+                c_1,
+                c_2,
+                demanded_q ** (1 - self.heat_transfer_q) / c_1,
+                self.heat_transfer_q,
+                0.5 * (1 / c_2 + 1),
+                tolerance,
+                100,
+            )
+            t_return_p = t_return_s + alpha * (t_supply_p - t_supply_s)
+            mass_flow_p = demanded_q / (self.heat_capacity * np.abs(t_supply_p - t_return_p))
+
+        mass_flow_p = np.where(mass_flow_p > self.max_mass_flow_p + 0.0001, np.nan, mass_flow_p)
+        mass_flow_p = np.where(thermal_max_q < demanded_q, self.max_mass_flow_p, mass_flow_p)
+        return np.where(demanded_q < 1, 0.0, mass_flow_p)
+
     def _thermal_regime(
         self,
         t_in_1: float,  # in degrees C
@@ -248,9 +312,32 @@ class HeatExchanger:
 
             return d / (a - target)
 
-        alpha = optimize.newton(
-            func=diff, fprime=diff_prime, x0=0.5 * (1 / c_2 + 1), tol=tolerance, maxiter=100
-        )
+        if self.kernels is not None:
+            # the same Newton method, without the overhead of scipy
+            alpha, iterations = self.kernels.thermal_regime(
+                c_1,
+                c_2,
+                q ** (1 - self.heat_transfer_q) / c_1,
+                self.heat_transfer_q,
+                0.5 * (1 / c_2 + 1),
+                tolerance,
+                100,
+            )
+        else:
+            # scipy is imported on first use, as it is slow to import
+            from scipy import optimize  # type: ignore
+
+            alpha, result = optimize.newton(
+                func=diff,
+                fprime=diff_prime,
+                x0=0.5 * (1 / c_2 + 1),
+                tol=tolerance,
+                maxiter=100,
+                full_output=True,
+            )
+            iterations = result.iterations
+        if profiling.active is not None:
+            profiling.active.count("HeatExchanger", "Newton iterations", iterations)
 
         t_out_1 = t_in_2 + alpha * (t_in_1 - t_out_2)
         return t_out_1
@@ -0,0 +1,282 @@
+# A hydraulic model of the grid that solves mass flows and pressures of meshed networks
+
+from typing import Dict, List, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+from scipy import sparse  # type: ignore
+from scipy.sparse import linalg as sparse_linalg  # type: ignore
+
+from .consumer import Consumer
+from .producer import Producer
+from .transfer import Transfer
+from .node import Node
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# largest imbalance of the mass flow of a hydraulic node, relative to the total demand,
+# as the precision of the pressures shrinks with the size of the network
+tolerance = 1e-9
+
+
+class HydraulicNetwork:
+    """
+    Edges are the branches of the hydraulic network. Branches and junctions join all of their
+    slots into one hydraulic node, while every slot of a producer, consumer or transfer is a
+    hydraulic node of its own. Consumers (and the primary side of transfers) take a given mass
+    flow out of their supply slot and put it into their return slot. Producers (and the
+    secondary side of transfers) close the circuit: they take in what arrives at their return
+    slot, and their return slot is the pressure reference of its part of the network.
+
+    The pressure loss of an edge is friction_coefficient * mass_flow * |mass_flow|.
+    Node pressures are solved with a damped Newton method on the mass flow balance of each
+    node, whose Jacobian is the weighted Laplacian A diag(dm/dp) A^T of the incidence matrix A.
+    This allows loops and meshes, where the mass flows are not determined by the consumers.
+
+    The supply part of each circuit is solved relative to the outlet of its producer. The pump
+    head of the producer is then the smallest one that provides every consumer with its
+    pressure_load, like the maximum taken by junctions in the callback model.
+
+    In grids with loops, Grid.split_flows solves it at the start of every step and hands its
+    split of the mass flows to the branches and junctions as their valve positions, see split().
+    """
+
+    def __init__(self, grid: "Grid", regularization: float = 1.0) -> None:
+        """
+        regularization (in Pa): below this pressure difference, the pipe law is smoothed
+        so that its derivative stays finite at zero flow.
+        """
+        self.regularization = regularization
+        self.node_index: Dict[Tuple[int, int], int] = {}  # (node id, slot) -> hydraulic node
+        self.hydraulic_nodes = 0
+
+        for node in grid.nodes:
+            if type(node).__name__ in ("Branch", "Junction"):
+                joined = self._add_hydraulic_node()
+                for slot in range(len(node.slots)):
+                    self.node_index[(node.id, slot)] = joined
+            else:
+                for slot in range(len(node.slots)):
+                    self.node_index[(node.id, slot)] = self._add_hydraulic_node()
+
+        self.edge_ids = [edge.id for edge in grid.edges]
+        self.friction = np.array([edge.friction_coefficient for edge in grid.edges])
+        from_nodes = [self.node_index[(n.id, s)] for (n, s) in (e.nodes[0] for e in grid.edges)]
+        to_nodes = [self.node_index[(n.id, s)] for (n, s) in (e.nodes[1] for e in grid.edges)]
+        edge_number = len(grid.edges)
+        # incidence matrix: +1 where an edge leaves a hydraulic node, -1 where it enters
+        self.incidence = sparse.csr_matrix(
+            (
+                np.concatenate([np.ones(edge_number), -np.ones(edge_number)]),
+                (
+                    np.concatenate([from_nodes, to_nodes]),
+                    np.concatenate([np.arange(edge_number), np.arange(edge_number)]),
+                ),
+            ),
+            shape=(self.hydraulic_nodes, edge_number),
+        )
+
+        # demands: (node, inlet slot, outlet slot, pressure load), flow is given per step
+        # circuits: (node, return slot, supply slot), closing the circuit with a pump
+        self.demands: List[Tuple["Node", int, int, float]] = []
+        self.circuits: List[Tuple["Node", int, int]] = []
+        for node in grid.nodes:
+            if isinstance(node, Consumer):
+                self.demands.append((node, 0, 1, node.pressure_load))
+            elif isinstance(node, Transfer):
+                self.demands.append((node, 0, 1, 0))
+                self.circuits.append((node, 3, 2))
+            elif isinstance(node, Producer):
+                self.circuits.append((node, 0, 1))
+
+        references = [self.node_index[(n.id, s)] for (n, r, s) in self.circuits] + [
+            self.node_index[(n.id, r)] for (n, r, s) in self.circuits
+        ]
+        assert len(set(references)) == len(references)
+        self._references = np.array(references, dtype=int)
+        self._free = np.setdiff1d(np.arange(self.hydraulic_nodes), self._references)
+        self._reduced_incidence = self.incidence[self._free]
+
+        # the parts of the network that are connected by edges
+        _, self._labels = sparse.csgraph.connected_components(
+            self.incidence @ self.incidence.T, directed=False
+        )
+        self._demand_nodes = np.array(
+            [
+                [self.node_index[(n.id, inlet)], self.node_index[(n.id, outlet)]]
+                for n, inlet, outlet, _ in self.demands
+            ],
+            dtype=int,
+        ).reshape(-1, 2)
+        self._pressure_loads = np.array([load for _, _, _, load in self.demands])
+        coo = self.incidence.tocoo()
+        self._edge_nodes = np.zeros((2, edge_number), dtype=int)
+        self._edge_nodes[0, coo.col[coo.data > 0]] = coo.row[coo.data > 0]
+        self._edge_nodes[1, coo.col[coo.data < 0]] = coo.row[coo.data < 0]
+
+        # branches and junctions with the indices of the edges of their slots, see split()
+        edge_index = {edge.id: i for i, edge in enumerate(grid.edges)}
+        self.connectors: List[Tuple["Node", np.ndarray]] = [
+            (node, np.array([edge_index[edge.id] for edge in node.edges], dtype=int))
+            for node in grid.nodes
+            if type(node).__name__ in ("Branch", "Junction")
+        ]
+
+        self.pressure = np.zeros(self.hydraulic_nodes)  # warm start for the next solve
+        self.iterations = 0
+
+    def _add_hydraulic_node(self) -> int:
+        self.hydraulic_nodes += 1
+        return self.hydraulic_nodes - 1
+
+    def _pipe_law(self, pressure_diff: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mass flow through each edge for a given pressure difference between its nodes,
+        and its derivative. Smoothed version of sign(dp) * sqrt(|dp| / friction).
+        """
+        squared = pressure_diff ** 2 + self.regularization ** 2
+        scale = 1 / np.sqrt(self.friction)
+        mass_flow = scale * pressure_diff * squared ** -0.25
+        derivative = scale * squared ** -1.25 * (0.5 * pressure_diff ** 2 + self.regularization ** 2)
+        return mass_flow, derivative
+
+    def injections(self, demand_flows: np.ndarray) -> np.ndarray:
+        """
+        Mass flow put into each hydraulic node by the demands (in the order of self.demands).
+        The reference nodes of the producers take up the balance.
+        """
+        injection = np.zeros(self.hydraulic_nodes)
+        np.subtract.at(injection, self._demand_nodes[:, 0], demand_flows)
+        np.add.at(injection, self._demand_nodes[:, 1], demand_flows)
+        return injection
+
+    def solve(
+        self,
+        demand_flows: np.ndarray,
+        warm_start: bool = True,
+        max_iterations: int = 50,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the mass flow of each edge, the pressure of each hydraulic node and the pump
+        head of each circuit, for the given mass flows of the demands (in the order of
+        self.demands). The return slot of each producer has pressure 0, its supply slot the
+        pump head. The pressures of the previous solve are the starting point if warm_start.
+        """
+        injection = self.injections(demand_flows)[self._free]
+        pressure = self.pressure.copy() if warm_start else np.zeros(self.hydraulic_nodes)
+        pressure[self._references] = 0
+
+        def residual(p: np.ndarray):
+            mass_flow, derivative = self._pipe_law(self.incidence.T @ p)
+            return self._reduced_incidence @ mass_flow - injection, mass_flow, derivative
+
+        balance, mass_flow, derivative = residual(pressure)
+        max_imbalance = tolerance * (1 + np.sum(np.abs(demand_flows)))
+        self.iterations = 0
+        while np.max(np.abs(balance), initial=0) > max_imbalance:
+            if self.iterations == max_iterations:
+                raise Exception(
+                    "Hydraulic solver did not converge, remaining imbalance {} kg/s".format(
+                        np.max(np.abs(balance))
+                    )
+                )
+            self.iterations += 1
+
+            jacobian = (
+                self._reduced_incidence
+                @ sparse.diags(derivative)
+                @ self._reduced_incidence.T
+            ).tocsc()
+            step = np.zeros(self.hydraulic_nodes)
+            step[self._free] = -sparse_linalg.spsolve(
+                jacobian, balance, permc_spec="MMD_AT_PLUS_A"
+            )
+
+            # damping: halve the step until the imbalance decreases
+            norm = np.linalg.norm(balance)
+            damping = 1.0
+            while True:
+                candidate = pressure + damping * step
+                candidate_balance, candidate_flow, candidate_derivative = residual(candidate)
+                if np.linalg.norm(candidate_balance) < norm or damping < 1e-4:
+                    break
+                damping /= 2
+
+            pressure = candidate
+            balance, mass_flow, derivative = candidate_balance, candidate_flow, candidate_derivative
+
+        self.pressure = pressure
+        pump_head = self._pump_heads(pressure)
+        absolute_pressure = pressure.copy()
+        for (node, return_slot, supply_slot), head in zip(self.circuits, pump_head):
+            supply_label = self._labels[self.node_index[(node.id, supply_slot)]]
+            absolute_pressure[self._labels == supply_label] += head
+
+        return mass_flow, absolute_pressure, pump_head
+
+    def _pump_heads(self, pressure: np.ndarray) -> np.ndarray:
+        """
+        The pump head of a circuit is the smallest one that provides all of its demands
+        with their pressure load.
+        """
+        required = (
+            self._pressure_loads
+            + pressure[self._demand_nodes[:, 1]]
+            - pressure[self._demand_nodes[:, 0]]
+        )
+        demand_labels = self._labels[self._demand_nodes[:, 0]]
+        heads = np.zeros(len(self.circuits))
+        for i, (node, return_slot, supply_slot) in enumerate(self.circuits):
+            supply_label = self._labels[self.node_index[(node.id, supply_slot)]]
+            heads[i] = np.max(required[demand_labels == supply_label], initial=0)
+
+        return heads
+
+    def edge_pressures(self, pressure: np.ndarray) -> np.ndarray:
+        """
+        Inlet and outlet pressure of each edge, shape (2, edges)
+        """
+        return pressure[self._edge_nodes]
+
+    def demand_flows_at(self, step: int) -> np.ndarray:
+        """
+        Mass flows of the demands as solved by the grid in the given step
+        """
+        return np.array(
+            [node.mass_flow[inlet, step] for node, inlet, outlet, _ in self.demands]
+        )
+
+    def estimated_demand_flows(self, step: int) -> np.ndarray:
+        """
+        Mass flows of the demands in the step before, which estimate the ones of step, like
+        Edge.get_outlet_temp does. In step 0, consumers are estimated with their secondary
+        mass flow, other demands with 0.
+        """
+        if step > 0:
+            return self.demand_flows_at(step - 1)
+
+        flows = np.zeros(len(self.demands))
+        for i, (node, _, _, _) in enumerate(self.demands):
+            if isinstance(node, Consumer):
+                flows[i] = node.demand[step] * node.energy_unit_conversion / (
+                    node.heat_exchanger.heat_capacity
+                    * (node.setpoint_t_supply_s - node.t_return_s)
+                )
+        return flows
+
+    def split(self, mass_flow: np.ndarray, step: int) -> None:
+        """
+        Sets the valve positions of all branches and junctions in step to the shares of
+        their side slots in the mass flow of the edges, so that the callback model follows
+        the mass flows of the hydraulic network in loops
+        """
+        limit = tolerance * (1 + np.max(np.abs(mass_flow), initial=0))
+        for node, edges in self.connectors:
+            flows = mass_flow[edges]
+            if np.any(flows < -limit):
+                raise Exception(
+                    "The mass flow runs against the direction of an edge of node {}, which the"
+                    " callback model cannot follow".format(node.id)
+                )
+            sides = np.maximum(flows[1:], 0)
+            total = np.sum(sides)
+            node.valve_position[:, step] = sides / total if total > 0 else 1 / len(sides)
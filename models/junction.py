@@ -31,6 +31,12 @@ class Junction(Connector):
             default_valve_position=default_valve_position
         )
 
+    def _clear_joint(self) -> None:
+        super()._clear_joint()
+        # mass flow weighted sums of the arrived outlet temperatures and entry steps
+        self._mixed_heat, self._mixed_entry_step = 0.0, 0.0
+        self._first_entry_step = None
+
     def get_outlet_temp(self, slot: int) -> float:
         """
         Is called from downstream to get the average outlet temperature in the
@@ -38,37 +44,47 @@ class Junction(Connector):
         """
         assert slot == 0
 
-        mass_flows_in = self.mass_flow[1:, self.current_step]
-        if not any(np.isnan(mass_flows_in)):
-            if np.sum(self.mass_flow[1:, self.current_step]) == 0:
-                pos = np.zeros(len(self.slots) - 1)
-                pos[0] = 1
+        if self._joined_step == self.current_step:
+            # return, mixed while the mass flows arrived
+            mass_flow = self.mass_flow[0, self.current_step]
+            if mass_flow == 0:
+                self.temp[0, self.current_step] = self.temp[1, self.current_step]
+                self.entry_step_global = self._first_entry_step
             else:
-                pos = self.mass_flow[1:, self.current_step] / np.sum(
-                    self.mass_flow[1:, self.current_step]
-                )
-        else:
-            # supply, pos should be pre-set
-            pos = self.valve_position[self.current_step]
-            assert not np.isnan(pos)
-
-        entry_step_global = []
-        for i in range(1, len(self.slots)):
-            self.temp[i, self.current_step], e_s_g = self.edges[i].get_outlet_temp()
-            entry_step_global.append(e_s_g)
-
-        self.temp[0, self.current_step] = np.sum(
-            pos * self.temp[1:, self.current_step]
-        )
-        self.entry_step_global = np.sum(
-            pos*np.array(entry_step_global)
-        )
+                self.temp[0, self.current_step] = self._mixed_heat / mass_flow
+                self.entry_step_global = self._mixed_entry_step / mass_flow
+
+            return self.temp[0, self.current_step], self.entry_step_global
+
+        # supply, pos should be pre-set
+        pos = self.valve_position[:, self.current_step]
+        assert not np.isnan(pos).any()
+
+        outlet = np.array([edge.get_outlet_temp() for edge in self.edges[1:]], dtype=float)
+        self.temp[1:, self.current_step] = outlet[:, 0]
+
+        self.temp[0, self.current_step] = np.dot(pos, outlet[:, 0])
+        self.entry_step_global = np.dot(pos, outlet[:, 1])
 
         return self.temp[0, self.current_step], self.entry_step_global
 
     def set_mass_flow(self, slot: int, mass_flow: float) -> None:
         """
         Called from supply downstream or return upstream to inform this node
-        about the mass flow in the coming step
+        about the mass flow in the coming step. The outlet temperatures of the
+        incoming edges are mixed as their mass flows arrive.
         """
+        if slot != 0:
+            edge = self.edges[slot]
+            # the incoming edges are solved before they inform the junction
+            temp = edge.temp[1, self.current_step]
+            self.temp[slot, self.current_step] = temp
+            if self._arrival_step != self.current_step:
+                # first arrival in this step, see Connector.set_mass_flow_joint
+                self._mixed_heat, self._mixed_entry_step = 0.0, 0.0
+            if slot == 1:
+                self._first_entry_step = edge.entry_step_global
+            self._mixed_heat += mass_flow * temp
+            self._mixed_entry_step += mass_flow * edge.entry_step_global
+
         super().set_mass_flow_in_direction(slot, mass_flow, True)
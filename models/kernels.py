@@ -0,0 +1,576 @@
+# Kernels of the plug propagation in the pipes and of the Newton method of the heat
+# exchangers, working on arrays of plugs instead of Plug objects.
+#
+# Backends, selected per grid by Grid.set_backend():
+#   "python": the reference implementation of Edge and HeatExchanger, on lists of Plugs
+#   "numpy":  vectorized kernels over PlugArray, Newton method without scipy
+#   "numba":  the loop kernels below compiled by numba, if it is installed (numpy otherwise)
+# The loop kernels are plain Python as well, so their results are checked against the
+# reference without numba, see tests/test_kernels.py.
+
+import math
+import warnings
+from typing import Dict, Iterator, List, Tuple, Union
+import numpy as np  # type: ignore
+
+from .plug import Plug
+
+backends = ("python", "numpy", "numba")
+
+# rows of PlugArray.data
+MASS, ENTRY_STEP, ENTRY_TEMP, ENTRY_STEP_GLOBAL = range(4)
+
+
+class PlugArray:
+    """
+    The plugs of a pipe, in the columns start to end of data, oldest first. New plugs
+    are appended at the end, pushed out plugs leave at start, so that neither moves the
+    other plugs. Read like the plug list of the reference implementation: iterating and
+    indexing give copies as Plug objects, newest first.
+    """
+
+    __slots__ = ("data", "start", "end")
+
+    def __init__(self, data: np.ndarray, start: int = 0, end: int = None) -> None:
+        self.data = data
+        self.start = start
+        self.end = data.shape[1] if end is None else end
+
+    @staticmethod
+    def from_plugs(plugs: List[Plug], capacity: int = 0) -> "PlugArray":
+        """
+        plugs: newest first, as in Edge.plug_cache
+        """
+        data = np.zeros((4, max(capacity, 2 * len(plugs), 16)))
+        for i, plug in enumerate(reversed(plugs)):
+            data[:, i] = (plug.mass, plug.entry_step, plug.entry_temp, plug.entry_step_global)
+
+        return PlugArray(data, 0, len(plugs))
+
+    @property
+    def plugs(self) -> np.ndarray:
+        """
+        View of the plugs in the pipe, shape (4, plugs), oldest first
+        """
+        return self.data[:, self.start: self.end]
+
+    def append(self, mass: float, entry_step: int, entry_temp: float, entry_step_global: float) -> None:
+        if self.end == self.data.shape[1]:
+            # plugs are moved to the front, the array only grows if it is half full
+            count = self.end - self.start
+            data = self.data if 2 * count <= self.data.shape[1] else np.zeros(
+                (4, 2 * self.data.shape[1])
+            )
+            data[:, :count] = self.data[:, self.start: self.end]
+            self.data, self.start, self.end = data, 0, count
+
+        self.data[:, self.end] = (mass, entry_step, entry_temp, entry_step_global)
+        self.end += 1
+
+    def pop(self, count: int = 1) -> None:
+        """
+        Removes the count oldest plugs
+        """
+        self.start += count
+
+    def copy(self) -> "PlugArray":
+        return PlugArray(self.plugs.copy())
+
+    def to_plugs(self) -> List[Plug]:
+        return [
+            Plug(mass, entry_step, entry_temp, entry_step_global)
+            for mass, entry_step, entry_temp, entry_step_global in self.plugs.T[::-1].tolist()
+        ]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __iter__(self) -> Iterator[Plug]:
+        return iter(self.to_plugs())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Plug, List[Plug]]:
+        if isinstance(index, slice):
+            return self.to_plugs()[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("plug index out of range")
+
+        return Plug(*self.data[:, self.end - 1 - index].tolist())
+
+
+class Kernels:
+    """
+    The kernels of one backend. All of them take the plugs of a pipe as an array of
+    shape (4, plugs), oldest first, see PlugArray.plugs, and return the heat in J.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        heat_loss,
+        push_plugs,
+        outlet_temp,
+        outlet_bundle,
+        thermal_regime,
+    ) -> None:
+        self.name = name
+        self.heat_loss = heat_loss
+        self.push_plugs = push_plugs
+        self.outlet_temp = outlet_temp
+        self.outlet_bundle = outlet_bundle
+        self.thermal_regime = thermal_regime
+
+    def __reduce__(self):
+        # compiled kernels are not pickled, but looked up again
+        return get, (self.name,)
+
+
+# Vectorized kernels, for pipes with many plugs
+
+
+def _plug_temps(
+    plugs: np.ndarray,
+    current_step: int,
+    interval_length: float,
+    time_constant: float,
+    t_ground: float,
+) -> np.ndarray:
+    decay = np.exp(-(current_step - plugs[ENTRY_STEP]) * interval_length / time_constant)
+    return t_ground + (plugs[ENTRY_TEMP] - t_ground) * decay
+
+
+def _heat_loss_vectorized(
+    plugs: np.ndarray,
+    current_step: int,
+    interval_length: float,
+    time_constant: float,
+    t_ground: float,
+    heat_capacity: float,
+) -> Tuple[float, float]:
+    """
+    Heat lost by all plugs in the last step, and heat in the pipe now
+    """
+    age = current_step - plugs[ENTRY_STEP]
+    decay_before = np.exp(-np.maximum(age - 1, 0) * interval_length / time_constant)
+    decay = np.exp(-age * interval_length / time_constant)
+    temp_diff = plugs[ENTRY_TEMP] - t_ground
+    mass = plugs[MASS]
+
+    heat_loss = np.dot(temp_diff * (decay_before - decay), mass) * heat_capacity
+    heat_in_pipe = np.dot(t_ground + temp_diff * decay, mass) * heat_capacity
+
+    return float(heat_loss), float(heat_in_pipe)
+
+
+def _consumed(plugs: np.ndarray, mass: float) -> Tuple[int, np.ndarray]:
+    """
+    Number of the oldest plugs that are taken completely by mass, and the mass taken from
+    each of them plus the next one, which is taken partly (if there is one)
+    """
+    masses = plugs[MASS]
+    total = np.cumsum(masses)
+    taken = int(np.searchsorted(total, mass, side="right"))
+    consuming = masses[: taken + 1].copy()
+    if taken < len(masses):
+        consuming[taken] = mass - (total[taken - 1] if taken > 0 else 0.0)
+
+    return taken, consuming
+
+
+def _push_plugs_vectorized(
+    plugs: np.ndarray,
+    consumed_mass: float,
+    current_step: int,
+    hist_blocks: int,
+    delay_arr: np.ndarray,
+    interval_length: float,
+    time_constant: float,
+    t_ground: float,
+    heat_capacity: float,
+) -> Tuple[int, int, float, float, float]:
+    """
+    Pushes consumed_mass out of the pipe: the mass of the oldest plug that stays in the pipe
+    is reduced in place, and the shares of the entry steps are added to delay_arr.
+    Returns the number of plugs pushed out completely, the number of plugs processed,
+    the outlet temperature, the global entry step and the heat that left the pipe.
+    """
+    pushed, consuming = _consumed(plugs, consumed_mass)
+    assert pushed < plugs.shape[1] or np.sum(consuming) >= consumed_mass
+
+    processed = len(consuming)
+    if pushed < plugs.shape[1]:
+        plugs[MASS, pushed] -= consuming[-1]
+
+    out = plugs[:, :processed]
+    weights = consuming / consumed_mass if consumed_mass > 0 else np.zeros(processed)
+    temps = _plug_temps(out, current_step, interval_length, time_constant, t_ground)
+    # after roll(), plugs may have entered before the first column
+    columns = np.maximum(hist_blocks + out[ENTRY_STEP].astype(int), 0)
+    np.add.at(delay_arr, columns, weights)
+
+    return (
+        pushed,
+        processed,
+        float(np.dot(temps, weights)),
+        float(np.dot(out[ENTRY_STEP_GLOBAL], weights)),
+        float(np.dot(temps, consuming)) * heat_capacity,
+    )
+
+
+def _outlet_temp_vectorized(
+    plugs: np.ndarray,
+    expected_mass: float,
+    current_step: int,
+    interval_length: float,
+    time_constant: float,
+    t_ground: float,
+) -> Tuple[float, float, float]:
+    """
+    Mixed temperature and global entry step of the oldest expected_mass of the pipe,
+    and the mass of the pipe that was mixed (less than expected if the pipe is too short).
+    Without expected mass, the ones of the oldest plug.
+    """
+    if expected_mass == 0:
+        oldest = plugs[:, :1]
+        temp = _plug_temps(oldest, current_step, interval_length, time_constant, t_ground)
+        return float(temp[0]), float(oldest[ENTRY_STEP_GLOBAL, 0]), 0.0
+
+    taken, consuming = _consumed(plugs, expected_mass)
+    out = plugs[:, : len(consuming)]
+    weights = consuming / expected_mass
+    temps = _plug_temps(out, current_step, interval_length, time_constant, t_ground)
+
+    fulfilled = expected_mass if taken < plugs.shape[1] else float(np.sum(consuming))
+
+    return float(np.dot(temps, weights)), float(np.dot(out[ENTRY_STEP_GLOBAL], weights)), fulfilled
+
+
+def _outlet_bundle_vectorized(
+    plugs: np.ndarray,
+    current_step: int,
+    interval_length: float,
+    time_constant: float,
+    t_ground: float,
+) -> np.ndarray:
+    """
+    Outlet temperature, mass and global entry step of every plug, oldest first
+    """
+    temps = _plug_temps(plugs, current_step, interval_length, time_constant, t_ground)
+    return np.column_stack((temps, plugs[MASS], plugs[ENTRY_STEP_GLOBAL]))
+
+
+# Loop kernels, compiled by numba. Same results as the vectorized kernels. The plugs are
+# indexed as plugs[row][i], so that they run on lists of rows as well.
+
+
+def _heat_loss_loop(plugs, current_step, interval_length, time_constant, t_ground, heat_capacity):
+    heat_loss = 0.0
+    heat_in_pipe = 0.0
+    for i in range(len(plugs[MASS])):
+        age = current_step - plugs[ENTRY_STEP][i]
+        decay_before = math.exp(-max(age - 1, 0) * interval_length / time_constant)
+        decay = math.exp(-age * interval_length / time_constant)
+        temp_diff = plugs[ENTRY_TEMP][i] - t_ground
+        heat_loss += temp_diff * (decay_before - decay) * plugs[MASS][i]
+        heat_in_pipe += (t_ground + temp_diff * decay) * plugs[MASS][i]
+
+    return heat_loss * heat_capacity, heat_in_pipe * heat_capacity
+
+
+def _push_plugs_loop(
+    plugs,
+    consumed_mass,
+    current_step,
+    hist_blocks,
+    delay_arr,
+    interval_length,
+    time_constant,
+    t_ground,
+    heat_capacity,
+):
+    outlet_temp = 0.0
+    entry_step_global = 0.0
+    heat_out = 0.0
+    fulfilled = 0.0
+    pushed = 0
+    processed = 0
+    for i in range(len(plugs[MASS])):
+        mass = plugs[MASS][i]
+        processed += 1
+        if consumed_mass - fulfilled >= mass:
+            pushed += 1
+            fulfilled += mass
+            consuming = mass
+        else:
+            consuming = consumed_mass - fulfilled
+            plugs[MASS][i] = mass - consuming
+            fulfilled = consumed_mass
+
+        if consuming > 0:
+            delay_arr[max(hist_blocks + int(plugs[ENTRY_STEP][i]), 0)] += consuming / consumed_mass
+            decay = math.exp(
+                -(current_step - plugs[ENTRY_STEP][i]) * interval_length / time_constant
+            )
+            temp = t_ground + (plugs[ENTRY_TEMP][i] - t_ground) * decay
+            outlet_temp += temp * (consuming / consumed_mass)
+            entry_step_global += plugs[ENTRY_STEP_GLOBAL][i] * (consuming / consumed_mass)
+            heat_out += consuming * temp * heat_capacity
+
+        if fulfilled >= consumed_mass:
+            break
+
+    assert fulfilled >= consumed_mass
+    return pushed, processed, outlet_temp, entry_step_global, heat_out
+
+
+def _outlet_temp_loop(plugs, expected_mass, current_step, interval_length, time_constant, t_ground):
+    outlet_temp = 0.0
+    entry_step_global = 0.0
+    fulfilled = 0.0
+    for i in range(len(plugs[MASS])):
+        mass = plugs[MASS][i]
+        if expected_mass - fulfilled >= mass:
+            fulfilled += mass
+            consuming = mass
+        else:
+            consuming = expected_mass - fulfilled
+            fulfilled = expected_mass
+
+        decay = math.exp(-(current_step - plugs[ENTRY_STEP][i]) * interval_length / time_constant)
+        temp = t_ground + (plugs[ENTRY_TEMP][i] - t_ground) * decay
+        if expected_mass == 0:
+            outlet_temp = temp
+            entry_step_global = plugs[ENTRY_STEP_GLOBAL][i]
+        elif consuming > 0:
+            outlet_temp += temp * (consuming / expected_mass)
+            entry_step_global += plugs[ENTRY_STEP_GLOBAL][i] * (consuming / expected_mass)
+
+        if fulfilled >= expected_mass:
+            break
+
+    return outlet_temp, entry_step_global, fulfilled
+
+
+def _outlet_bundle_loop(plugs, current_step, interval_length, time_constant, t_ground):
+    bundle = np.empty((len(plugs[MASS]), 3))
+    for i in range(len(plugs[MASS])):
+        decay = math.exp(-(current_step - plugs[ENTRY_STEP][i]) * interval_length / time_constant)
+        bundle[i, 0] = t_ground + (plugs[ENTRY_TEMP][i] - t_ground) * decay
+        bundle[i, 1] = plugs[MASS][i]
+        bundle[i, 2] = plugs[ENTRY_STEP_GLOBAL][i]
+
+    return bundle
+
+
+def thermal_regime(c_1, c_2, target, exponent, x0, tol, maxiter):
+    """
+    Newton method of HeatExchanger._thermal_regime, with the same steps as
+    scipy.optimize.newton. Returns alpha and the number of iterations.
+    target: q ** (1 - exponent) / c_1
+    """
+    a = x0
+    for iteration in range(1, maxiter + 1):
+        if abs(a - 1) < 0.0001:
+            f = 0.5
+        else:
+            f = (a - 1) / ((1 + (1 - c_2 * (a - 1)) ** exponent) * math.log(a))
+        d = f - target
+        if d == 0:
+            return a, iteration - 1
+
+        if abs(a - 1) < 0.0001:
+            d_prime = 1 / 2 * (1 / 2 + c_2 * exponent / 2)
+        else:
+            g_2 = 1 + (1 - c_2 * (a - 1)) ** exponent
+            x_1 = (math.log(a) - (a - 1) / a) / ((a - 1) * math.log(a))
+            x_2 = (c_2 * exponent * (1 - c_2 * (a - 1)) ** (exponent - 1)) / g_2
+            new_alpha = a - d / (f * (x_1 + x_2))
+            threshold = 1 / c_2 + 1
+            d_prime = d / (a - abs((new_alpha + threshold) % (2 * threshold) - threshold))
+        if d_prime == 0:
+            raise Exception("Derivative was zero in the Newton method of the heat exchanger")
+
+        new_a = a - d / d_prime
+        if abs(new_a - a) <= tol:
+            return new_a, iteration
+        a = new_a
+
+    raise Exception("Newton method of the heat exchanger did not converge")
+
+
+def thermal_regime_vectorized(c_1, c_2, target, exponent, x0, tol, maxiter):
+    """
+    thermal_regime for arrays (broadcast), all Newton methods stepped at once. Returns alpha,
+    nan where the Newton method leaves the domain or does not converge.
+    """
+    c_2, target, a = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (c_2, target, x0))
+    )
+    a = a.copy()
+    alpha = np.full(a.shape, np.nan)
+    running = np.ones(a.shape, dtype=bool)
+    threshold = 1 / c_2 + 1
+    with np.errstate(all="ignore"):
+        for _ in range(maxiter):
+            near_one = np.abs(a - 1) < 0.0001
+            log_a = np.log(a)
+            base = 1 - c_2 * (a - 1)
+            g_2 = 1 + base ** exponent
+            f = np.where(near_one, 0.5, (a - 1) / (g_2 * log_a))
+            d = f - target
+
+            x_1 = (log_a - (a - 1) / a) / ((a - 1) * log_a)
+            x_2 = (c_2 * exponent * base ** (exponent - 1)) / g_2
+            new_alpha = a - d / (f * (x_1 + x_2))
+            d_prime = np.where(
+                near_one,
+                1 / 2 * (1 / 2 + c_2 * exponent / 2),
+                d / (a - np.abs((new_alpha + threshold) % (2 * threshold) - threshold)),
+            )
+            new_a = a - d / d_prime
+
+            found = running & (d == 0)
+            alpha[found] = a[found]
+            converged = running & ~found & (np.abs(new_a - a) <= tol)
+            alpha[converged] = new_a[converged]
+            running &= ~found & ~converged & np.isfinite(new_a)
+            if not np.any(running):
+                break
+            a = np.where(running, new_a, a)
+
+    return alpha
+
+
+# NumPy backend: few plugs are faster in Python loops over lists than vectorized, mostly
+# only the oldest one or two plugs are pushed out of a pipe in a step.
+
+few_plugs = 16
+
+
+def _heat_loss_numpy(plugs, current_step, interval_length, time_constant, t_ground, heat_capacity):
+    if plugs.shape[1] > few_plugs:
+        return _heat_loss_vectorized(
+            plugs, current_step, interval_length, time_constant, t_ground, heat_capacity
+        )
+
+    return _heat_loss_loop(
+        plugs.tolist(), current_step, interval_length, time_constant, t_ground, heat_capacity
+    )
+
+
+def _push_plugs_numpy(
+    plugs,
+    consumed_mass,
+    current_step,
+    hist_blocks,
+    delay_arr,
+    interval_length,
+    time_constant,
+    t_ground,
+    heat_capacity,
+):
+    oldest = plugs[:, :few_plugs].tolist()
+    if sum(oldest[MASS]) < consumed_mass:
+        return _push_plugs_vectorized(
+            plugs,
+            consumed_mass,
+            current_step,
+            hist_blocks,
+            delay_arr,
+            interval_length,
+            time_constant,
+            t_ground,
+            heat_capacity,
+        )
+
+    result = _push_plugs_loop(
+        oldest,
+        consumed_mass,
+        current_step,
+        hist_blocks,
+        delay_arr,
+        interval_length,
+        time_constant,
+        t_ground,
+        heat_capacity,
+    )
+    # the plug that was pushed out partly
+    pushed = result[0]
+    if pushed < len(oldest[MASS]):
+        plugs[MASS, pushed] = oldest[MASS][pushed]
+
+    return result
+
+
+def _outlet_temp_numpy(plugs, expected_mass, current_step, interval_length, time_constant, t_ground):
+    oldest = plugs[:, :few_plugs].tolist()
+    if sum(oldest[MASS]) < expected_mass and plugs.shape[1] > few_plugs:
+        return _outlet_temp_vectorized(
+            plugs, expected_mass, current_step, interval_length, time_constant, t_ground
+        )
+
+    return _outlet_temp_loop(
+        oldest, expected_mass, current_step, interval_length, time_constant, t_ground
+    )
+
+
+def _outlet_bundle_numpy(plugs, current_step, interval_length, time_constant, t_ground):
+    if plugs.shape[1] > few_plugs:
+        return _outlet_bundle_vectorized(
+            plugs, current_step, interval_length, time_constant, t_ground
+        )
+
+    return _outlet_bundle_loop(
+        plugs.tolist(), current_step, interval_length, time_constant, t_ground
+    )
+
+
+_kernels: Dict[str, Kernels] = {}
+
+
+def _loop_kernels(name: str, jit=None) -> Kernels:
+    functions = [
+        _heat_loss_loop,
+        _push_plugs_loop,
+        _outlet_temp_loop,
+        _outlet_bundle_loop,
+        thermal_regime,
+    ]
+    if jit is not None:
+        functions = [jit(function) for function in functions]
+
+    return Kernels(name, *functions)
+
+
+def get(backend: str) -> Union[Kernels, None]:
+    """
+    The kernels of the backend, None for the reference implementation. Numba is imported,
+    and the kernels are compiled, on first use.
+    """
+    if backend not in backends:
+        raise Exception("Unknown backend {}, one of {}".format(backend, backends))
+    if backend == "python":
+        return None
+
+    if backend not in _kernels:
+        if backend == "numba":
+            try:
+                import numba  # type: ignore
+            except ImportError:
+                warnings.warn("numba is not installed, using the numpy backend")
+                _kernels[backend] = get("numpy")
+                return _kernels[backend]
+            _kernels[backend] = _loop_kernels(backend, numba.njit(cache=True))
+        else:
+            _kernels[backend] = Kernels(
+                backend,
+                _heat_loss_numpy,
+                _push_plugs_numpy,
+                _outlet_temp_numpy,
+                _outlet_bundle_numpy,
+                thermal_regime,
+            )
+
+    return _kernels[backend]
+
@@ -0,0 +1,193 @@
+# A linearized model of the grid as a cvxpy problem, built once and re-solved per window
+
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+import cvxpy as cvx  # type: ignore
+
+from .linearization import nf4r, piecewise
+from .producers.CHP import CHP
+from util import math_functions
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+
+class LinearProblem:
+    """
+    Mixed integer linear model of a CHP supplying the consumers over a horizon of blocks:
+
+    - the supply temperature arrives at the consumers delay blocks later, the water in the
+      supply pipe before that arrives with initial_temp
+    - the delivered heat is heat capacity * mass flow * (arrival - return temperature),
+      the bilinear product is relaxed with the piecewise McCormick envelopes of Gounaris
+      (linearization.nf4r) on the mass flow partitioned at flow_breakpoints
+    - the heat loss of the pipes is piecewise linear in the supply temperature
+      (linearization.piecewise, at loss_breakpoints)
+    - the CHP produces delivered heat and heat loss within its operation region, at
+      minimal production costs minus the income of its electricity
+
+    Demands, electricity prices, initial pipe temperatures, return temperatures and all
+    breakpoints are cvx.Parameters. The problem is built once in DPP compliant form, so
+    cvxpy canonicalizes it on the first solve only, and every later window just updates
+    the parameter values, see update().
+    """
+
+    def __init__(
+        self,
+        chp: CHP,
+        horizon: int,  # in blocks
+        delay: int,  # in blocks, from the producer to the consumers
+        min_supply_temp: float,  # at the consumers, in °C
+        max_supply_temp: float,  # in °C
+        max_mass_flow: float,  # in kg/s
+        temp_diff_bounds: Tuple[float, float] = (5, 80),  # arrival minus return temp, in °C
+        segments: int = 4,  # of the mass flow in the McCormick envelopes
+        loss_points: int = 5,  # breakpoints of the heat loss
+        heat_capacity: float = 4181.3,  # in J/kg/K
+        energy_unit_conversion: int = 10 ** 6,
+    ) -> None:
+        assert 0 <= delay < horizon
+        self.horizon = horizon
+        self.delay = delay
+        self.segments = segments
+        self.max_mass_flow = max_mass_flow
+
+        self.demand = cvx.Parameter(horizon, name="demand")  # in MW
+        self.e_price = cvx.Parameter(horizon, name="e_price")
+        self.initial_temp = cvx.Parameter(max(delay, 1), name="initial_temp")  # in °C
+        self.return_temp = cvx.Parameter(horizon, name="return_temp")  # in °C
+        self.flow_breakpoints = cvx.Parameter(
+            (horizon, segments + 1), nonneg=True, name="flow_breakpoints"
+        )
+        self.loss_temp = cvx.Parameter((horizon, loss_points), name="loss_temp")
+        self.loss = cvx.Parameter((horizon, loss_points), name="loss")  # in MW
+
+        self.supply_temp = cvx.Variable(horizon, name="supply_temp")
+        self.mass_flow = cvx.Variable(horizon, nonneg=True, name="mass_flow")
+        self.heat_flow = cvx.Variable(horizon, name="heat_flow")  # mass flow * temp diff
+        self.heat_loss = cvx.Variable(horizon, name="heat_loss")  # in MW
+        self.heat = cvx.Variable(horizon, name="heat")  # produced, in MW
+        self.electricity = cvx.Variable(horizon, name="electricity")  # in MW
+
+        if delay > 0:
+            arrival_temp = cvx.hstack([self.initial_temp, self.supply_temp[: horizon - delay]])
+        else:
+            arrival_temp = self.supply_temp
+        temp_diff = arrival_temp - self.return_temp
+        delivered = self.heat_flow * (heat_capacity / energy_unit_conversion)
+
+        region = np.array(chp.operation_region, dtype=float)
+        start, direction = math_functions.polygon_half_planes(region)
+        constraints = [
+            arrival_temp >= min_supply_temp,
+            self.supply_temp <= max_supply_temp,
+            self.mass_flow <= max_mass_flow,
+            delivered >= self.demand,
+            self.heat == delivered + self.heat_loss,
+            self.heat >= np.min(region[:, 0]),
+            self.heat <= np.max(region[:, 0]),
+        ]
+        # the clockwise operation region: on the right of every edge, see check_point_in_polygon
+        for (x0, y0), (dx, dy) in zip(start, direction):
+            constraints.append((self.heat - x0) * dy - (self.electricity - y0) * dx >= 0)
+        if chp.rampQ > 0:
+            constraints.append(cvx.abs(cvx.diff(self.heat)) <= chp.rampQ * chp.maxQ)
+        if chp.rampE > 0:
+            constraints.append(cvx.abs(cvx.diff(self.electricity)) <= chp.rampE * chp.maxE)
+
+        constraints += nf4r(
+            self.mass_flow, temp_diff, self.heat_flow, self.flow_breakpoints, temp_diff_bounds
+        )
+        constraints += piecewise(self.supply_temp, self.heat_loss, self.loss_temp, self.loss)
+
+        cost = chp.cost_array[0] * self.heat + chp.cost_array[1] * self.electricity
+        self.problem = cvx.Problem(
+            cvx.Minimize(cvx.sum(cost) - self.e_price @ self.electricity), constraints
+        )
+        assert self.problem.is_dcp(dpp=True)
+
+        # loss free pipes and evenly partitioned mass flows until update() is told otherwise
+        self.update(
+            flow_breakpoints=np.linspace(0, max_mass_flow, segments + 1),
+            loss_breakpoints=(
+                np.linspace(min_supply_temp, max_supply_temp, loss_points),
+                np.zeros(loss_points),
+            ),
+        )
+
+    @classmethod
+    def from_grid(
+        cls,
+        grid: "Grid",
+        horizon: int,
+        delay: Optional[int] = None,  # the longest transport delay of the last run by default
+        **kwargs,
+    ) -> "LinearProblem":
+        """
+        The model of the first producer of the grid, which has to be a CHP, supplying all of
+        its consumers
+        """
+        chp = next(iter(grid.producers))
+        consumers = list(grid.consumers)
+        if delay is None:
+            delay = min(grid.transport_delay(), horizon - 1)
+
+        return cls(
+            chp,
+            horizon,
+            delay,
+            min_supply_temp=max(np.max(consumer.minimum_t_supply_p) for consumer in consumers),
+            max_supply_temp=chp.temp_upper_bound,
+            max_mass_flow=sum(consumer.heat_exchanger.max_mass_flow_p for consumer in consumers),
+            heat_capacity=chp.heat_capacity,
+            energy_unit_conversion=chp.energy_unit_conversion,
+            **kwargs,
+        )
+
+    def update(
+        self,
+        demand: Optional[np.ndarray] = None,
+        e_price: Optional[np.ndarray] = None,
+        initial_temp: Optional[np.ndarray] = None,
+        return_temp: Optional[np.ndarray] = None,
+        flow_breakpoints: Optional[np.ndarray] = None,  # per block, or the same for all
+        loss_breakpoints: Optional[Tuple[np.ndarray, np.ndarray]] = None,  # (temps, losses)
+    ) -> None:
+        """
+        Sets the parameters of the next window. Parameters that are None keep their values.
+        Breakpoints fitted to the grid come from breakpoints.flow_breakpoints and
+        breakpoints.loss_breakpoints.
+        """
+        horizon = self.horizon
+        if demand is not None:
+            self.demand.value = np.asarray(demand, dtype=float)[:horizon]
+        if e_price is not None:
+            self.e_price.value = np.asarray(e_price, dtype=float)[:horizon]
+        if initial_temp is not None:
+            self.initial_temp.value = np.broadcast_to(
+                np.asarray(initial_temp, dtype=float)[: self.delay], self.initial_temp.shape
+            ).astype(float)
+        if return_temp is not None:
+            self.return_temp.value = np.broadcast_to(return_temp, (horizon,)).astype(float)
+        if flow_breakpoints is not None:
+            self.flow_breakpoints.value = np.broadcast_to(
+                flow_breakpoints, self.flow_breakpoints.shape
+            ).astype(float)
+        if loss_breakpoints is not None:
+            temps, losses = loss_breakpoints
+            self.loss_temp.value = np.broadcast_to(temps, self.loss_temp.shape).astype(float)
+            self.loss.value = np.broadcast_to(losses, self.loss.shape).astype(float)
+
+    def solve(self, **kwargs) -> Dict[str, list]:
+        """
+        Solves the current window (kwargs are passed to cvx.Problem.solve) and returns the
+        controls in the form of the keyword arguments of Grid.run
+        """
+        self.problem.solve(**kwargs)
+        if self.problem.status not in (cvx.OPTIMAL, cvx.OPTIMAL_INACCURATE):
+            raise Exception("The linear problem is {}".format(self.problem.status))
+
+        return {
+            "temp": [np.array(self.supply_temp.value)],
+            "electricity": [np.array(self.electricity.value)],
+        }
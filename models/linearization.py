@@ -1,7 +1,12 @@
 # Standalone functions to linearize non-linear functions in the cvx environment
 
-from typing import List, Tuple
-import cvxpy as cvx  # type: ignore
+from __future__ import annotations
+
+from typing import List, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+if TYPE_CHECKING:
+    import cvxpy as cvx  # type: ignore
 
 
 def piecewise(
@@ -13,9 +18,12 @@ def piecewise(
     """
     Use SOS2 construction to linearize a function, see
     see http://winglpk.sourceforge.net/media/glpk-sos2_02.pdf
+    The intervals only multiply variables, so the constraints stay DPP compliant and the
+    intervals can be parameters without values yet, see LinearProblem.
     """
-    blocks = len(x_intervals.value)
-    n = len(x_intervals.value[0])
+    import cvxpy as cvx  # type: ignore
+
+    blocks, n = x_intervals.shape
     z = cvx.Variable((blocks, n - 1), boolean=True)
     s = cvx.Variable((blocks, n - 1))
     x_interval_diff = x_intervals[:, 1:] - x_intervals[:, 0 : n - 1]
@@ -25,7 +33,7 @@ def piecewise(
 
     return [
         z @ ([1] * (n - 1)) == 1,
-        [[0] * blocks] * (n - 1) <= s,
+        0 <= s,
         s <= z,
         x
         == (cvx.multiply(x_ex_last, z) + cvx.multiply(x_interval_diff, s))
@@ -43,6 +51,8 @@ def nf4r(  # type: ignore
     bounds_x: cvx.expressions.constants.parameter.Parameter,
     bounds_y: Tuple[float, float],
 ) -> List[cvx.constraints.constraint.Constraint]:
+    import cvxpy as cvx  # type: ignore
+
     # See Gounaris, 2009
     forecast_block_count = x.shape[0]
     segments = bounds_x.shape[1] - 1
@@ -55,11 +65,9 @@ def nf4r(  # type: ignore
         boolean=True,
     )
 
-    segment_ones = cvx.Parameter(segments, value=[1] * segments)
-    forecast_ones = cvx.Parameter(
-        forecast_block_count,
-        value=[1] * forecast_block_count,
-    )
+    # constants, as products of parameters (bounds_x) and parameters are not DPP compliant
+    segment_ones = np.ones(segments)
+    forecast_ones = np.ones(forecast_block_count)
 
     # @ = matrix multiplication, see pep-0465
     return [
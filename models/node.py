@@ -2,10 +2,8 @@
 
 from typing import Tuple, List, TYPE_CHECKING, Optional
 import numpy as np  # type: ignore
-from beautifultable import BeautifulTable  # type: ignore
 import os
 from functools import cached_property
-from collections import defaultdict
 from .grid_object import GridObject
 from .plug import Plug
 
@@ -32,33 +30,35 @@ class Node(GridObject):
         self.edges = None
         self.q, self._q_in_W = None, None
         self.entry_step_global = None
+        self.temp, self.mass_flow, self.pressure, self.violations = None, None, None, None
 
-    def clear(self) -> None:
-        self._clear()
+    def clear(self, in_place: bool = False) -> None:
+        self._clear(in_place=in_place)
 
     def _clear(
         self,
         temp: Optional[np.ndarray] = None,
         mass_flow: Optional[np.ndarray] = None,
+        in_place: bool = False,
     ) -> None:
-        super().clear()
+        super().clear(in_place)
 
         blocks = self.blocks
         slots = len(self.slots)
 
         if temp is None:
-            self.temp = np.full((slots, blocks), np.nan, dtype=float)
+            self.temp = self._refill("temp", (slots, blocks), in_place=in_place)
         else:
             self.temp = temp
 
         if mass_flow is None:
-            self.mass_flow = np.full((slots, blocks), np.nan, dtype=float)
+            self.mass_flow = self._refill("mass_flow", (slots, blocks), in_place=in_place)
         else:
             self.mass_flow = mass_flow
 
         self.plugs: List[Optional[Plug]] = [None] * slots
 
-        self.violations = defaultdict(lambda: np.full(blocks, np.nan, dtype=np.float))
+        self._clear_violations(in_place)
         """
         consumer violations:
            key1: 'supply temp' (only negative value) is the minimal temp from the bundle,
@@ -71,7 +71,11 @@ class Node(GridObject):
            additional keys: check specific producer modules for additional keys
         """
 
-        self.pressure = np.full((slots, blocks), np.nan, dtype=float)
+        self.pressure = self._refill("pressure", (slots, blocks), in_place=in_place)
+
+    @property
+    def state_rows(self) -> int:
+        return len(self.slots)
 
     def link(self, edges: Tuple["Edge", ...]) -> None:
         assert len(edges) == len(self.slots)
@@ -120,6 +124,8 @@ class Node(GridObject):
         if csv:
             print(",".join(column_headers))
         else:
+            from beautifultable import BeautifulTable  # type: ignore
+
             ts = os.get_terminal_size()
             table = BeautifulTable(
                 max_width=ts.columns - 1,
@@ -2,6 +2,8 @@
 
 
 class Plug:
+    __slots__ = ("entry_step", "mass", "entry_temp", "entry_step_global")
+
     def __init__(
         self,
         mass: float,
@@ -13,3 +15,9 @@ class Plug:
         self.mass = mass
         self.entry_temp = entry_temp
         self.entry_step_global = entry_step_global
+
+    def copy(self) -> "Plug":
+        """
+        Cheaper than copy.deepcopy, which matters as plugs are copied every step.
+        """
+        return Plug(self.mass, self.entry_step, self.entry_temp, self.entry_step_global)
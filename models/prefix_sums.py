@@ -0,0 +1,75 @@
+# Running sums of per-step arrays of a grid object, to sum up windows of completed steps
+
+from typing import Optional, Tuple
+import numpy as np  # type: ignore
+
+
+class PrefixSums:
+    """
+    Keeps the running sums of the per-step arrays names (attributes of obj): the running sum of
+    a step is the sum over all steps before it. The object records every solved step, see
+    record(). Steps that were not recorded, e.g. the steps skipped by Grid.run with a
+    FastForward, are added on the next query. The sum over a window [start, end) of completed
+    steps is the difference of two running sums, without summing up the steps again.
+    """
+
+    def __init__(self, obj, names: Tuple[str, ...]) -> None:
+        self.obj = obj
+        self.names = names
+        # one column more than steps, the running sum of step 0 is 0
+        self.sums = np.zeros((len(names), obj.blocks + 1), dtype=float)
+        self.recorded = 0  # the steps [0, recorded) are summed up
+
+    def clear(self, step: int = 0) -> None:
+        """
+        Drops the running sums from step on, they are added again on the next query
+        """
+        self.recorded = min(self.recorded, step)
+
+    def record(self, step: int) -> None:
+        """
+        Adds the values of step to the running sums. A step that is solved again replaces the
+        sums from this step on.
+        """
+        if step > self.recorded:
+            return  # added on the next query
+        for i, name in enumerate(self.names):
+            self.sums[i, step + 1] = self.sums[i, step] + getattr(self.obj, name)[step]
+        self.recorded = step + 1
+
+    def _extend(self, end: int) -> None:
+        start = self.recorded
+        if end <= start:
+            return
+        values = np.array([getattr(self.obj, name)[start:end] for name in self.names])
+        self.sums[:, start + 1: end + 1] = (
+            self.sums[:, start: start + 1] + np.cumsum(values, axis=1)
+        )
+        self.recorded = end
+
+    def sum(self, name: str, start: int = 0, end: Optional[int] = None) -> float:
+        """
+        Sum of the values of the steps [start, end), end defaults to the current step
+        """
+        if end is None:
+            end = self.obj.current_step
+        assert 0 <= start <= end <= self.obj.blocks, (start, end)
+        self._extend(end)
+        i = self.names.index(name)
+        total = self.sums[i, end] - self.sums[i, start]
+        if np.isnan(total):
+            # a nan step before start spoils the running sums of all later steps
+            return np.sum(getattr(self.obj, name)[start:end])
+
+        return total
+
+    def roll(self, shift: int) -> None:
+        """
+        Drops the first shift steps, see GridObject.roll()
+        """
+        if shift >= self.recorded:
+            self.recorded = 0
+            return
+
+        self.sums[:, : -shift] = self.sums[:, shift:] - self.sums[:, shift: shift + 1]
+        self.recorded -= shift
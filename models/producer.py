@@ -1,11 +1,14 @@
 # A node that produces energy to bring the incoming water to a definable supply temperature
 
-from typing import Optional
+from typing import List, Optional
 import numpy as np  # type: ignore
 from .node import Node
 
 
 class Producer(Node):
+    violation_kinds = ("supply temp",)
+    summed_quantities = ("pump_power",)
+
     def __init__(
         self,
         blocks: int,  # number of time steps
@@ -34,16 +37,20 @@ class Producer(Node):
         self.production_costs, self.pump_power = None, None
         self.virtual_temp_sup = None
 
-    def clear(self) -> None:
+    def clear(self, in_place: bool = False) -> None:
         blocks = self.blocks
 
-        self.production_costs = np.full(blocks, np.nan, dtype=float)
-        self.q = np.full(blocks, np.nan, dtype=float)  # heat produced in MW
-        self._q_in_W = np.full(blocks, np.nan, dtype=float)  # heat produced in W
-        self.pump_power = np.full(blocks, np.nan, dtype=float)  # in MW
-        self.virtual_temp_sup = np.full(blocks, np.nan, dtype=float)
+        self.production_costs = self._refill("production_costs", (blocks,), in_place=in_place)
+        self.q = self._refill("q", (blocks,), in_place=in_place)  # heat produced in MW
+        self._q_in_W = self._refill("_q_in_W", (blocks,), in_place=in_place)  # heat produced in W
+        self.pump_power = self._refill("pump_power", (blocks,), in_place=in_place)  # in MW
+        self.virtual_temp_sup = self._refill("virtual_temp_sup", (blocks,), in_place=in_place)
+        self._clear_prefix_sums()
+
+        self._clear(in_place=in_place)
 
-        self._clear()
+    def steady_inputs(self) -> List[np.ndarray]:
+        return [self.temp[1] if self.control_with_temp else self.q]
 
     def get_outlet_temp(
         self,
@@ -69,7 +76,8 @@ class Producer(Node):
 
             if self.current_step != 0:
                 try:
-                    temp += self.edges[0].get_outlet_temp()
+                    return_temp, _ = self.edges[0].get_outlet_temp()
+                    temp += return_temp
                 except AssertionError:
                     print(
                         "Warning, when producer is controlled with q and water reaches consumer at the same time step,"
@@ -79,7 +87,8 @@ class Producer(Node):
 
             else:
                 "Used by tabular RL"
-                temp += self.edges[0].get_outlet_temp()
+                return_temp, _ = self.edges[0].get_outlet_temp()
+                temp += return_temp
 
                 if (mass_flow is None) or np.isnan(mass_flow):
                     temp = self.edges[1].initial_plug_cache[0].entry_temp
@@ -114,8 +123,10 @@ class Producer(Node):
                     / (self.density * self.pump_efficiency)
                 ) / self.energy_unit_conversion
 
-        assert self.mass_flow[1, self.current_step] == mass_flow
-
+        # in loops, the return may arrive first, and the supply may differ in the last bit, as
+        # it is split by the valve positions and joined again
+        if not np.isnan(self.mass_flow[1, self.current_step]):
+            assert np.isclose(self.mass_flow[1, self.current_step], mass_flow, rtol=1e-12, atol=0)
 
     def set_temp_or_q(self, mass_flow: float):
         """
@@ -149,16 +160,25 @@ class Producer(Node):
     def solve(
         self,
     ) -> None:
-        pass
+        self.prefix_sums.record(self.current_step)
 
-    def get_margin(self, level_time: int = 0) -> dict:
+    def heat_cost_slope(self, start_step: int, end_step: int) -> np.ndarray:
+        """
+        Cost of one more MW of heat in each of the steps [start_step, end_step)
+        """
+        return np.zeros(end_step - start_step)
+
+    def get_margin(
+        self,
+        level_time: int = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
+    ) -> dict:
+        """
+        Costs and profit in the steps [start_step, end_step), see GridObject.window_values
+        """
         margin = {"cost": {}, "profit": {}}
-        if level_time == 0:
-            margin["cost"]["pump"] = np.sum(self.pump_power[: self.current_step])
-        elif level_time == 1:
-            margin["cost"]["pump"] = self.pump_power[: self.current_step]
-        elif level_time == 2:
-            margin["cost"]["pump"] = self.pump_power[self.current_step - 1]
+        margin["cost"]["pump"] = self.window_values("pump_power", level_time, start_step, end_step)
 
         return margin
 
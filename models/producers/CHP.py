@@ -1,7 +1,7 @@
 # add CHP as a child class of producer
 # instead of an independent thing from grid
 import numpy as np
-from typing import Optional
+from typing import List, Optional
 
 from ..producer import Producer
 from util import math_functions
@@ -10,6 +10,14 @@ from util import math_functions
 class CHP(Producer):
     """CHP unit is the type of the producer"""
 
+    violation_kinds = Producer.violation_kinds + (
+        "Q ramp(%)",
+        "E ramp(%)",
+        "temp ramp(degree)",
+        "operation region(bool)",
+    )
+    summed_quantities = Producer.summed_quantities + ("production_costs", "ramp_cost", "profit")
+
     def __init__(
         self,
         CHPPreset,
@@ -38,6 +46,7 @@ class CHP(Producer):
                 math_functions.points_sort_clockwise(CHPPreset["OperationRegion"])
             )
             self.cost_array = np.array(CHPPreset["FuelCost"])
+            self.half_planes = math_functions.polygon_half_planes(self.operation_region)
         else:
             raise Exception("CHP type not supported")
 
@@ -54,112 +63,153 @@ class CHP(Producer):
         self.E, self.cost, self.profit = None, None, None
         self.production_cost, self.ramp_cost, self.pump_electricity_cost = None, None, None
         self.hisQ, self.hisE, self.hisT = None, None, None
-
-    def clear(self):
-        super(CHP, self).clear()
-        self.E = np.full(self.blocks, np.nan, dtype=float)
-        self.cost = np.full(self.blocks, np.nan, dtype=float)
-        self.profit = np.full(self.blocks, np.nan, dtype=float)
-        self.production_cost = np.full(self.blocks, np.nan, dtype=float)
-        self.ramp_cost = np.full(self.blocks, np.nan, dtype=float)
-        self.pump_electricity_cost = np.full(self.blocks, np.nan, dtype=float)
+        self._evaluated = 0  # the steps [0, _evaluated) are evaluated, see evaluate()
+
+    def clear(self, in_place: bool = False):
+        super(CHP, self).clear(in_place)
+        shape = (self.blocks,)
+        self.E = self._refill("E", shape, in_place=in_place)
+        self.cost = self._refill("cost", shape, in_place=in_place)
+        self.profit = self._refill("profit", shape, in_place=in_place)
+        self.production_cost = self._refill("production_cost", shape, in_place=in_place)
+        self.ramp_cost = self._refill("ramp_cost", shape, in_place=in_place)
+        self.pump_electricity_cost = self._refill(
+            "pump_electricity_cost", shape, in_place=in_place
+        )
         self.hisQ, self.hisE, self.hisT = None, None, None
+        self._evaluated = 0
 
     def preset(self, hisQ, hisE, hisT):
         self.hisQ = hisQ
         self.hisE = hisE
         self.hisT = hisT
 
+    def load_window(self, source: "CHP", start_step: int) -> None:
+        """
+        Takes over the electricity price of the source CHP and uses its production
+        in the step before start_step as history for the ramp checks.
+        """
+        self.e_price = self.window(source.e_price, start_step, self.blocks)
+        if start_step == 0:
+            self.preset(source.hisQ, source.hisE, source.hisT)
+        else:
+            self.preset(
+                source.q[start_step - 1],
+                source.E[start_step - 1],
+                source.temp[1, start_step - 1],
+            )
+
+    def export_state(self, step: int) -> dict:
+        """
+        The production (q, E, supply temperature) in the step before, the history of the
+        ramp checks, nan if there is none
+        """
+        if step == 0:
+            history = (self.hisQ, self.hisE, self.hisT)
+        else:
+            history = (self.q[step - 1], self.E[step - 1], self.temp[1, step - 1])
+
+        return {"history": np.array([np.nan if h is None else h for h in history], dtype=float)}
+
+    def import_state(self, state: dict) -> None:
+        self.preset(*[None if np.isnan(h) else float(h) for h in state["history"]])
+
+    def roll(self, shift: int) -> None:
+        """
+        The price of the freed steps repeats the last one until it is set, see Grid.roll().
+        The ramp checks only look one step back, which stays within the window.
+        """
+        self.evaluate()
+        super(CHP, self).roll(shift)
+        self._evaluated = max(self._evaluated - shift, 0)
+        self.e_price = self.shift(np.array(self.e_price, dtype=float), shift)
+
+    def steady_inputs(self) -> List[np.ndarray]:
+        return super(CHP, self).steady_inputs() + [self.E, self.e_price]
+
+    def fast_forward(self, steps: int) -> None:
+        """
+        Production does not change in the skipped steps, so they do not violate the ramps
+        """
+        step = self.current_step
+        super(CHP, self).fast_forward(steps)
+        for kind in ("Q ramp(%)", "E ramp(%)", "temp ramp(degree)"):
+            self.violations[kind][step: step + steps] = False
+
     def solve(self):
+        """
+        Costs, profit and violations only depend on q, E, temp and e_price of the solved
+        steps, so they are evaluated lazily for all pending steps at once, see evaluate().
+        A step that is solved again is evaluated again.
+        """
+        self._evaluated = min(self._evaluated, self.current_step)
+        self.prefix_sums.clear(self._evaluated)
+
+    def evaluate(self, end_step: Optional[int] = None) -> None:
         # violation of CHP has 4 additional keys:
         # key1: 'Q ramp(%)' how much the change of Q exceed the limit, in percentage
         # key2: 'E ramp(%)' how much the change of E exceed the limit, in percentage
         # key3: 'temp ramp(degree)' how much the change of temp exceed the limit, in degree celsius
         # key4: 'operation region(bool)' true if operate outside of operation region
-        flag = 0
-        # self.E[self.current_step] = e_prod
-        if self.current_step > 0:
-
-            px_q = self.q[self.current_step - 1]
-            px_e = self.E[self.current_step - 1]
-            px_temp = self.temp[1, self.current_step - 1]
+        end_step = self.current_step if end_step is None else min(end_step, self.current_step)
+        start = self._evaluated
+        if end_step <= start:
+            return
+
+        steps = slice(start, end_step)
+        q, E, temp = self.q[steps], self.E[steps], self.temp[1, steps]
+        if start > 0:
+            px_q, px_e, px_temp = self.q[start - 1], self.E[start - 1], self.temp[1, start - 1]
         else:
-            px_q = self.hisQ
-            px_e = self.hisE
-            px_temp = self.hisT
-
-        self.violations["Q ramp(%)"][self.current_step] = self.check_ramp(
-            self.q[self.current_step],
-            px_q,
-            self.rampQ,
-            self.maxQ,
-        )
-        self.violations["E ramp(%)"][self.current_step] = self.check_ramp(
-            self.E[self.current_step],
-            px_e,
-            self.rampE,
-            self.maxE,
-        )
-        self.violations["temp ramp(degree)"][self.current_step] = self.check_ramp(
-            self.temp[1, self.current_step],
-            px_temp,
-            self.rampT,
-        )
+            px_q, px_e, px_temp = self.hisQ, self.hisE, self.hisT
 
-        self.violations["operation region(bool)"][
-            self.current_step
-        ] = math_functions.check_point_in_polygon(
-            [self.q[self.current_step], self.E[self.current_step]],
-            self.operation_region,
-        )
+        self.violations["Q ramp(%)"][steps] = self.check_ramps(q, px_q, self.rampQ, self.maxQ)
+        self.violations["E ramp(%)"][steps] = self.check_ramps(E, px_e, self.rampE, self.maxE)
+        self.violations["temp ramp(degree)"][steps] = self.check_ramps(temp, px_temp, self.rampT)
 
-        self.production_costs[self.current_step] = (
-            self.q[self.current_step] * self.cost_array[0]
-            + self.E[self.current_step] * self.cost_array[1]
+        self.violations["operation region(bool)"][steps] = math_functions.check_points_in_polygon(
+            np.stack([q, E], axis=1), self.half_planes
         )
 
-        self.ramp_cost[self.current_step] = 0
-        self.pump_electricity_cost[self.current_step] = (
-            self.pump_power[self.current_step] * self.e_price[self.current_step]
-        )
-        self.cost[self.current_step] = (
-            self.production_costs[self.current_step]
-            + self.ramp_cost[self.current_step]
-            + self.pump_electricity_cost[self.current_step]
-        )
-        self.profit[self.current_step] = (
-            self.E[self.current_step] * self.e_price[self.current_step]
+        e_price = np.asarray(self.e_price, dtype=float)[steps]
+        self.production_costs[steps] = q * self.cost_array[0] + E * self.cost_array[1]
+        self.ramp_cost[steps] = 0
+        self.pump_electricity_cost[steps] = self.pump_power[steps] * e_price
+        self.cost[steps] = (
+            self.production_costs[steps] + self.ramp_cost[steps] + self.pump_electricity_cost[steps]
         )
+        self.profit[steps] = E * e_price
+        self._evaluated = end_step
 
-    def get_margin(self, level_time: int = 0) -> dict:
-        margin = super(CHP, self).get_margin(level_time)
+    def heat_cost_slope(self, start_step: int, end_step: int) -> np.ndarray:
+        return np.full(end_step - start_step, self.cost_array[0], dtype=float)
 
-        if level_time == 0:
-            margin["cost"]["production_cost"] = np.sum(
-                self.production_costs[: self.current_step]
-            )
-            margin["cost"]["ramp_cost"] = np.sum(self.ramp_cost[: self.current_step])
-            margin["profit"] = np.sum(self.profit[: self.current_step])
-        elif level_time == 1:
-            margin["cost"]["production_cost"] = self.production_costs[
-                : self.current_step
-            ]
-            margin["cost"]["ramp_cost"] = self.ramp_cost[: self.current_step]
-            margin["profit"] = self.profit[: self.current_step]
-        elif level_time == 2:
-            margin["cost"]["production_cost"] = self.production_costs[
-                self.current_step - 1
-            ]
-            margin["cost"]["ramp_cost"] = self.ramp_cost[self.current_step - 1]
-            margin["profit"] = self.profit[self.current_step - 1]
+    def get_margin(
+        self,
+        level_time: int = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
+    ) -> dict:
+        margin = super(CHP, self).get_margin(level_time, start_step, end_step)
+        window = (level_time, start_step, end_step)
+
+        margin["cost"]["production_cost"] = self.window_values("production_costs", *window)
+        margin["cost"]["ramp_cost"] = self.window_values("ramp_cost", *window)
+        margin["profit"] = self.window_values("profit", *window)
 
         return margin
 
-    # if range is provided, calculated with percentage limit, otherwise absolute limit
-    def check_ramp(self, x, px, limit, range=1):
-        if px is None:
-            return False
-        elif (limit > 0) & (px > 0) & (abs(x - px) / range > limit):
-            return abs(x - px) / range - limit
-        else:
-            return False
+    @staticmethod
+    def check_ramps(x: np.ndarray, px, limit, range=1) -> np.ndarray:
+        """
+        Excess of the ramps between consecutive steps x over the limit, px is the value in the
+        step before x[0]. If range is provided, the limit is a percentage of it, otherwise
+        absolute. Without a limit or range, or from a previous value <= 0, there is no excess.
+        """
+        if not (limit > 0 and range > 0):
+            return np.zeros(len(x))
+        previous = np.empty_like(x)
+        previous[0] = np.nan if px is None else px
+        previous[1:] = x[:-1]
+        excess = np.abs(x - previous) / range - limit
+        return np.where((previous > 0) & (excess > 0), excess, 0.0)
@@ -0,0 +1,181 @@
+# a fleet of heat-only generators, that acts as one producer in the grid
+import numpy as np
+from typing import Optional
+
+from .CHP import CHP
+
+
+class CHPFleet(CHP):
+    """
+    Fleet of generators (FleetPreset["Generators"], see util.config), which produces the heat
+    q of the producer together. The heat of every step is dispatched in merit order: the
+    cheapest units, whose capacity covers q, are committed and run at least at their minimum
+    load, the rest of q is filled up in merit order. Starting a unit that was off in the step
+    before costs its startup cost. Dispatch and costs are evaluated lazily for all pending
+    steps and units at once, like the costs of a CHP, see evaluate().
+
+    The commitment only follows the fuel costs and capacities: startup costs and the status
+    of the step before are charged, but do not keep a unit on or another one off, so a
+    fluctuating q may start the same unit again and again.
+    """
+
+    violation_kinds = CHP.violation_kinds + ("capacity(MW)", "min load(MW)")
+    summed_quantities = CHP.summed_quantities + ("startup_cost",)
+
+    def __init__(
+        self,
+        FleetPreset,
+        blocks: int,  # number of time steps
+        heat_capacity: float = 4181.3,  # in J/kg/K # for the water
+        temp_upper_bound=120,
+        pump_efficiency: float = 0.9,
+        density=963,
+        control_with_temp: bool = False,
+        production_costs: Optional[np.ndarray] = None,  # in EUR/J
+        energy_unit_conversion: int = 10 ** 6,
+        id: Optional[int] = None,
+    ):
+        generators = FleetPreset["Generators"]
+        for generator in generators:
+            if (generator["CHPType"] != "keypts") or np.any(
+                np.array(generator["OperationRegion"])[:, 1] != 0
+            ):
+                raise Exception("Only heat-only generators are supported in a fleet")
+
+        heat = [np.array(generator["OperationRegion"])[:, 0] for generator in generators]
+        # units in merit order, the cheapest heat first
+        order = np.argsort([generator["FuelCost"][0] for generator in generators], kind="stable")
+        self.unit_min_q = np.array([np.min(heat[i]) for i in order])  # in MW
+        self.unit_max_q = np.array([np.max(heat[i]) for i in order])  # in MW
+        self.unit_cost = np.array([generators[i]["FuelCost"][0] for i in order])
+        self.unit_startup_cost = np.array([generators[i]["StartupCost"] for i in order])
+        self.initial_status = np.array([generators[i]["InitialStatus"] for i in order], dtype=bool)
+        self.units = len(generators)
+        self.merit_order = order  # index in FleetPreset["Generators"] of each unit
+
+        capacity = np.sum(self.unit_max_q)
+        super(CHPFleet, self).__init__(
+            {
+                "CHPType": "keypts",
+                "OperationRegion": [[0, 0], [capacity, 0]],
+                "Efficiency": np.dot(
+                    self.unit_max_q, [generators[i]["Efficiency"] for i in order]
+                ) / capacity,
+                # production costs are added up per unit, see evaluate()
+                "FuelCost": [0, 0],
+                "MaxRampRateQ": FleetPreset.get("MaxRampRateQ", -1),
+                "MaxRampRateE": FleetPreset.get("MaxRampRateE", -1),
+                "MaxRampRateTemp": FleetPreset.get("MaxRampRateTemp", -1),
+            },
+            blocks,
+            heat_capacity,
+            temp_upper_bound,
+            pump_efficiency,
+            density,
+            control_with_temp,
+            production_costs,
+            energy_unit_conversion,
+            id,
+        )
+        self.unit_q, self.unit_status, self.startup_cost = None, None, None
+
+    def clear(self, in_place: bool = False):
+        super(CHPFleet, self).clear(in_place)
+        shape = (self.units, self.blocks)
+        self.unit_q = self._refill("unit_q", shape, in_place=in_place)  # heat per unit in MW
+        self.unit_status = self._refill("unit_status", shape, in_place=in_place)  # 1 if on
+        self.startup_cost = self._refill("startup_cost", (self.blocks,), in_place=in_place)
+
+    def load_window(self, source: "CHPFleet", start_step: int) -> None:
+        """
+        Units that were on in the step before start_step are on initially
+        """
+        super(CHPFleet, self).load_window(source, start_step)
+        if start_step == 0:
+            self.initial_status = source.initial_status.copy()
+        else:
+            self.initial_status = source.unit_status[:, start_step - 1] == 1
+
+    def export_state(self, step: int) -> dict:
+        """
+        Units that are on in the step before are on initially
+        """
+        state = super(CHPFleet, self).export_state(step)
+        if step == 0:
+            state["initial_status"] = self.initial_status.copy()
+        else:
+            self.evaluate(step)
+            state["initial_status"] = self.unit_status[:, step - 1] == 1
+
+        return state
+
+    def import_state(self, state: dict) -> None:
+        super(CHPFleet, self).import_state(state)
+        self.initial_status = np.array(state["initial_status"], dtype=bool)
+
+    def evaluate(self, end_step: Optional[int] = None) -> None:
+        start = self._evaluated
+        super(CHPFleet, self).evaluate(end_step)
+        end = self._evaluated
+        if end <= start:
+            return
+
+        steps = slice(start, end)
+        q = self.q[steps]
+        # number of committed units: the fewest cheapest ones, whose capacity covers q
+        capacity = np.cumsum(self.unit_max_q)
+        committed = np.minimum(np.searchsorted(capacity, q, side="left") + 1, self.units)
+        committed = np.where(q > 0, committed, 0)
+        on = np.arange(self.units)[:, None] < committed[None, :]  # (units, steps)
+
+        min_q = np.where(on, self.unit_min_q[:, None], 0)
+        headroom = np.where(on, (self.unit_max_q - self.unit_min_q)[:, None], 0)
+        filled_before = np.cumsum(headroom, axis=0) - headroom
+        remaining = q - np.sum(min_q, axis=0)
+        unit_q = min_q + np.clip(remaining[None, :] - filled_before, 0, headroom)
+        self.unit_q[:, steps] = unit_q
+        self.unit_status[:, steps] = on
+
+        was_on = np.empty_like(on)
+        was_on[:, 0] = self.unit_status[:, start - 1] == 1 if start > 0 else self.initial_status
+        was_on[:, 1:] = on[:, :-1]
+        self.startup_cost[steps] = self.unit_startup_cost @ (on & ~was_on)
+        self.production_costs[steps] = self.unit_cost @ unit_q
+        self.cost[steps] = (
+            self.production_costs[steps]
+            + self.ramp_cost[steps]
+            + self.startup_cost[steps]
+            + self.pump_electricity_cost[steps]
+        )
+
+        self.violations["capacity(MW)"][steps] = np.maximum(q - capacity[-1], 0)
+        self.violations["min load(MW)"][steps] = np.maximum(-remaining, 0)
+        self.violations["operation region(bool)"][steps] = (
+            self.violations["capacity(MW)"][steps] + self.violations["min load(MW)"][steps]
+        ) == 0
+
+    def heat_cost_slope(self, start_step: int, end_step: int) -> np.ndarray:
+        """
+        Cost of the first committed unit in merit order that is not at full load, or of the
+        next unit to commit if all are
+        """
+        self.evaluate(end_step)
+        steps = slice(start_step, end_step)
+        on = self.unit_status[:, steps] == 1
+        partial = on & (self.unit_q[:, steps] < self.unit_max_q[:, None])
+        next_unit = np.minimum(np.sum(on, axis=0), self.units - 1)
+        unit = np.where(np.any(partial, axis=0), np.argmax(partial, axis=0), next_unit)
+        return self.unit_cost[unit]
+
+    def get_margin(
+        self,
+        level_time: int = 0,
+        start_step: int = 0,
+        end_step: Optional[int] = None,  # the current step by default
+    ) -> dict:
+        margin = super(CHPFleet, self).get_margin(level_time, start_step, end_step)
+        margin["cost"]["startup_cost"] = self.window_values(
+            "startup_cost", level_time, start_step, end_step
+        )
+
+        return margin
@@ -1 +1,2 @@
 from .CHP import CHP
+from .CHP_fleet import CHPFleet
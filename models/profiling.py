@@ -0,0 +1,261 @@
+# A profiler of the hot paths of the simulation, that only costs time while a grid is profiled
+
+import json
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter_ns
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# the profiler of the grid that is solved right now, or of the latest with grid.profile()
+# block outside of solving, e.g. for the lazy evaluation of the producer costs. None if
+# that grid is not profiled.
+active: Optional["Profiler"] = None
+
+# (class, method) timed while profiling. The wrappers are only patched into the classes while
+# at least one grid is profiled, so the methods are untouched otherwise.
+hot_paths = [
+    ("Grid", "_solve"),
+    ("Consumer", "solve"),
+    ("Producer", "solve"),
+    ("CHP", "solve"),
+    ("CHP", "evaluate"),
+    ("CHPFleet", "evaluate"),
+    ("Producer", "get_outlet_temp"),
+    ("Branch", "set_mass_flow"),
+    ("Junction", "set_mass_flow"),
+    ("Edge", "set_mass_flow"),
+    ("Edge", "get_outlet_temp"),
+    ("Edge", "get_outlet_temp_mass_bundle"),
+    ("Edge", "push_plugs_outside"),
+    ("HeatExchanger", "solve"),
+    ("HeatExchanger", "_thermal_regime"),
+]
+
+_patched: Dict[Tuple[type, str], object] = {}  # original methods
+_profiling = 0  # number of grids that are profiled
+
+
+def _classes() -> Dict[str, type]:
+    # imported here, as the models import this module
+    from .grid import Grid
+    from .consumer import Consumer
+    from .producer import Producer
+    from .producers.CHP import CHP
+    from .producers.CHP_fleet import CHPFleet
+    from .branch import Branch
+    from .junction import Junction
+    from .edge import Edge
+    from .heat_exchanger import HeatExchanger
+
+    return {
+        cls.__name__: cls
+        for cls in (Grid, Consumer, Producer, CHP, CHPFleet, Branch, Junction, Edge, HeatExchanger)
+    }
+
+
+def _timed(method, method_name: str):
+    @wraps(method)
+    def wrapper(obj, *args, **kwargs):
+        profiler = active
+        if profiler is None:
+            return method(obj, *args, **kwargs)
+
+        profiler._children.append(0)
+        start = perf_counter_ns()
+        try:
+            return method(obj, *args, **kwargs)
+        finally:
+            profiler._record(type(obj).__name__, method_name, start, perf_counter_ns())
+
+    return wrapper
+
+
+def _grid_solve(method):
+    """
+    Makes the profiler of the grid active while the grid is solved, so that every grid only
+    records its own objects.
+    """
+    timed = _timed(method, method.__name__)
+
+    @wraps(method)
+    def wrapper(grid, *args, **kwargs):
+        global active
+        previous = active
+        active = grid.profiler
+        try:
+            return timed(grid, *args, **kwargs)
+        finally:
+            active = previous
+
+    return wrapper
+
+
+def _patch() -> None:
+    for class_name, method_name in hot_paths:
+        cls = _classes()[class_name]
+        # inherited methods are timed at the class that defines them
+        if method_name not in cls.__dict__:
+            continue
+        method = cls.__dict__[method_name]
+        _patched[(cls, method_name)] = method
+        if class_name == "Grid":
+            setattr(cls, method_name, _grid_solve(method))
+        else:
+            setattr(cls, method_name, _timed(method, method_name))
+
+
+def _unpatch() -> None:
+    for (cls, method_name), method in _patched.items():
+        setattr(cls, method_name, method)
+    _patched.clear()
+
+
+class Profiler:
+    """
+    Records, within the with block, the time and number of calls of each method in
+    hot_paths per object type, together with counters of the models: Newton iterations
+    of the heat exchangers, interpolation hits and fallbacks, and plugs processed per edge.
+    Times are inclusive, self time excludes the time of timed methods called within.
+
+    with grid.profile() as profiler:
+        grid.run(...)
+    print(profiler.table())
+    """
+
+    def __init__(self, grid: "Grid", trace: bool = False) -> None:
+        """
+        trace: keep every call, to export them as a Chrome trace
+        """
+        self.grid = grid
+        self.trace = trace
+        # (type, method) -> [calls, total ns, self ns]
+        self.times: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0, 0])
+        # (type, counter) -> [events, sum]
+        self.counters: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0])
+        # (type, counter) -> object id -> sum
+        self.object_counters: Dict[Tuple[str, str], Dict[int, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.events: List[Tuple[str, str, int, int]] = []
+        self._children: List[int] = []  # time spent in timed calls of each open call
+        self._previous: Optional["Profiler"] = None  # active before the with block
+
+    def __enter__(self) -> "Profiler":
+        global _profiling, active
+        if _profiling == 0:
+            _patch()
+        _profiling += 1
+        self.grid.profiler = self
+        self._previous, active = active, self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _profiling, active
+        active = self._previous
+        self.grid.profiler = None
+        _profiling -= 1
+        if _profiling == 0:
+            _unpatch()
+
+    def _record(self, type_name: str, method_name: str, start: int, end: int) -> None:
+        duration = end - start
+        own = duration - self._children.pop()
+        if self._children:
+            self._children[-1] += duration
+
+        times = self.times[(type_name, method_name)]
+        times[0] += 1
+        times[1] += duration
+        times[2] += own
+        if self.trace:
+            self.events.append((type_name, method_name, start, duration))
+
+    def count(self, type_name: str, counter: str, value: float = 1) -> None:
+        counts = self.counters[(type_name, counter)]
+        counts[0] += 1
+        counts[1] += value
+
+    def count_object(self, obj, counter: str, value: float = 1) -> None:
+        """
+        Counts per object as well as per type
+        """
+        self.count(type(obj).__name__, counter, value)
+        self.object_counters[(type(obj).__name__, counter)][obj.id] += value
+
+    def table(self) -> str:
+        lines = [
+            "{:<40} {:>10} {:>12} {:>12} {:>10}".format(
+                "Method", "Calls", "Total (ms)", "Self (ms)", "Mean (µs)"
+            )
+        ]
+        for (type_name, method_name), (calls, total, own) in sorted(
+            self.times.items(), key=lambda item: -item[1][1]
+        ):
+            lines.append(
+                "{:<40} {:>10} {:>12.1f} {:>12.1f} {:>10.1f}".format(
+                    "{}.{}".format(type_name, method_name),
+                    calls,
+                    total / 1e6,
+                    own / 1e6,
+                    total / calls / 1e3,
+                )
+            )
+
+        lines.append("")
+        lines.append("{:<40} {:>10} {:>12} {:>12}".format("Counter", "Events", "Sum", "Mean"))
+        for (type_name, counter), (events, total) in sorted(self.counters.items()):
+            lines.append(
+                "{:<40} {:>10} {:>12.0f} {:>12.2f}".format(
+                    "{}: {}".format(type_name, counter), events, total, total / events
+                )
+            )
+
+        for (type_name, counter), per_object in sorted(self.object_counters.items()):
+            values = list(per_object.values())
+            lines.append(
+                "{:<40} {:>10} {:>12.0f} {:>12.2f}  (max {:.0f} at id {})".format(
+                    "{}: {} per object".format(type_name, counter),
+                    len(values),
+                    sum(values),
+                    sum(values) / len(values),
+                    max(values),
+                    max(per_object, key=per_object.get),
+                )
+            )
+
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """
+        The recorded calls in the Chrome trace event format (open in chrome://tracing or
+        Perfetto). Needs trace=True, otherwise only the counters are included.
+        """
+        if len(self.events) > 0:
+            origin = min(start for _, _, start, _ in self.events)
+        events = [
+            {
+                "name": "{}.{}".format(type_name, method_name),
+                "cat": type_name,
+                "ph": "X",
+                "ts": (start - origin) / 1e3,  # in µs
+                "dur": duration / 1e3,
+                "pid": 0,
+                "tid": 0,
+            }
+            for type_name, method_name, start, duration in self.events
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "{}: {}".format(type_name, counter): total
+                for (type_name, counter), (_, total) in self.counters.items()
+            },
+        }
+
+    def save_chrome_trace(self, file: str) -> None:
+        with open(file, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,128 @@
+# A driver that runs a grid in a receding horizon (model predictive control) loop
+
+from typing import Callable, Dict, List, Optional
+from time import perf_counter
+import numpy as np  # type: ignore
+
+from .grid import Grid
+from .grid_object import GridObject
+
+
+class RecedingHorizon:
+    """
+    In every window, the planning grid takes over the state of the real grid at the current
+    step and is handed to the policy, which returns the controls for the next steps.
+    The real grid is then advanced by action_horizon steps with these controls.
+
+    The real grid is never reset between windows, so its plugs and producer history are
+    carried forward as they are. The planning grid is built once (with planning_horizon
+    blocks and the same topology as the real grid) and only takes over the state.
+    """
+
+    def __init__(
+        self,
+        grid: Grid,
+        planning_grid: Grid,
+        policy: Callable[[Grid, int], Dict[str, list]],
+        action_horizon: int = 1,
+    ) -> None:
+        """
+        The policy is called with the planning grid and the current step of the real grid.
+        It returns the keyword arguments of Grid.run (heat or temp, electricity, producer_ids,
+        valve_pos), with at least action_horizon values per producer.
+        """
+        assert action_horizon <= planning_grid.blocks
+
+        self.grid = grid
+        self.planning_grid = planning_grid
+        self.policy = policy
+        self.action_horizon = action_horizon
+        self.planning_horizon = planning_grid.blocks
+
+        self.latency: List[Dict[str, float]] = []
+        """
+        latency: one entry per window, with the keys
+           'step': the step of the real grid at which the window starts
+           'fork': seconds spent to carry the state over to the planning grid
+           'policy': seconds spent in the policy (including its own planning runs)
+           'simulation': seconds spent to advance the real grid
+        """
+
+    def run(self, end_step: Optional[int] = None) -> None:
+        """
+        Runs windows from the current step of the real grid until end_step.
+        The real grid has to be reset before the first call.
+        """
+        step = GridObject._current_step
+        if end_step is None:
+            end_step = self.grid.blocks
+
+        while step < end_step:
+            self.step_window(min(self.action_horizon, end_step - step))
+            step = GridObject._current_step
+
+    def step_window(self, action_steps: Optional[int] = None) -> None:
+        if action_steps is None:
+            action_steps = self.action_horizon
+
+        # all grid objects share one step counter, the planning grid resets it
+        step = GridObject._current_step
+
+        started_at = perf_counter()
+        self.planning_grid.load_window(self.grid, step)
+        forked_at = perf_counter()
+
+        controls = self.policy(self.planning_grid, step)
+        decided_at = perf_counter()
+
+        GridObject._current_step = step
+        self.grid.run(**self.cut_controls(controls, action_steps))
+        simulated_at = perf_counter()
+
+        self.latency.append(
+            {
+                "step": step,
+                "fork": forked_at - started_at,
+                "policy": decided_at - forked_at,
+                "simulation": simulated_at - decided_at,
+            }
+        )
+
+    @staticmethod
+    def cut_controls(controls: Dict[str, list], action_steps: int) -> Dict[str, list]:
+        """
+        Keeps only the first action_steps values of the controls returned by the policy.
+        """
+        def cut_values(values):
+            if values is None:
+                return None
+            values = np.atleast_1d(values)[:action_steps]
+            # Grid.run expects scalars when running a single step
+            return values[0] if action_steps == 1 else values
+
+        cut = dict(controls)
+        for key in ["heat", "temp", "electricity"]:
+            if cut.get(key) is not None:
+                cut[key] = [cut_values(c) for c in cut[key]]
+
+        if cut.get("valve_pos") is not None:
+            # valve positions per side slot (rows) keep their rows
+            cut["valve_pos"] = {
+                n_id: np.asarray(v_pos)[:, :action_steps] if np.ndim(v_pos) == 2
+                else cut_values(v_pos)
+                for n_id, v_pos in cut["valve_pos"].items()
+            }
+
+        return cut
+
+    @property
+    def window_latency(self) -> np.ndarray:
+        """
+        Total seconds spent per window
+        """
+        return np.array(
+            [
+                latency["fork"] + latency["policy"] + latency["simulation"]
+                for latency in self.latency
+            ]
+        )
@@ -0,0 +1,203 @@
+# A sink that streams the results of completed steps of a grid to disk while it runs
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+from .grid_object import GridObject
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+# quantities of the state store, one row per slot of each node and two rows per edge
+state_quantities = ("temp", "mass_flow", "pressure")
+# quantities with one row per edge, consumer and producer
+object_quantities = ("heat_loss", "heat_delivered", "margin")
+
+
+class ResultSink:
+    """
+    Writes the results of the grid in chunks of steps, as soon as they are completed, so that
+    they can be processed while the grid runs.
+
+    Every quantity is stored column by column: with format "npy", as one .npy file of shape
+    (rows, steps) per chunk in directory/<quantity>/, with format "hdf5" (needs h5py) as one
+    dataset of shape (rows, steps) per quantity, that grows by each chunk.
+    directory/meta.json lists the rows of each quantity (object id, first row, last row + 1)
+    and the chunks that were written. ResultSink.read() concatenates the chunks again.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        quantities: Tuple[str, ...] = state_quantities + object_quantities,
+        object_ids: Optional[List[int]] = None,  # nodes and edges, all if None
+        chunk_size: int = 96,  # in steps
+        format: str = "npy",  # "npy" or "hdf5"
+    ) -> None:
+        for quantity in quantities:
+            assert quantity in state_quantities + object_quantities, quantity
+        assert format in ("npy", "hdf5")
+
+        self.directory = directory
+        self.quantities = quantities
+        self.object_ids = object_ids
+        self.chunk_size = chunk_size
+        self.format = format
+        self.written = 0  # steps written so far
+        self.chunks: List[Tuple[int, int]] = []
+        self.rows: Dict[str, List[Tuple[int, int, int]]] = {}
+        self._file = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _objects(self, grid: "Grid", quantity: str) -> list:
+        if quantity == "heat_loss":
+            objects = grid.edges
+        elif quantity == "heat_delivered":
+            objects = list(grid.consumers)
+        else:
+            objects = list(grid.producers)
+
+        if self.object_ids is None:
+            return objects
+
+        return [obj for obj in objects if obj.id in self.object_ids]
+
+    def _bind(self, grid: "Grid") -> None:
+        """
+        Describes the rows of each quantity, when the first chunk is written
+        """
+        for quantity in self.quantities:
+            if quantity in state_quantities:
+                offsets = grid.state.row_offsets(self.object_ids)
+                self.rows[quantity] = [(id, s.start, s.stop) for id, s in offsets.items()]
+            else:
+                self.rows[quantity] = [
+                    (obj.id, row, row + 1)
+                    for row, obj in enumerate(self._objects(grid, quantity))
+                ]
+
+        if self.format == "hdf5":
+            try:
+                import h5py  # type: ignore
+            except ImportError:
+                raise Exception("Writing results in hdf5 format needs h5py to be installed")
+
+            self._file = h5py.File(os.path.join(self.directory, "results.h5"), "w")
+            for quantity in self.quantities:
+                rows = self.rows[quantity][-1][2] if self.rows[quantity] else 0
+                self._file.create_dataset(
+                    quantity,
+                    shape=(rows, 0),
+                    maxshape=(rows, None),
+                    chunks=(rows, self.chunk_size) if rows > 0 else None,
+                    dtype=float,
+                )
+        else:
+            for quantity in self.quantities:
+                os.makedirs(os.path.join(self.directory, quantity), exist_ok=True)
+
+    def _values(self, grid: "Grid", quantity: str, start: int, end: int) -> np.ndarray:
+        """
+        Values of the quantity in the steps [start, end)
+        """
+        if quantity in state_quantities:
+            return grid.state.get(quantity, self.object_ids, start, end)
+
+        objects = self._objects(grid, quantity)
+        if quantity == "heat_loss":
+            values = [edge.heat_loss[start:end] for edge in objects]
+        elif quantity == "heat_delivered":
+            values = [consumer.q[start:end] for consumer in objects]
+        else:
+            margins = grid.get_detailed_margin(
+                producer_ids=[p.id for p in objects],
+                level=2,
+                level_time=1,
+                start_step=start,
+                end_step=end,
+            )
+            values = [margins[p.id]["profit"] - margins[p.id]["cost"] for p in objects]
+
+        return np.array(values, dtype=float).reshape(-1, end - start)
+
+    def step_completed(self, grid: "Grid") -> None:
+        """
+        Called by the grid after every step, writes a chunk once chunk_size steps are completed
+        """
+        if grid.step_offset + GridObject._current_step - self.written >= self.chunk_size:
+            self.flush(grid)
+
+    def flush(self, grid: "Grid") -> None:
+        """
+        Writes all completed steps that were not written yet. Steps are counted over the
+        whole run, including the steps a rolling grid dropped, see Grid.roll().
+        """
+        offset = grid.step_offset
+        end = offset + GridObject._current_step
+        if end <= self.written:
+            assert end == self.written, "The grid was reset, use a new sink for a new run"
+            return
+
+        if len(self.chunks) == 0:
+            self._bind(grid)
+
+        start = self.written
+        for quantity in self.quantities:
+            values = self._values(grid, quantity, start - offset, end - offset)
+            if self.format == "hdf5":
+                dataset = self._file[quantity]
+                dataset.resize(end, axis=1)
+                dataset[:, start:end] = values
+            else:
+                np.save(
+                    os.path.join(self.directory, quantity, "{:09d}.npy".format(start)),
+                    values,
+                )
+
+        self.chunks.append((start, end))
+        self.written = end
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "format": self.format,
+                    "quantities": list(self.quantities),
+                    "rows": self.rows,
+                    "chunks": self.chunks,
+                },
+                f,
+            )
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def read(directory: str, quantity: str) -> Tuple[np.ndarray, List[Tuple[int, int, int]]]:
+        """
+        Returns all written steps of a quantity, shape (rows, steps), and its rows
+        (object id, first row, last row + 1).
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+
+        rows = [tuple(r) for r in meta["rows"][quantity]]
+        if meta["format"] == "hdf5":
+            import h5py  # type: ignore
+
+            with h5py.File(os.path.join(directory, "results.h5"), "r") as f:
+                return f[quantity][:], rows
+
+        chunks = [
+            np.load(
+                os.path.join(directory, quantity, "{:09d}.npy".format(start)), mmap_mode="r"
+            )
+            for start, _ in meta["chunks"]
+        ]
+        return np.concatenate(chunks, axis=1), rows
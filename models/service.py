@@ -0,0 +1,478 @@
+# A local simulation service, that keeps warm grids in worker processes for other processes
+# To avoid import errors, run it one folder above the root folder (grid-penguin):
+# python -m grid-penguin.models.service --unix /tmp/grid.sock \
+#     --network parallel=grid-penguin/cases/networks/parallel_consumers.json --workers 4
+
+import argparse
+import asyncio
+import collections
+import importlib
+import io
+import json
+import multiprocessing as mp
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np  # type: ignore
+
+from .grid_object import GridObject
+from .grid_state import GridState
+
+# lengths of the JSON header and of the binary payload of a frame
+_frame = struct.Struct("<IQ")
+
+Address = Union[str, Tuple[str, int]]  # path of a Unix socket, or (host, port) of TCP
+
+
+def encode_arrays(arrays: Optional[Dict[str, np.ndarray]]) -> bytes:
+    if not arrays:
+        return b""
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_arrays(payload: bytes) -> Dict[str, np.ndarray]:
+    if not payload:
+        return {}
+
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def encode_frame(header: dict, payload: bytes = b"") -> bytes:
+    """
+    A frame is the lengths of its parts, a JSON header and a payload of NumPy arrays (.npz)
+    """
+    header_bytes = json.dumps(header).encode()
+    return _frame.pack(len(header_bytes), len(payload)) + header_bytes + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[dict, bytes]]:
+    """
+    The next frame of the stream, None at its end
+    """
+    try:
+        lengths = await reader.readexactly(_frame.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    header_length, payload_length = _frame.unpack(lengths)
+    header = json.loads(await reader.readexactly(header_length))
+    return header, await reader.readexactly(payload_length)
+
+
+def _apply(grid, op: dict, arrays: Dict[str, np.ndarray]) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Applies one operation of a job to the grid. Arrays are referenced by their name in the
+    payload of the job. Returns the header and the arrays of its result.
+    """
+    name = op["op"]
+    if name == "reset":
+        grid.reset(
+            demands=None if "demands" not in op else list(arrays[op["demands"]]),
+            e_price=None if "e_price" not in op else list(arrays[op["e_price"]]),
+            in_place=True,
+        )
+        if "state" in op:
+            grid.load_state(GridState.from_bytes(arrays[op["state"]].tobytes()), in_place=True)
+        return {}, {}
+
+    if name == "run":
+        controls = {
+            key: list(arrays[op[key]]) for key in ("heat", "temp", "electricity") if key in op
+        }
+        grid.run(producer_ids=op.get("producer_ids"), end_step=op.get("end_step"), **controls)
+        return {"step": GridObject._current_step}, {}
+
+    if name == "get_object_status":
+        # the stacked form of Grid.get_object_status, see Grid.get_state_arrays
+        start_step = op.get("start_step", 0)
+        end_step = op.get("end_step")
+        result, rows = grid.get_state_arrays(op.get("object_ids"), start_step, end_step)
+        header = {"rows": {str(id): [s.start, s.stop] for id, s in rows.items()}}
+        if op.get("violations", False):
+            violations, ids, kinds = grid.get_violations(start_step, end_step)
+            result["violations"] = violations
+            header.update({"violation_ids": ids, "violation_kinds": list(kinds)})
+        return header, result
+
+    if name == "export_state":
+        state = grid.export_state(op.get("time_step"))
+        return {}, {"state": np.frombuffer(state.to_bytes(), dtype=np.uint8)}
+
+    raise Exception("Unknown operation {}".format(name))
+
+
+def _worker(conn, networks: Dict[str, str], config_name: str, warm: Dict[str, list]) -> None:
+    """
+    Runs the jobs sent by SimulationService in a subprocess. Grids are built on first use
+    per network and number of blocks, and kept with their step counter between jobs.
+    """
+    from ..cases import network_file
+
+    config = importlib.import_module(config_name)
+    grids: Dict[Tuple[str, int], object] = {}
+    steps: Dict[Tuple[str, int], int] = {}
+
+    def build(network: str, demands) -> Tuple[str, int]:
+        demands = [np.asarray(demand, dtype=float) for demand in demands]
+        key = (network, len(demands[0]))
+        if key not in grids:
+            grids[key] = network_file.build_grid(networks[network], demands, None, config)
+            steps[key] = 0
+        return key
+
+    for network, demands in warm.items():
+        build(network, demands)
+    conn.send(("ready", None, sorted({network for network, _ in grids})))
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            conn.close()
+            return
+
+        job_id, network, blocks, ops, payload = message
+        try:
+            arrays = decode_arrays(payload)
+            key = (network, blocks)
+            if key not in grids:
+                demands = [arrays[op["demands"]] for op in ops if "demands" in op]
+                if not demands:
+                    raise Exception(
+                        "The first job on network {} with {} blocks has to reset its demands"
+                        .format(network, blocks)
+                    )
+                build(network, demands[0])
+            grid = grids[key]
+            GridObject._current_step = steps[key]
+            for i, op in enumerate(ops):
+                header, result = _apply(grid, op, arrays)
+                steps[key] = GridObject._current_step
+                header.update({"id": job_id, "index": i, "op": op["op"]})
+                conn.send(("result", job_id, header, encode_arrays(result)))
+            conn.send(("done", job_id, sorted({network for network, _ in grids})))
+        except Exception as e:
+            conn.send(("error", job_id, "{}: {}".format(type(e).__name__, e)))
+
+
+class _Job:
+    def __init__(self, header: dict, payload: bytes, writer: asyncio.StreamWriter) -> None:
+        self.id = header["id"]
+        self.network = header["network"]
+        self.blocks = header["blocks"]
+        self.ops = header["ops"]
+        self.payload = payload
+        self.writer = writer
+        self.queued = time.perf_counter()
+
+
+class SimulationService:
+    """
+    Serves simulations of the networks (name -> network file, see cases.network_file) on a
+    Unix socket or localhost TCP, to other processes without their own grids.
+
+    A job is one frame (see encode_frame) with the header
+    {"id": ..., "network": name, "blocks": steps of the grid, "ops": [...]}
+    and the arrays that the operations reference by name in its payload. Operations:
+
+    - {"op": "reset", "demands": name, "e_price": name, "state": name}: Grid.reset with the
+      (consumers, blocks) demands and (producers, blocks) prices, and Grid.load_state from the
+      bytes (uint8) of a GridState; every key but "op" is optional
+    - {"op": "run", "temp" | "heat": name, "electricity": name, "producer_ids": [...],
+      "end_step": step}: Grid.run, continuing from the step the grid is at
+    - {"op": "get_object_status", "object_ids": [...], "start_step": step, "end_step": step,
+      "violations": bool}: the arrays of Grid.get_state_arrays, and of Grid.get_violations
+    - {"op": "export_state", "time_step": step}: the bytes of Grid.export_state as "state"
+
+    The operations of a job run in order, on one grid of the pool of one of the worker
+    processes, and every result is streamed back as a frame with the id and index of the
+    operation, as soon as it is done. The last frame of a job has "done": true and the
+    latency, or an "error". Jobs are queued and dispatched to idle workers, preferring a
+    worker that has a grid of the network already. A frame with the header
+    {"stats": true} is answered with stats().
+    """
+
+    def __init__(
+        self,
+        networks: Dict[str, str],
+        workers: int = 2,
+        config_name: str = "util.config",  # module with the presets, see util.config
+        warm: Optional[Dict[str, list]] = None,  # demands per network, built at start
+        latency_window: int = 1000,  # number of latest jobs in the latency statistics
+    ) -> None:
+        self.networks = networks
+        self.num_workers = workers
+        self.config_name = config_name
+        self.warm = {} if warm is None else warm
+        self.queue: Deque[_Job] = collections.deque()
+        self.latencies: Deque[float] = collections.deque(maxlen=latency_window)
+        self.completed, self.failed = 0, 0
+        self._conns, self._processes, self._tasks = [], [], []
+        self._warm_networks: List[set] = []
+        self._busy_time: List[float] = []
+        self._available: Optional[asyncio.Condition] = None
+        # one thread per worker waits for its results
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._server = None
+        self._started = None
+
+    async def start(self, address: Address) -> None:
+        self._available = asyncio.Condition()
+        self._started = time.perf_counter()
+        for worker in range(self.num_workers):
+            self._conns.append(None)
+            self._processes.append(None)
+            self._busy_time.append(0.0)
+            self._warm_networks.append(set())
+            self._spawn(worker)
+
+        for worker in range(self.num_workers):
+            await self._ready(worker)
+            self._tasks.append(asyncio.create_task(self._dispatch(worker)))
+
+        if isinstance(address, str):
+            self._server = await asyncio.start_unix_server(self._handle, path=address)
+        else:
+            self._server = await asyncio.start_server(self._handle, *address)
+
+    def _spawn(self, worker: int) -> None:
+        parent_conn, child_conn = mp.Pipe()
+        process = mp.Process(
+            target=_worker,
+            args=(child_conn, self.networks, self.config_name, self.warm),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._conns[worker] = parent_conn
+        self._processes[worker] = process
+
+    async def _ready(self, worker: int) -> None:
+        """
+        Waits for the worker to build its warm grids
+        """
+        loop = asyncio.get_running_loop()
+        _, _, networks = await loop.run_in_executor(self._executor, self._conns[worker].recv)
+        self._warm_networks[worker] = set(networks)
+
+    async def _restart(self, worker: int) -> None:
+        """
+        Replaces a worker process that died, so that its capacity is not lost
+        """
+        self._conns[worker].close()
+        self._processes[worker].join(timeout=1)
+        self._spawn(worker)
+        await self._ready(worker)
+
+    async def serve_forever(self, address: Address) -> None:
+        await self.start(address)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        for conn in self._conns:
+            conn.send(None)
+        for process in self._processes:
+            process.join()
+        self._executor.shutdown(wait=False)
+        self._conns, self._processes, self._tasks = [], [], []
+
+    def stats(self) -> dict:
+        """
+        Queue depth, latency (from queueing to the last result, in sec) of the latest jobs,
+        and the share of the time since the start that each worker was busy
+        """
+        uptime = time.perf_counter() - self._started
+        latencies = np.array(self.latencies)
+        return {
+            "queue_depth": len(self.queue),
+            "completed": self.completed,
+            "failed": self.failed,
+            "latency": {
+                "mean": float(np.mean(latencies)) if len(latencies) else None,
+                "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                "max": float(np.max(latencies)) if len(latencies) else None,
+            },
+            "utilization": [busy / uptime for busy in self._busy_time],
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Queues the jobs of one connection, results are written back by the dispatchers
+        """
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            header, payload = frame
+            if header.get("stats", False):
+                await self._write(writer, dict(self.stats(), id=header.get("id")))
+                continue
+            if header.get("network") not in self.networks or "blocks" not in header:
+                error = "Unknown network {} or no blocks given".format(header.get("network"))
+                await self._write(writer, {"id": header.get("id"), "error": error})
+                continue
+
+            async with self._available:
+                self.queue.append(_Job(header, payload, writer))
+                self._available.notify_all()
+
+        writer.close()
+
+    async def _next_job(self, worker: int) -> _Job:
+        """
+        The oldest queued job on a network that the worker has a grid of, or the oldest job
+        """
+        async with self._available:
+            await self._available.wait_for(lambda: len(self.queue) > 0)
+            for job in self.queue:
+                if job.network in self._warm_networks[worker]:
+                    break
+            else:
+                job = self.queue[0]
+            self.queue.remove(job)
+            return job
+
+    async def _dispatch(self, worker: int) -> None:
+        """
+        Runs the queued jobs on the worker. A job whose worker died is answered with an
+        error, and the worker is restarted.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._next_job(worker)
+            conn = self._conns[worker]
+            started = time.perf_counter()
+            try:
+                conn.send((job.id, job.network, job.blocks, job.ops, job.payload))
+                while True:
+                    kind, _, *data = await loop.run_in_executor(self._executor, conn.recv)
+                    if kind != "result":
+                        break
+                    header, payload = data
+                    await self._write(job.writer, header, payload)
+            except (EOFError, OSError) as e:
+                kind, data = "died", ["Worker {} died: {}".format(worker, repr(e))]
+
+            finished = time.perf_counter()
+            self._busy_time[worker] += finished - started
+            if kind == "done":
+                self._warm_networks[worker] = set(data[0])
+                self.latencies.append(finished - job.queued)
+                self.completed += 1
+                header = {
+                    "id": job.id,
+                    "done": True,
+                    "latency": finished - job.queued,
+                    "queued": started - job.queued,
+                    "worker": worker,
+                }
+            else:
+                self.failed += 1
+                header = {"id": job.id, "error": data[0]}
+            await self._write(job.writer, header)
+            if kind == "died":
+                await self._restart(worker)
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, header: dict, payload: bytes = b"") -> None:
+        """
+        Waits until the client took the frame, so that results of slow clients are not
+        buffered without limit. Results of clients that disconnected are dropped.
+        """
+        if writer.is_closing():
+            return
+        writer.write(encode_frame(header, payload))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+class SimulationClient:
+    """
+    Blocking client of a SimulationService, for optimizers in other processes
+    """
+
+    def __init__(self, address: Address) -> None:
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self._jobs = 0
+
+    def _read(self, length: int) -> bytes:
+        chunks, missing = [], length
+        while missing > 0:
+            chunk = self.socket.recv(min(missing, 1 << 20))
+            if not chunk:
+                raise Exception("The simulation service closed the connection")
+            chunks.append(chunk)
+            missing -= len(chunk)
+        return b"".join(chunks)
+
+    def read_frame(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        header_length, payload_length = _frame.unpack(self._read(_frame.size))
+        header = json.loads(self._read(header_length))
+        return header, decode_arrays(self._read(payload_length))
+
+    def submit(
+        self,
+        network: str,
+        blocks: int,
+        ops: List[dict],
+        arrays: Optional[Dict[str, np.ndarray]] = None,
+    ) -> int:
+        """
+        Queues a job (see SimulationService) and returns its id, see results()
+        """
+        self._jobs += 1
+        header = {"id": self._jobs, "network": network, "blocks": blocks, "ops": ops}
+        self.socket.sendall(encode_frame(header, encode_arrays(arrays)))
+        return self._jobs
+
+    def results(self, jobs: int = 1) -> Iterator[Tuple[dict, Dict[str, np.ndarray]]]:
+        """
+        The frames of the submitted jobs as they arrive (of different jobs interleaved),
+        until jobs of them ended with done or an error
+        """
+        while jobs > 0:
+            header, arrays = self.read_frame()
+            yield header, arrays
+            if header.get("done", False) or "error" in header:
+                jobs -= 1
+
+    def stats(self) -> dict:
+        self.socket.sendall(encode_frame({"stats": True}))
+        return self.read_frame()[0]
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--unix", help="path of the Unix socket")
+    parser.add_argument("--port", type=int, help="localhost TCP port, if no --unix is given")
+    parser.add_argument(
+        "--network", action="append", default=[], help="name=network file, repeatable"
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--config", default="util.config")
+    args = parser.parse_args()
+
+    service = SimulationService(
+        dict(network.split("=", 1) for network in args.network), args.workers, args.config
+    )
+    asyncio.run(service.serve_forever(args.unix or ("127.0.0.1", args.port)))
@@ -0,0 +1,174 @@
+# A grid-wide, columnar storage of the temperatures, mass flows and pressures of all objects
+
+from typing import Dict, Iterable, List, Optional, Tuple, Union, TYPE_CHECKING
+import numpy as np  # type: ignore
+
+from .grid_object import GridObject
+
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
+
+
+class StateStore:
+    """
+    All quantities are stored in one contiguous array data of shape
+    (quantities, rows, blocks). Every node and edge owns a contiguous range of rows
+    (one row per slot, two rows for an edge), and its temp, mass_flow and pressure
+    attributes are views into these rows, so objects write into the store directly.
+
+    Violations are stored in one array of shape (objects, kinds, blocks), with the kinds
+    of violations of all object types in the grid. Each object writes into its own
+    (kinds, blocks) slice, of which it only uses the rows of its own violation_kinds.
+    """
+
+    quantities = ("temp", "mass_flow", "pressure")
+
+    def __init__(self) -> None:
+        self.data: Optional[np.ndarray] = None
+        self.index: Dict[int, slice] = {}  # object id -> rows of the object
+        self.blocks: Optional[int] = None
+        self.violations: Optional[np.ndarray] = None
+        self.violation_kinds: Tuple[str, ...] = ()
+        self.object_ids: List[int] = []
+
+    def bind(
+        self,
+        objects: Iterable[GridObject],
+        blocks: int,
+        in_place: bool = False,
+    ) -> None:
+        """
+        Assigns rows to the objects and hands them the views they write into.
+        Has to be called before the objects are cleared.
+        """
+        objects = list(objects)
+        index = {}
+        rows = 0
+        for obj in objects:
+            index[obj.id] = slice(rows, rows + obj.state_rows)
+            rows += obj.state_rows
+
+        shape = (len(self.quantities), rows, blocks)
+        if in_place and self.data is not None and self.data.shape == shape and index == self.index:
+            self.data.fill(np.nan)
+        else:
+            self.data = np.full(shape, np.nan, dtype=float)
+
+        kinds: List[str] = []
+        for obj in objects:
+            kinds += [kind for kind in obj.violation_kinds if kind not in kinds]
+
+        violation_shape = (len(objects), len(kinds), blocks)
+        if (
+            in_place
+            and self.violations is not None
+            and self.violations.shape == violation_shape
+            and tuple(kinds) == self.violation_kinds
+        ):
+            self.violations.fill(np.nan)
+        else:
+            self.violations = np.full(violation_shape, np.nan, dtype=float)
+
+        self.index = index
+        self.blocks = blocks
+        self.violation_kinds = tuple(kinds)
+        self.object_ids = [obj.id for obj in objects]
+
+        for k, obj in enumerate(objects):
+            obj._columns = {
+                quantity: self.data[i, index[obj.id]]
+                for i, quantity in enumerate(self.quantities)
+            }
+            obj._columns["violations"] = self.violations[k]
+            obj._columns["violation_kinds"] = self.violation_kinds
+
+    def __getitem__(self, quantity: str) -> np.ndarray:
+        return self.data[self.quantities.index(quantity)]
+
+    def rows(self, object_ids: Optional[List[int]] = None) -> Union[slice, np.ndarray]:
+        """
+        Returns the rows of the given objects, as a slice if the objects are stored next
+        to each other (indexing then returns a view), otherwise as an index array.
+        """
+        if object_ids is None:
+            return slice(0, self.data.shape[1])
+
+        slices = [self.index[id] for id in object_ids]
+        if all(a.stop == b.start for a, b in zip(slices[:-1], slices[1:])):
+            return slice(slices[0].start, slices[-1].stop)
+
+        return np.concatenate([np.arange(s.start, s.stop) for s in slices])
+
+    def get(
+        self,
+        quantity: str,
+        object_ids: Optional[List[int]] = None,
+        start_step: int = 0,
+        end_step: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Returns the rows of the given objects in the given time window.
+        This is a view without copying, unless the objects are not stored next to each other.
+        """
+        return self[quantity][self.rows(object_ids), start_step:end_step]
+
+    def row_offsets(self, object_ids: Optional[List[int]] = None) -> Dict[int, slice]:
+        """
+        Rows of each object within the array returned by get() for the same object_ids
+        """
+        if object_ids is None:
+            return dict(self.index)
+
+        offsets = {}
+        row = 0
+        for id in object_ids:
+            rows = self.index[id].stop - self.index[id].start
+            offsets[id] = slice(row, row + rows)
+            row += rows
+
+        return offsets
+
+    def save(
+        self,
+        file,
+        object_ids: Optional[List[int]] = None,
+        start_step: int = 0,
+        end_step: Optional[int] = None,
+    ) -> None:
+        """
+        Writes the selected rows and time window of all quantities into a .npz file,
+        together with the object ids and their row ranges.
+        """
+        offsets = self.row_offsets(object_ids)
+        np.savez(
+            file,
+            ids=np.array(list(offsets.keys()), dtype=int),
+            row_ranges=np.array([[s.start, s.stop] for s in offsets.values()], dtype=int),
+            **{
+                quantity: self.get(quantity, object_ids, start_step, end_step)
+                for quantity in self.quantities
+            },
+        )
+
+    def share(self, name: Optional[str] = None) -> "shared_memory.SharedMemory":
+        """
+        Copies the store into a new block of shared memory, which another process can
+        open with StateStore.attach(shm.name, shape). The caller has to close and
+        unlink the block.
+        """
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=self.data.nbytes)
+        np.ndarray(self.data.shape, dtype=self.data.dtype, buffer=shm.buf)[:] = self.data
+        return shm
+
+    @staticmethod
+    def attach(name: str, shape: tuple):
+        """
+        Opens a store shared by StateStore.share(). Returns the shared memory block,
+        which has to be kept open while the array is used, and the array itself.
+        """
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(name=name)
+        return shm, np.ndarray(shape, dtype=float, buffer=shm.buf)
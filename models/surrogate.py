@@ -0,0 +1,183 @@
+# A linear surrogate of the supply side of a grid, built from the delay matrices of a run
+
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np  # type: ignore
+from scipy import sparse  # type: ignore
+
+from .branch import Branch
+from .consumer import Consumer
+from .edge import Edge
+from .grid_object import GridObject
+from .junction import Junction
+from .producer import Producer
+
+if TYPE_CHECKING:
+    from .grid import Grid
+
+
+class LinearSurrogate:
+    """
+    Linear map from the supply temperature trajectory (temp[1]) of a producer to the supply
+    temperatures and delivered heat of the consumers, around the completed steps of a run.
+
+    With the mass flows of the run, the outlet temperature of every pipe is linear in its
+    inlet temperatures: the delay matrix tells which steps the water leaving in a step has
+    entered, and the heat loss decays the difference to the ground temperature. Branches pass
+    the temperature on, supply junctions mix it with their valve positions. Composing these
+    along the paths from the producer gives one sparse (steps, steps) matrix per consumer.
+    The delivered heat is linearized per step around the operating point of the heat exchanger.
+
+    The surrogate stays valid as long as the mass flows do not change materially, see
+    is_stale(). Temperatures of other producers and of the water in the pipes before the run
+    are kept as in the run.
+    """
+
+    def __init__(
+        self,
+        grid: "Grid",
+        producer_id: Optional[int] = None,  # the first producer by default
+        heat_step: float = 0.5,  # temperature step of the heat derivatives, in °C
+    ) -> None:
+        self.steps = GridObject._current_step
+        if producer_id is None:
+            self.producer = next(iter(grid.producers))
+        else:
+            self.producer = grid.get_object(producer_id)
+        self.consumers: List[Consumer] = list(grid.consumers)
+        self.consumer_ids = [consumer.id for consumer in self.consumers]
+
+        steps = self.steps
+        self.temp0 = self.producer.temp[1, :steps].copy()
+        self.supply_temp0 = np.array([consumer.temp[0, :steps] for consumer in self.consumers])
+        self.heat0 = np.array([consumer.q[:steps] for consumer in self.consumers])
+        self.edge_flows = np.array([edge.mass_flow[0, :steps] for edge in grid.edges])
+
+        self._sensitivities: dict = {}
+        # one (steps, steps) block per consumer, stacked
+        self.temp_map = sparse.vstack(
+            [self._sensitivity(consumer.edges[0]) for consumer in self.consumers], format="csr"
+        )
+        self._sensitivities = {}
+        self.heat_slope = np.array(
+            [
+                self.operating_point_slopes(consumer, steps, heat_step)[0]
+                for consumer in self.consumers
+            ]
+        )
+
+    def _sensitivity(self, obj: GridObject) -> sparse.csr_matrix:
+        """
+        Derivative of the outlet temperature of a supply edge or node in every step, with
+        respect to the supply temperature of the producer in every step
+        """
+        if obj.id in self._sensitivities:
+            return self._sensitivities[obj.id]
+
+        steps = self.steps
+        if isinstance(obj, Edge):
+            inlet_node = obj.nodes[0][0]
+            result = self.edge_map(obj, steps) @ self._sensitivity(inlet_node)
+        elif isinstance(obj, Producer):
+            if obj is self.producer:
+                result = sparse.identity(steps, format="csr")
+            else:
+                result = sparse.csr_matrix((steps, steps))
+        elif isinstance(obj, Branch):
+            result = self._sensitivity(obj.edges[0])
+        elif isinstance(obj, Junction) and obj.is_supply:
+            position = obj.valve_position[:, :steps]
+            result = sparse.csr_matrix((steps, steps))
+            for slot_position, edge in zip(position, obj.edges[1:]):
+                result = result + sparse.diags(slot_position) @ self._sensitivity(edge)
+        else:
+            raise Exception(
+                "{} is not supported on the supply side of a surrogate".format(type(obj).__name__)
+            )
+
+        self._sensitivities[obj.id] = result.tocsr()
+        return self._sensitivities[obj.id]
+
+    @staticmethod
+    def edge_map(edge: Edge, steps: int) -> sparse.csr_matrix:
+        """
+        Derivative of the outlet temperature of the edge in the steps [0, steps), with respect
+        to its inlet temperature in these steps, from its delay matrix
+        """
+        hist_blocks = edge.hist_blocks
+        shares = edge.delay_matrix[:steps, hist_blocks: hist_blocks + steps]
+        rows, cols = np.nonzero(shares > 0)
+        decay = np.exp(
+            -(rows - cols) * edge.interval_length / edge._thermal_time_constant
+        )
+        return sparse.csr_matrix((shares[rows, cols] * decay, (rows, cols)), shape=(steps, steps))
+
+    @staticmethod
+    def operating_point_slopes(
+        consumer: Consumer, steps: int, heat_step: float = 0.5
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Central differences of the heat delivered to the consumer (in MW), of its primary
+        return temperature and of its primary mass flow by its supply temperature, per step,
+        at the secondary mass flow and demand of the run
+        """
+        hx = consumer.heat_exchanger
+        heat_slope, return_slope, flow_slope = np.zeros(steps), np.zeros(steps), np.zeros(steps)
+        for step in range(steps):
+            mass_flow_s = consumer._demand_in_W[step] / (
+                hx.heat_capacity * (consumer.setpoint_t_supply_s - consumer.t_return_s)
+            )
+            heat, t_return, mass_flow = [], [], []
+            for t_supply_p in (
+                consumer.temp[0, step] - heat_step,
+                consumer.temp[0, step] + heat_step,
+            ):
+                mass_flow_p, t_return_p, _, _ = hx.solve(
+                    t_supply_p=t_supply_p,
+                    setpoint_t_supply_s=consumer.setpoint_t_supply_s,
+                    t_return_s=consumer.t_return_s,
+                    mass_flow_s=mass_flow_s,
+                    demand=consumer.demand[step],
+                )
+                heat.append(mass_flow_p * (t_supply_p - t_return_p) * hx.heat_capacity)
+                t_return.append(t_return_p)
+                mass_flow.append(mass_flow_p)
+            heat_slope[step] = (
+                (heat[1] - heat[0]) / (2 * heat_step) / consumer.energy_unit_conversion
+            )
+            return_slope[step] = (t_return[1] - t_return[0]) / (2 * heat_step)
+            flow_slope[step] = (mass_flow[1] - mass_flow[0]) / (2 * heat_step)
+
+        return heat_slope, return_slope, flow_slope
+
+    def _temp_change(self, temp: np.ndarray) -> np.ndarray:
+        """
+        Change of the consumer supply temperatures, (consumers, steps) for one trajectory of
+        the producer, or (trajectories, consumers, steps) for one trajectory per row
+        """
+        temp = np.asarray(temp, dtype=float)
+        change = self.temp_map @ (np.atleast_2d(temp) - self.temp0).T
+        change = change.T.reshape(-1, len(self.consumers), self.steps)
+        return change[0] if temp.ndim == 1 else change
+
+    def supply_temp(self, temp: np.ndarray) -> np.ndarray:
+        """
+        Supply temperatures of the consumers for supply temperature trajectories temp of the
+        producer, one sparse product for all trajectories, see _temp_change()
+        """
+        return self.supply_temp0 + self._temp_change(temp)
+
+    def heat_delivered(self, temp: np.ndarray) -> np.ndarray:
+        """
+        Heat delivered to the consumers (in MW), linearized around the run
+        """
+        return self.heat0 + self.heat_slope * self._temp_change(temp)
+
+    def is_stale(self, grid: "Grid", relative_tolerance: float = 0.05) -> bool:
+        """
+        True if the mass flows of the edges in the steps of the surrogate changed by more than
+        relative_tolerance of the largest flow of the edge since it was built
+        """
+        flows = np.array([edge.mass_flow[0, : self.steps] for edge in grid.edges])
+        scale = np.max(np.abs(self.edge_flows), axis=1, keepdims=True)
+        change = np.abs(flows - self.edge_flows) / np.where(scale > 0, scale, 1)
+        return bool(np.any(~(change <= relative_tolerance)))
@@ -1,6 +1,6 @@
 # A class that can be used as a stopwatch to time execution duration
 
-from datetime import datetime
+from time import perf_counter
 
 
 class Timing:
@@ -19,12 +19,12 @@ class Timing:
         if self._running:
             return
 
-        self.started_at = datetime.now().timestamp()
+        self.started_at = perf_counter()
         self._running = True
 
     def stop(self) -> None:
         if self._running:
-            self._spent += datetime.now().timestamp() - self.started_at
+            self._spent += perf_counter() - self.started_at
             self._running = False
 
     def restart(self) -> None:
@@ -36,4 +36,4 @@ class Timing:
         if not self._running:
             return self._spent
 
-        return self._spent + datetime.now().timestamp() - self.started_at
+        return self._spent + perf_counter() - self.started_at
@@ -1,6 +1,6 @@
 # A node that models a heat transfer station (connecting a primary and a secondary grid)
 
-from typing import Optional
+from typing import List, Optional
 import numpy as np  # type: ignore
 
 from .heat_exchanger import HeatExchanger
@@ -34,21 +34,23 @@ class Transfer(Node):
 
         self.opt_temp = np.full(blocks, 75, dtype=float)
 
-    def clear(self) -> None:
+    def clear(self, in_place: bool = False) -> None:
         blocks = self.blocks
 
-        temp = np.stack(
-            [
-                np.full(blocks, np.nan, dtype=float),
-                np.full(blocks, np.nan, dtype=float),
-                self.opt_temp,
-                np.full(blocks, np.nan, dtype=float),
-            ]
-        )
+        temp = self._refill("temp", (len(self.slots), blocks), in_place=in_place)
+        temp[2] = self.opt_temp
+
+        self.q = self._refill("q", (blocks,), in_place=in_place)
+
+        self._clear(temp=temp, in_place=in_place)
 
-        self.q = np.full(blocks, np.nan, dtype=float)
+    def steady_inputs(self) -> List[np.ndarray]:
+        return [self.opt_temp]
 
-        self._clear(temp=temp)
+    def roll(self, shift: int) -> None:
+        super().roll(shift)
+        self.shift(self.opt_temp, shift)
+        self.temp[2, -shift:] = self.opt_temp[-shift:]
 
     def get_outlet_temp(self, slot: int) -> float:
         """
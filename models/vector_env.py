@@ -0,0 +1,287 @@
+# A gym-style environment that steps several grids in lockstep, e.g. for reinforcement learning
+
+import multiprocessing as mp
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np  # type: ignore
+
+from .grid import Grid
+from .grid_object import GridObject
+
+
+class GridBatch:
+    """
+    A batch of grids that are stepped in lockstep within one process.
+    All grid objects share one step counter, which is set before each grid is solved.
+    """
+
+    def __init__(
+        self,
+        make_grid: Callable[[], Grid],
+        num_grids: int,
+        control: str = "temp",  # either "temp" or "heat" of the producers
+    ) -> None:
+        assert control in ("temp", "heat")
+        self.grids = [make_grid() for _ in range(num_grids)]
+        self.control = control
+        self.step_count = 0
+
+    @property
+    def observation_size(self) -> int:
+        return self.grids[0].observation_size
+
+    @property
+    def blocks(self) -> int:
+        return self.grids[0].blocks
+
+    def reset(
+        self,
+        obs: np.ndarray,
+        demands: Optional[list] = None,
+        e_price: Optional[list] = None,
+    ) -> None:
+        """
+        demands and e_price are given per grid, in the format of Grid.reset
+        """
+        for i, grid in enumerate(self.grids):
+            grid.reset(
+                None if demands is None else demands[i],
+                None if e_price is None else e_price[i],
+                in_place=True,
+            )
+            obs[i] = np.nan
+
+        self.step_count = 0
+
+    def step(
+        self,
+        actions: np.ndarray,
+        electricity: Optional[np.ndarray],
+        obs: np.ndarray,
+        rewards: np.ndarray,
+        violations: np.ndarray,
+    ) -> None:
+        """
+        Solves one step of every grid and writes the results into the preallocated arrays.
+        actions and electricity: one row per grid, one column per producer
+        """
+        step = self.step_count
+        for i, grid in enumerate(self.grids):
+            GridObject._current_step = step
+            grid.set_one_step_controls(
+                **{self.control: actions[i]},
+                electricity=None if electricity is None else electricity[i],
+            )
+            grid._solve()
+
+            grid.write_observation(obs[i])
+            rewards[i] = grid.get_detailed_margin(level_time=2)
+            violations[i] = np.nansum(
+                list(grid.get_condition_violation_one_step().values())
+            )
+
+        self.step_count = step + 1
+        GridObject._current_step = self.step_count
+
+    def get_pipe_states(self) -> List[list]:
+        pipe_states = []
+        for grid in self.grids:
+            GridObject._current_step = self.step_count
+            pipe_states.append(grid.get_pipe_states(self.step_count))
+
+        return pipe_states
+
+
+def _worker(
+    conn,
+    make_grid: Callable[[], Grid],
+    num_grids: int,
+    control: str,
+) -> None:
+    """
+    Runs a GridBatch in a subprocess and answers the commands sent by VectorGridEnv.
+    """
+    batch = GridBatch(make_grid, num_grids, control)
+    obs = np.full((num_grids, batch.observation_size), np.nan, dtype=float)
+    rewards = np.zeros(num_grids, dtype=float)
+    violations = np.zeros(num_grids, dtype=float)
+
+    while True:
+        command, data = conn.recv()
+        if command == "step":
+            batch.step(*data, obs, rewards, violations)
+            conn.send((obs, rewards, violations))
+        elif command == "reset":
+            batch.reset(obs, **data)
+            conn.send(obs)
+        elif command == "pipe_states":
+            conn.send(batch.get_pipe_states())
+        elif command == "spec":
+            conn.send((batch.observation_size, batch.blocks))
+        elif command == "close":
+            conn.close()
+            return
+        else:
+            raise Exception("Unknown command {}".format(command))
+
+
+class VectorGridEnv:
+    """
+    Steps num_envs grid instances in lockstep, either in this process or distributed over
+    num_workers subprocesses. Observations, rewards and violations are returned as
+    preallocated arrays with one row per environment, see Grid.write_observation for the
+    layout of an observation. Pipe states are only built on request.
+
+    make_grid has to build a new, linked grid. When subprocesses are used, it has to be
+    picklable (e.g. a module level function).
+    """
+
+    def __init__(
+        self,
+        make_grid: Callable[[], Grid],
+        num_envs: int,
+        num_workers: int = 0,  # 0 steps all grids in this process
+        control: str = "temp",  # either "temp" or "heat" of the producers
+    ) -> None:
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.step_count = 0
+
+        if num_workers == 0:
+            self.batch = GridBatch(make_grid, num_envs, control)
+            observation_size, self.blocks = self.batch.observation_size, self.batch.blocks
+        else:
+            self.batch = None
+            # contiguous, nearly equally sized ranges of environments per worker
+            bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+            self._slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+            self._conns, self._processes = [], []
+            for env_slice in self._slices:
+                parent_conn, child_conn = mp.Pipe()
+                process = mp.Process(
+                    target=_worker,
+                    args=(
+                        child_conn,
+                        make_grid,
+                        env_slice.stop - env_slice.start,
+                        control,
+                    ),
+                    daemon=True,
+                )
+                process.start()
+                child_conn.close()
+                self._conns.append(parent_conn)
+                self._processes.append(process)
+
+            self._conns[0].send(("spec", None))
+            observation_size, self.blocks = self._conns[0].recv()
+
+        self.observations = np.full((num_envs, observation_size), np.nan, dtype=float)
+        self.rewards = np.zeros(num_envs, dtype=float)
+        self.violations = np.zeros(num_envs, dtype=float)
+        self.dones = np.zeros(num_envs, dtype=bool)
+
+    def reset(
+        self,
+        demands: Optional[list] = None,
+        e_price: Optional[list] = None,
+    ) -> np.ndarray:
+        """
+        demands and e_price are given per environment, in the format of Grid.reset
+        """
+        self.step_count = 0
+        self.dones[:] = False
+
+        if self.batch is not None:
+            self.batch.reset(self.observations, demands, e_price)
+            return self.observations
+
+        for conn, env_slice in zip(self._conns, self._slices):
+            conn.send(
+                (
+                    "reset",
+                    {
+                        "demands": None if demands is None else demands[env_slice],
+                        "e_price": None if e_price is None else e_price[env_slice],
+                    },
+                )
+            )
+
+        for conn, env_slice in zip(self._conns, self._slices):
+            self.observations[env_slice] = conn.recv()
+
+        return self.observations
+
+    def step(
+        self,
+        actions: np.ndarray,
+        electricity: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        actions: the supply temperature or heat of each producer, one row per environment
+        electricity: the electricity production of each producer, one row per environment.
+        CHP costs and profits (and hence the rewards) are nan if it is never set.
+        Returns observations, rewards (the margin of the step), dones and infos, with
+        infos["violation"] being the summed condition violation of the step per environment.
+        The returned arrays are reused by the next step.
+        """
+        assert self.step_count < self.blocks
+        actions = np.asarray(actions, dtype=float).reshape(self.num_envs, -1)
+        if electricity is not None:
+            electricity = np.asarray(electricity, dtype=float).reshape(self.num_envs, -1)
+
+        if self.batch is not None:
+            self.batch.step(
+                actions, electricity, self.observations, self.rewards, self.violations
+            )
+        else:
+            for conn, env_slice in zip(self._conns, self._slices):
+                conn.send(
+                    (
+                        "step",
+                        (
+                            actions[env_slice],
+                            None if electricity is None else electricity[env_slice],
+                        ),
+                    )
+                )
+
+            for conn, env_slice in zip(self._conns, self._slices):
+                (
+                    self.observations[env_slice],
+                    self.rewards[env_slice],
+                    self.violations[env_slice],
+                ) = conn.recv()
+
+        self.step_count += 1
+        self.dones[:] = self.step_count >= self.blocks
+
+        return self.observations, self.rewards, self.dones, {"violation": self.violations}
+
+    def get_pipe_states(self) -> List[list]:
+        """
+        Returns the current pipe states of each environment, in the format of Grid.get_pipe_states
+        """
+        if self.batch is not None:
+            return self.batch.get_pipe_states()
+
+        for conn in self._conns:
+            conn.send(("pipe_states", None))
+
+        pipe_states = []
+        for conn in self._conns:
+            pipe_states += conn.recv()
+
+        return pipe_states
+
+    def close(self) -> None:
+        if self.batch is not None:
+            return
+
+        for conn in self._conns:
+            conn.send(("close", None))
+            conn.close()
+
+        for process in self._processes:
+            process.join()
+
+        self._conns, self._processes = [], []
@@ -0,0 +1,24 @@
+# The models import util as a top level package (see setup.py), which is found next to them
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--timing", action="store_true", help="run the tests of time budgets, which vary by machine"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "timing: checks a time budget, run with --timing")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--timing"):
+        return
+    skip = pytest.mark.skip(reason="time budgets are checked with --timing")
+    for item in items:
+        if "timing" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,49 @@
+# The margin gradient of the adjoint against central differences of runs
+import numpy as np  # type: ignore
+import pytest
+
+from ..cases.parallel_consumers import build_grid
+from ..models import Adjoint
+from util import config
+
+blocks = 24
+heat_demand = 12.5 + 4 * np.sin(np.arange(blocks) / 4)
+demands = [heat_demand / 3.1, heat_demand / 3, heat_demand / 2.9]
+temp = 85 + 5 * np.sin(np.arange(blocks) / 3)
+
+
+def run(temp: np.ndarray, e_price: float):
+    grid = build_grid(demands, [np.full(blocks, e_price)], config)
+    grid.reset(demands, e_price=[np.full(blocks, e_price)])
+    grid.run(temp=[temp], electricity=[np.zeros(blocks)])
+    return grid
+
+
+def margin(temp: np.ndarray, e_price: float) -> float:
+    producer = next(iter(run(temp, e_price).producers))
+    producer.evaluate()
+    return float(np.sum(producer.profit[:blocks] - producer.cost[:blocks]))
+
+
+# a high electricity price makes the pump power matter
+@pytest.mark.parametrize("e_price", [20.0, 2000.0])
+def test_margin_gradient(e_price):
+    adjoint = Adjoint(run(temp, e_price))
+    gradient = adjoint.margin_gradient()
+    h = 1e-3
+    steps = np.eye(blocks) * h
+    differences = np.array(
+        [(margin(temp + step, e_price) - margin(temp - step, e_price)) / (2 * h) for step in steps]
+    )
+
+    # exact where the supply temperature does not reach the consumers within the run
+    reached = adjoint.backward(
+        {(consumer, "supply"): np.ones(blocks) for consumer in adjoint.consumers}
+    ) != 0
+    assert np.any(~reached) and np.any(reached)
+    assert np.allclose(gradient[~reached], differences[~reached], rtol=1e-4, atol=1e-6)
+
+    # elsewhere, the delays and estimates of the pipes follow the mass flows of the run
+    scale = np.max(np.abs(differences))
+    assert np.all(np.abs(gradient - differences) < 0.1 * scale)
+    assert np.isclose(np.sum(gradient), np.sum(differences), rtol=0.1)
@@ -0,0 +1,51 @@
+# Breakpoints of the heat exchangers, sampled at once for all blocks and temperatures
+import numpy as np  # type: ignore
+import pytest
+
+from ..cases.parallel_consumers import build_grid
+from ..models import breakpoints
+from util import config
+
+blocks = 4
+temps = np.linspace(70, 110, 81)
+
+
+def _grid(demand):
+    demands = [np.linspace(demand, 2 * demand, blocks)] * 3
+    grid = build_grid(demands, [np.full(blocks, 25.0)], config)
+    grid.reset(demands)
+    return grid
+
+
+def test_sampled_mass_flows_match_heat_exchanger_solve():
+    consumer = next(iter(_grid(1.0).consumers))
+    hx = consumer.heat_exchanger
+    sampled = breakpoints.heat_exchanger_mass_flow(consumer, temps, 0, blocks)
+
+    for block in range(blocks):
+        demand = consumer.demand[block]
+        mass_flow_s = (
+            demand
+            * consumer.energy_unit_conversion
+            / (hx.heat_capacity * (consumer.setpoint_t_supply_s - consumer.t_return_s))
+        )
+        for sample in range(0, len(temps), 10):
+            expected = hx.solve(
+                temps[sample],
+                consumer.setpoint_t_supply_s,
+                consumer.t_return_s,
+                mass_flow_s,
+                demand,
+            )[0]
+            assert np.isclose(sampled[block, sample], expected, rtol=1e-9)
+
+
+def test_failed_samples_are_left_out():
+    # at low demands, the Newton method leaves its domain at some temperatures
+    grid = _grid(0.01)
+    sampled = breakpoints.heat_exchanger_mass_flow(next(iter(grid.consumers)), temps, 0, blocks)
+    assert np.any(np.isnan(sampled)) and np.any(np.isfinite(sampled))
+
+    with pytest.warns(UserWarning, match="failed samples"):
+        x, y = breakpoints.flow_breakpoints(grid, temps, 0, blocks, tolerance=0.01)
+    assert np.all(np.isfinite(x)) and np.all(np.isfinite(y))
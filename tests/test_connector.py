@@ -0,0 +1,32 @@
+# Connectors join the side slots of every step from the arrivals of that step only
+import numpy as np  # type: ignore
+
+from ..cases.parallel_consumers import build_grid
+from ..models import Junction
+from util import config
+
+blocks = 8
+aborted_step = 2
+
+
+def test_arrivals_of_an_aborted_step_are_not_counted():
+    heat_demand = 12.5 + 4 * np.sin(np.arange(blocks) / 4)
+    demands = [heat_demand / 3.1, heat_demand / 3, heat_demand / 2.9]
+    temp = 85 + 5 * np.sin(np.arange(blocks) / 3)
+
+    grids = []
+    for abort in (False, True):
+        grid = build_grid(demands, [np.full(blocks, 25.0)], config)
+        grid.reset(demands)
+        grid.run(temp=[temp[:4]], electricity=[np.zeros(4)])
+        if abort:
+            # as left by a step in which only the first side slot arrived
+            junction = next(node for node in grid.nodes if isinstance(node, Junction))
+            junction._arrived, junction._arrival_step = 1, aborted_step
+            junction._mixed_heat, junction._pressure_extreme = 1e6, 1e9
+        grid.run(temp=[temp[4:]], electricity=[np.zeros(blocks - 4)])
+        grids.append(grid)
+
+    for a, b in zip(grids[0].edges + grids[0].nodes, grids[1].edges + grids[1].nodes):
+        assert np.allclose(a.temp, b.temp, equal_nan=True), a.id
+        assert np.allclose(a.mass_flow, b.mass_flow, equal_nan=True), a.id
@@ -0,0 +1,36 @@
+# Warm starts from GridState continue a run as if it had not been split
+import numpy as np  # type: ignore
+import pytest
+
+from ..cases.parallel_consumers import build_grid
+from ..models import GridState
+from util import config
+
+blocks = 12
+
+
+def _run(demands, temp, state=None, backend="python"):
+    grid = build_grid(demands, [np.full(len(temp), 25.0)], config)
+    grid.set_backend(backend)
+    grid.reset(demands)
+    if state is not None:
+        grid.load_state(state)
+    grid.run(temp=[temp], electricity=[np.zeros(len(temp))])
+    return grid
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_split_run_matches_continuous_run(backend):
+    # a demand of several MW, at which the estimate of the first mass flow matters
+    heat_demand = 12.5 + 4 * np.sin(np.arange(2 * blocks) / 4)
+    demands = [heat_demand / 3.1, heat_demand / 3, heat_demand / 2.9]
+    temp = 85 + 5 * np.sin(np.arange(2 * blocks) / 3)
+
+    full = _run(demands, temp, backend=backend)
+    first = _run([d[:blocks] for d in demands], temp[:blocks], backend=backend)
+    state = GridState.from_bytes(first.export_state().to_bytes())
+    second = _run([d[blocks:] for d in demands], temp[blocks:], state, backend)
+
+    for a, b in zip(full.edges + full.nodes, second.edges + second.nodes):
+        assert np.allclose(a.temp[:, blocks:], b.temp, equal_nan=True), a.id
+        assert np.allclose(a.mass_flow[:, blocks:], b.mass_flow, equal_nan=True), a.id
@@ -0,0 +1,60 @@
+# Grids with loops run, with the flows split by the hydraulic network in every step
+import json
+import numpy as np  # type: ignore
+import pytest
+
+from ..cases import network_file
+from ..cases.parallel_consumers import build_grid
+from util import config
+
+blocks = 6
+
+# the supply splits into two parallel pipes, which join again before the consumer
+loop = {
+    "nodes": [
+        {"name": "chp", "type": "CHP", "preset": "ProducerPreset1"},
+        {"name": "split", "type": "Branch", "slots": 2},
+        {"name": "merge", "type": "Junction", "slots": 2},
+        {"name": "consumer", "type": "Consumer", "preset": "ConsumerPreset1"},
+    ],
+    "edges": [
+        {"from": ["chp", 1], "to": ["split", 0], "preset": "PipePreset1"},
+        {"from": ["split", 1], "to": ["merge", 1], "preset": "PipePreset3",
+         "params": {"FrictionCoefficient": 1.0}},
+        {"from": ["split", 2], "to": ["merge", 2], "preset": "PipePreset3",
+         "params": {"FrictionCoefficient": 4.0}},
+        {"from": ["merge", 0], "to": ["consumer", 0], "preset": "PipePreset3"},
+        {"from": ["consumer", 1], "to": ["chp", 0], "preset": "PipePreset2"},
+    ],
+}
+
+
+def test_looped_grid_runs(tmp_path):
+    path = str(tmp_path / "loop.json")
+    with open(path, "w") as f:
+        json.dump(loop, f)
+    demands = [10 + 2 * np.sin(np.arange(blocks))]
+    grid = network_file.build_grid(path, demands, None, config)
+    grid.reset(demands)
+    assert grid.loops == 1
+
+    grid.run(temp=[np.full(blocks, 85.0)], electricity=[np.zeros(blocks)])
+
+    short, long, main = (grid.edges[i].mass_flow[0] for i in (1, 2, 3))
+    assert np.all(main > 0)
+    assert np.allclose(short + long, main)
+    # the same pressure loss f * m ** 2 on both parallel pipes
+    assert np.allclose(short, 2 * long, rtol=1e-3)
+    # each step is split like the hydraulic network of the demand flows of the step before
+    for step in range(1, blocks):
+        mass_flow, _, _ = grid.solve_hydraulics(step - 1)
+        assert np.isclose(short[step] / main[step], mass_flow[1] / mass_flow[3])
+
+
+def test_unsolved_step_raises():
+    demands = [np.full(blocks, 4.0)] * 3
+    grid = build_grid(demands, [np.full(blocks, 25.0)], config)
+    grid.reset(demands)
+    assert grid.loops == 0
+    with pytest.raises(Exception, match="not solved"):
+        grid.solve_hydraulics(0)
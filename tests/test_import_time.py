@@ -0,0 +1,14 @@
+# Importing the models stays fast and leaves the heavy optional dependencies unloaded
+import pytest
+
+from ..benchmarks import import_time
+
+
+def test_lazy_modules_are_not_imported():
+    assert import_time.measure_import(runs=1)["loaded"] == []
+
+
+@pytest.mark.timing
+def test_import_time_budget():
+    result = import_time.measure_import()
+    assert result["median_ms"] <= import_time.max_import_ms, result
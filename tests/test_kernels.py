@@ -0,0 +1,141 @@
+# Parity of the kernels with the reference implementation of Edge and HeatExchanger
+import importlib.util
+from typing import Tuple
+import numpy as np  # type: ignore
+import pytest
+
+from ..models import kernels
+from ..models.edge import Edge
+from ..models.grid_object import GridObject
+from ..models.heat_exchanger import HeatExchanger
+from ..models.kernels import Kernels
+from ..models.plug import Plug
+
+backends = ["numpy", "loops"]  # loops: the numba kernels, not compiled
+if importlib.util.find_spec("numba") is not None:
+    backends.append("numba")
+
+
+@pytest.fixture(params=backends)
+def backend(request) -> Kernels:
+    if request.param == "loops":
+        return kernels._loop_kernels("loops")
+    return kernels.get(request.param)
+
+
+@pytest.fixture
+def random_edges(monkeypatch):
+    rng = np.random.default_rng(0)
+    monkeypatch.setattr(GridObject, "_current_step", 30)
+
+    def random_edges(backend: Kernels, count: int) -> Tuple[Edge, Edge]:
+        """
+        The same pipe with count random plugs, on the reference and on the kernels
+        """
+        plugs = [
+            Plug(
+                mass=rng.uniform(1e3, 5e3),
+                entry_step=29 - i,
+                entry_temp=rng.uniform(60, 95),
+                entry_step_global=rng.uniform(-40, 30),
+            )
+            for i in range(count)
+        ]
+        edges = []
+        for edge_kernels in (None, backend):
+            edge = Edge(
+                blocks=48, diameter=0.4, length=1000, thermal_resistance=1.36, historical_t_in=70
+            )
+            edge.add_to_grid(lambda *args: None, 900)
+            edge.clear()
+            edge.plug_cache = [plug.copy() for plug in plugs]
+            edge.set_kernels(edge_kernels)
+            edges.append(edge)
+
+        return edges[0], edges[1]
+
+    return random_edges
+
+
+@pytest.mark.parametrize("count", [3, 40])
+def test_heat_loss(backend, random_edges, count):
+    reference, edge = random_edges(backend, count)
+    reference.calculate_heat_loss_and_heat_in_pipe()
+    edge.calculate_heat_loss_and_heat_in_pipe()
+    step = reference.current_step
+    assert np.isclose(reference.heat_loss[step], edge.heat_loss[step], rtol=1e-12)
+    assert np.isclose(reference.heat_in_pipe[step], edge.heat_in_pipe[step], rtol=1e-12)
+
+
+@pytest.mark.parametrize("count", [3, 40])
+def test_push_plugs(backend, random_edges, count):
+    reference, edge = random_edges(backend, count)
+    # part of the oldest plug, exactly the oldest plugs, more than few_plugs plugs
+    for share in (0.3, 2, 0.6):
+        masses = [plug.mass for plug in reversed(reference.plug_cache)]
+        consumed_mass = sum(masses[:share]) if share == 2 else share * sum(masses)
+        pushed = []
+        for e in (reference, edge):
+            e.heat_in_pipe[:] = 0
+            result = e.push_plugs_outside(consumed_mass)
+            pushed.append(result + (e.heat_in_pipe[e.current_step],))
+        for a, b in zip(*pushed):
+            assert np.allclose(a, b, rtol=1e-12, atol=1e-9), (share, a, b)
+        assert len(reference.plug_cache) == len(edge.plug_cache)
+        for a, b in zip(reference.plug_cache, edge.plug_cache):
+            assert np.isclose(a.mass, b.mass, rtol=1e-12)
+            assert a.entry_step == b.entry_step
+
+
+@pytest.mark.parametrize("count", [3, 40])
+def test_outlet_temp(backend, random_edges, count):
+    reference, edge = random_edges(backend, count)
+    mass = sum(plug.mass for plug in reference.plug_cache)
+    for expected_mass in (0, 0.2 * mass, 0.7 * mass):
+        for e in (reference, edge):
+            e.mass_flow[0, e.current_step - 1] = expected_mass / e.interval_length
+            e.temp[1, e.current_step] = np.nan
+        assert np.allclose(
+            reference.get_outlet_temp(), edge.get_outlet_temp(), rtol=1e-12
+        ), expected_mass
+
+
+@pytest.mark.parametrize("count", [3, 40])
+def test_outlet_bundle(backend, random_edges, count):
+    reference, edge = random_edges(backend, count)
+    step = reference.current_step
+    bundle = [
+        [reference.get_plug_temp(step - p.entry_step, p.entry_temp), p.mass, p.entry_step_global]
+        for p in reversed(reference.plug_cache)
+    ]
+    result = backend.outlet_bundle(
+        edge.plug_cache.plugs,
+        step,
+        edge.interval_length,
+        edge._thermal_time_constant,
+        edge.t_ground,
+    )
+    assert np.allclose(bundle, result, rtol=1e-12)
+
+
+def test_plug_array():
+    plugs = [
+        Plug(mass=i + 1.0, entry_step=-i, entry_temp=70.0, entry_step_global=-i) for i in range(5)
+    ]
+    array = kernels.PlugArray.from_plugs(plugs, capacity=6)
+    for i in range(20):
+        array.append(10.0, i + 1, 80.0, i + 1)
+        array.pop()
+    assert len(array) == 5 and array[0].entry_step == 20 and array[-1].entry_step == 16
+    assert [plug.mass for plug in array.copy()] == [10.0] * 5
+
+
+@pytest.mark.parametrize("demand", np.linspace(5e6, 14e6, 10))
+def test_thermal_regime(backend, demand):
+    results = []
+    for hx_kernels in (None, backend):
+        hx = HeatExchanger(4181.3, 805, 400, 0.8, 5e6 / 400 * 2 * 400 ** (-0.8))
+        hx.kernels = hx_kernels
+        mass_flow_s = demand / (4181.3 * (70 - 45))
+        results.append(hx.solve(85, 70, 45, mass_flow_s, demand))
+    assert np.allclose(results[0], results[1], rtol=1e-12)
@@ -0,0 +1,29 @@
+# A planning grid forked from another grid continues like the grid it was forked from
+import numpy as np  # type: ignore
+
+from ..cases.parallel_consumers import build_grid
+from util import config
+
+blocks = 24
+start_step = 10
+window = 8
+
+
+def test_forked_grid_matches_source():
+    heat_demand = 12.5 + 4 * np.sin(np.arange(blocks) / 4)
+    demands = [heat_demand / 3.1, heat_demand / 3, heat_demand / 2.9]
+    temp = 85 + 5 * np.sin(np.arange(blocks) / 3)
+    prices = [np.full(blocks, 25.0)]
+
+    source = build_grid(demands, prices, config)
+    source.reset(demands)
+    source.run(temp=[temp], electricity=[np.zeros(blocks)])
+    source_temps = [obj.temp.copy() for obj in source.edges + source.nodes]
+
+    planning = build_grid([d[:window] for d in demands], [p[:window] for p in prices], config)
+    planning.load_window(source, start_step)
+    steps = slice(start_step, start_step + window)
+    planning.run(temp=[temp[steps]], electricity=[np.zeros(window)])
+
+    for source_temp, obj in zip(source_temps, planning.edges + planning.nodes):
+        assert np.allclose(source_temp[:, steps], obj.temp, equal_nan=True), obj.id
@@ -0,0 +1,19 @@
+# The profiler records the hot paths of a grid for the whole with block
+import numpy as np  # type: ignore
+
+from ..cases.parallel_consumers import build_grid
+from util import config
+
+blocks = 6
+
+
+def test_lazy_evaluation_is_recorded():
+    demands = [np.full(blocks, 4.0)] * 3
+    grid = build_grid(demands, [np.full(blocks, 25.0)], config)
+    grid.reset(demands)
+    with grid.profile() as profiler:
+        grid.run(temp=[np.full(blocks, 85.0)], electricity=[np.zeros(blocks)])
+        grid.get_detailed_margin()
+
+    assert profiler.times[("CHP", "solve")][0] > 0
+    assert profiler.times[("CHP", "evaluate")][0] > 0
@@ -0,0 +1,50 @@
+# Jobs of the simulation service are answered, also when their worker dies
+import asyncio
+import os
+import threading
+import numpy as np  # type: ignore
+
+from ..models.service import SimulationClient, SimulationService
+
+network = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "cases",
+    "networks",
+    "parallel_consumers.json",
+)
+blocks = 6
+ops = [
+    {"op": "reset", "demands": "demands"},
+    {"op": "run", "temp": "temp", "electricity": "electricity"},
+]
+arrays = {
+    "demands": np.full((3, blocks), 4.0),
+    "temp": np.full((1, blocks), 85.0),
+    "electricity": np.zeros((1, blocks)),
+}
+
+
+def test_job_of_a_dead_worker_gets_an_error(tmp_path):
+    address = str(tmp_path / "grid.sock")
+    service = SimulationService({"parallel": network}, workers=1)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(service.start(address), loop).result(timeout=60)
+    client = SimulationClient(address)
+    client.socket.settimeout(60)  # fail instead of waiting for a job that is never answered
+    try:
+        service._processes[0].kill()
+        service._processes[0].join()
+        client.submit("parallel", blocks, ops, arrays)
+        assert "died" in list(client.results())[-1][0]["error"]
+
+        # the restarted worker takes the next job
+        client.submit("parallel", blocks, ops, arrays)
+        assert list(client.results())[-1][0].get("done", False)
+        assert client.stats()["failed"] == 1
+    finally:
+        client.close()
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result(timeout=60)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
@@ -181,7 +181,9 @@ Generator15 = {
     "InitialStatus":False,
 }
 
-ProducerPreset1 = {
+# all generators as one producer, see models.producers.CHPFleet
+FleetPreset1 = {
+    "Type": "CHPFleet",
     "Generators": [
         Generator1,
         Generator2,
@@ -205,7 +207,7 @@ ProducerPreset1 = {
 
 ProducerPreset1 = {
     "Type": "CHP",
-    "Parameters": CHPPreset1,
+    "Parameters": Generator1,
     "PumpEfficiency": 1,
     "ControlWithTemp": True,
 }
@@ -44,6 +44,27 @@ def check_point_in_polygon(point, polygon):
     return True
 
 
+# polygon has to be clockwise
+def polygon_half_planes(polygon):
+    """
+    Start points and directions of the edges polygon[i - 1] -> polygon[i]. A point lies in
+    the polygon, if it is on the right of (or on) every edge, see check_points_in_polygon.
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    start = np.roll(polygon, 1, axis=0)
+    return start, polygon - start
+
+
+# vectorized check_point_in_polygon for an array of points, one point per row
+def check_points_in_polygon(points, half_planes):
+    start, direction = half_planes
+    points = np.asarray(points, dtype=float)
+    side = (points[:, 0:1] - start[:, 0]) * direction[:, 1] - (
+        points[:, 1:2] - start[:, 1]
+    ) * direction[:, 0]
+    return ~np.any(side < 0, axis=1)
+
+
 def line_intersection(line1, line2):
     [x1, y1], [x2, y2] = line1
     [x3, y3], [x4, y4] = line2
@@ -86,6 +107,8 @@ def test_polygon():
     assert check_point_in_polygon(pt, np.array(points)) & (
         not check_point_in_polygon(pt2, np.array(points))
     )
+    inside = check_points_in_polygon([pt, pt2], polygon_half_planes(points))
+    assert inside[0] & (not inside[1])
 
 
 def test_intersection():